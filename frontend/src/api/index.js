@@ -103,6 +103,10 @@ const removeTokens = () => {
   localStorage.removeItem('tokens');
 };
 
+// Set by the API after we write; sending it back keeps our reads on the
+// primary database until replicas have caught up (the server checks expiry)
+let dbStickyToken = null;
+
 // Add auth header interceptor
 api.interceptors.request.use(
   (config) => {
@@ -110,11 +114,25 @@ api.interceptors.request.use(
     if (tokens?.access) {
       config.headers.Authorization = `Bearer ${tokens.access}`;
     }
+    if (dbStickyToken) {
+      config.headers['X-DB-Sticky'] = dbStickyToken;
+    }
     return config;
   },
   (error) => Promise.reject(error)
 );
 
+api.interceptors.response.use(
+  (response) => {
+    const sticky = response.headers['x-db-sticky'];
+    if (sticky) {
+      dbStickyToken = sticky;
+    }
+    return response;
+  },
+  (error) => Promise.reject(error)
+);
+
 // Authentication endpoints
 export const signup = async (userData) => {
   try {
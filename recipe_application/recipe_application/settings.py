@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 load_dotenv()
 
 
@@ -21,6 +23,9 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+# The test runner gets an isolated in-memory cache
+TESTING = sys.argv[1:2] == ["test"]
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
@@ -51,6 +56,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
+    "recipes.utils.metrics.RequestMetricsMiddleware",
+    "recipes.utils.db_routing.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -61,17 +68,92 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "recipe_application.urls"
 CORS_ALLOW_ALL_ORIGINS = True
+# The frontend echoes the replica stickiness token back (see db_routing)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-db-sticky')
+CORS_EXPOSE_HEADERS = ['X-DB-Sticky']
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
 INGREDIENT_SCAN_RATE_LIMIT = '100/day'
+INGREDIENT_EXTRACTOR_CLASS = 'recipes.utils.image_processing.IngredientExtractor'
+INGREDIENT_SCAN_WORKERS = 4
+INGREDIENT_SCAN_MAX_PENDING = 32
+INGREDIENT_SCAN_JOB_TTL = 3600
+INGREDIENT_SCAN_MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+INGREDIENT_SCAN_MAX_EDGE = 1024
+INGREDIENT_SCAN_JPEG_QUALITY = 85
+INGREDIENT_SCAN_CACHE_TTL = 86400
+INGREDIENT_SCAN_CACHE_PATH = BASE_DIR / 'scan_cache.sqlite3'
+INGREDIENT_SCAN_CACHE_L1_SIZE = 1024
+INGREDIENT_SCAN_CACHE_MAX_ENTRIES = 100000
+INGREDIENT_SCAN_BATCH_MAX_IMAGES = 10
+INGREDIENT_SCAN_BATCH_FAN_OUT = 4
+INGREDIENT_FUZZY_MIN_SIMILARITY = 0.4
+INGREDIENT_SCAN_HASH_DISTANCE = 6
+INGREDIENT_SCAN_HASH_INDEX_SIZE = 10000
+INGREDIENT_SCAN_HASH_SYNC_INTERVAL = 30
 AUTH_USER_MODEL = 'recipes.User'
+RECIPE_SEARCH_BACKEND = 'recipes.utils.search.SQLiteFTSSearchBackend'
+RECIPE_COUNT_CACHE_TIMEOUT = 60
+RESPONSE_CACHE_TTL = 600
+BULK_WRITE_MAX_ITEMS = 500
+RECIPE_MATCH_MIN_PERCENTAGE = 30
+RECIPE_MATCH_MAX_LIMIT = 100
+SUGGESTION_FEED_TTL = 3600
+RECOMMENDER_MODEL_DIR = BASE_DIR / 'recommender'
+RECOMMENDER_NEIGHBORS = 50
+RECOMMENDER_SHRINKAGE = 10
+RECOMMENDER_RETRAIN_MIN_CHANGES = 50
+# Ratings of a heavier user beyond this are sampled down to their strongest
+# opinions, which bounds the user's item pairs at this number squared
+RECOMMENDER_MAX_ITEMS_PER_USER = 500
+RECOMMENDER_DEFAULT_LIMIT = 20
+RECOMMENDER_MAX_LIMIT = 100
+# Request metrics: flag requests running more queries than this (None to
+# disable); a view's query_budget attribute overrides it
+REQUEST_QUERY_BUDGET = 20
+REQUEST_METRICS_SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+REQUEST_METRICS_QUERY_BUCKETS = [1, 2, 5, 10, 20, 50, 100]
+# On-demand profiling: staff send "X-Profile: 1", or a share of requests is sampled
+REQUEST_PROFILE_SAMPLE_RATE = 0.0
+REQUEST_PROFILE_INTERVAL = 0.005
+REQUEST_PROFILE_MAX_CONCURRENT = 2
+REQUEST_PROFILE_MAX_STATEMENTS = 500
+REQUEST_PROFILE_MAX_STORED = 200
+REQUEST_PROFILE_DIR = BASE_DIR / 'profiles'
+# Users resolved from JWTs: cached in the shared cache, or for a few seconds
+# per process when the cache is not shared
+AUTH_USER_CACHE_TTL = 300
+AUTH_USER_CACHE_LOCAL_TTL = 5
+AUTH_USER_CACHE_LOCAL_MAX_ENTRIES = 10000
+# Bearer token that lets scrapers read /metrics; without it only staff can
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
 
 
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'recipes.utils.log_pipeline.JSONFormatter',
+        },
+    },
+    'filters': {
+        # Per-request messages: at most 5 a second per message, bursts of
+        # 20, tracking the 1000 most recent messages; errors always pass
+        'hot_path': {
+            '()': 'recipes.utils.log_pipeline.RateLimitFilter',
+            'rate': 5,
+            'burst': 20,
+            'max_keys': 1000,
+            'max_level': 'ERROR',
+            'sample_rate': float(os.environ.get('RECIPES_LOG_SAMPLE_RATE', 1.0)),
+        },
+    },
     'handlers': {
+        # Records are written by a background thread, not the request thread
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'recipes.utils.log_pipeline.QueuedStreamHandler',
+            'formatter': 'json',
+            'queue_size': 10000,
         },
     },
     'root': {
@@ -84,6 +166,23 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'recipes': {
+            'handlers': ['console'],
+            'level': os.environ.get('RECIPES_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'recipes.views': {
+            'filters': ['hot_path'],
+        },
+        'recipes.utils.metrics': {
+            'filters': ['hot_path'],
+        },
+        'recipes.utils.image_processing': {
+            'filters': ['hot_path'],
+        },
+        'recipes.utils.suggestions': {
+            'filters': ['hot_path'],
+        },
     },
 }
 
@@ -95,9 +194,13 @@ FILE_UPLOAD_HANDLERS = [
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'recipes.utils.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'recipes.utils.jwt_auth.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
@@ -135,23 +238,83 @@ WSGI_APPLICATION = "recipe_application.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-32000",
+    "PRAGMA temp_store=MEMORY",
+]
+DATABASE_PATH = BASE_DIR / "db.sqlite3"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": DATABASE_PATH,
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": "; ".join(SQLITE_PRAGMAS),
+            # Take the write lock up front instead of failing to upgrade mid-transaction
+            "transaction_mode": "IMMEDIATE",
+        },
     }
 }
 
-# ENABLE WHEN USING REDIS
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django_redis.cache.RedisCache',
-#         'LOCATION': 'redis://127.0.0.1:6379/1',
-#         'OPTIONS': {
-#             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-#         }
-#     }
-# }
+# Read-only replicas: comma-separated SQLite files kept current with
+# sync_sqlite_replicas, or by default the primary file opened read-only
+REPLICA_PATHS = [
+    path.strip() for path in os.environ.get("RECIPE_DB_REPLICAS", "").split(",") if path.strip()
+] or [DATABASE_PATH]
+DATABASE_REPLICAS = []
+for index, replica_path in enumerate(REPLICA_PATHS):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": f"file:{replica_path}?mode=ro",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "uri": True,
+            # journal_mode is a property of the file, set by the primary
+            "init_command": "; ".join(SQLITE_PRAGMAS[1:]),
+        },
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["recipes.utils.db_routing.PrimaryReplicaRouter"]
+REPLICA_STICKY_SECONDS = 5
+
+# Redis when REDIS_URL is set, so catalog versions, cached responses,
+# suggestion feeds, scan jobs and authenticated users are shared by every
+# worker. Otherwise each worker keeps its own LocMem cache: a file cache
+# shared on disk cost more per hit (an open, read and unpickle of one file
+# per lookup, plus a directory listing on every write) than the SQLite
+# queries it was meant to save. Version tokens must still reach every
+# worker, so without Redis they are kept as files under VERSION_DIR and
+# read with one stat each (see recipes/utils/versioning.py).
+REDIS_URL = os.environ.get('REDIS_URL')
+VERSION_DIR = None
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+    VERSION_DIR = BASE_DIR / 'versions'
+if TESTING:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    VERSION_DIR = None
 
 
 # Password validation
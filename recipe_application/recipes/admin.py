@@ -4,6 +4,7 @@ from recipes.models import *
 
 admin.site.register(User)
 admin.site.register(Ingredient)
+admin.site.register(IngredientAlias)
 admin.site.register(Recipe)
 admin.site.register(RecipeIngredient)
 admin.site.register(UserPreference)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recipes"
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from recipes import signals
+
+        post_migrate.connect(signals.ensure_search_index, sender=self)
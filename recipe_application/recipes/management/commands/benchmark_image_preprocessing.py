@@ -0,0 +1,49 @@
+import statistics
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from recipes.utils.image_processing import ImagePreprocessingError, preprocess_image
+from recipes.utils.scan_jobs import get_ingredient_extractor
+
+
+class Command(BaseCommand):
+    help = "Report bytes sent and per-stage latency of the ingredient scan pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("images", nargs="+", help="Image files to run through the pipeline")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per image (default 5)")
+        parser.add_argument(
+            "--extract",
+            action="store_true",
+            help="Also time the full extraction, including the model call",
+        )
+
+    def handle(self, *args, **options):
+        stages = ["decode_ms", "resize_ms", "hash_ms", "encode_ms"]
+        self.stdout.write(
+            f"{'image':<30} {'bytes_in':>10} {'bytes_out':>10} "
+            + " ".join(f"{stage:>10}" for stage in stages)
+            + (f" {'extract_ms':>10}" if options["extract"] else "")
+        )
+
+        for path in options["images"]:
+            image_data = Path(path).read_bytes()
+            runs = []
+            for _ in range(options["repeat"]):
+                try:
+                    _, _, stats = preprocess_image(image_data)
+                except ImagePreprocessingError as e:
+                    raise CommandError(f"{path}: {e}")
+                runs.append(stats)
+
+            row = (
+                f"{Path(path).name[:30]:<30} {runs[0]['bytes_in']:>10} {runs[0]['bytes_out']:>10} "
+                + " ".join(
+                    f"{statistics.median(run[stage] for run in runs):>10.2f}" for stage in stages
+                )
+            )
+            if options["extract"]:
+                start = time.perf_counter()
+                get_ingredient_extractor().extract_ingredients(image_data)
+                row += f" {(time.perf_counter() - start) * 1000:>10.2f}"
+            self.stdout.write(row)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.utils.query_plans import check_query_plans
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN QUERY PLAN on every supported recipe filter/ordering combination and fail on table scans"
+
+    def handle(self, *args, **options):
+        checked, failures = check_query_plans()
+        for label, tables in failures:
+            self.stderr.write(f"{label}: full scan of {', '.join(tables)}")
+        if failures:
+            raise CommandError(f"{len(failures)} of {checked} queries scan a table")
+        self.stdout.write(self.style.SUCCESS(f"All {checked} queries use an index"))
@@ -0,0 +1,63 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from recipes.utils.catalog_import import RECORD_TYPES, CatalogImporter, read_records
+
+
+class Command(BaseCommand):
+    help = "Stream recipes, ingredients or substitutions from JSON Lines or CSV into the catalog in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or '-' for stdin")
+        parser.add_argument(
+            "--format",
+            choices=["jsonl", "csv"],
+            help="Input format (defaults to the file extension)",
+        )
+        parser.add_argument(
+            "--type",
+            choices=RECORD_TYPES,
+            default="recipe",
+            help="Record type of CSV rows and of JSON lines without a 'type' key",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--upsert",
+            action="store_true",
+            help="Update recipes with the same title, ingredients with the same name "
+                 "and substitutions for the same ingredient pair instead of adding new ones",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        importer = CatalogImporter(
+            batch_size=options["batch_size"],
+            upsert=options["upsert"],
+            progress=self.report_progress,
+        )
+        try:
+            stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(str(e))
+        with stream:
+            summary = importer.run(read_records(stream, input_format, options["type"]))
+
+        for line_number, message in importer.errors[:20]:
+            self.stderr.write(f"line {line_number}: {message}")
+        if summary["skipped"] > 20:
+            self.stderr.write(f"... and {summary['skipped'] - 20} more skipped records")
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {recipes_created} new and {recipes_updated} updated recipes, "
+            "{ingredients_created} new ingredients and "
+            "{substitutions_created} new substitutions in {elapsed_s}s "
+            "({recipes_per_s} recipes/s, {skipped} skipped)".format(**summary)
+        ))
+
+    def report_progress(self, summary):
+        self.stdout.write(
+            "{recipes_created} created, {recipes_updated} updated, "
+            "{skipped} skipped - {recipes_per_s} recipes/s".format(**summary)
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.utils.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating sum, count and average on every recipe"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "recipe_ids",
+            nargs="*",
+            type=int,
+            help="Only rebuild these recipes (defaults to all recipes)",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = rebuild_rating_aggregates(options["recipe_ids"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} recipes"))
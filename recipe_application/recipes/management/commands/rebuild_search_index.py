@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.utils.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the recipe full-text search index from the recipe tables"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            backend.ensure_index()
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index with {type(backend).__name__}"))
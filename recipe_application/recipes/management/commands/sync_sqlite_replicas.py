@@ -0,0 +1,49 @@
+import sqlite3
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into each replica file configured by RECIPE_DB_REPLICAS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep syncing every INTERVAL seconds instead of once",
+        )
+
+    def handle(self, *args, **options):
+        primary = Path(settings.DATABASE_PATH).resolve()
+        replicas = [
+            Path(path).resolve() for path in settings.REPLICA_PATHS if Path(path).resolve() != primary
+        ]
+        if not replicas:
+            self.stdout.write("No replica files configured; replicas read the primary file directly")
+            return
+
+        while True:
+            for replica in replicas:
+                start = time.perf_counter()
+                self.sync(primary, replica)
+                self.stdout.write(
+                    f"Synced {replica} in {(time.perf_counter() - start) * 1000:.0f}ms"
+                )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
+
+    def sync(self, primary: Path, replica: Path) -> None:
+        # The online backup API copies a consistent snapshot of the primary
+        # in one step, so WAL readers of the replica switch from the old
+        # snapshot to the new one at commit
+        source = sqlite3.connect(primary)
+        target = sqlite3.connect(replica)
+        try:
+            target.execute("PRAGMA journal_mode=WAL")
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.utils.recommendations import (
+    ratings_changed_since,
+    read_model_meta,
+    train_item_neighbors,
+)
+
+
+class Command(BaseCommand):
+    help = "Fit item-item recipe neighbors from ratings and publish them for the recommendations endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--if-stale",
+            action="store_true",
+            help=(
+                "Skip training unless at least RECOMMENDER_RETRAIN_MIN_CHANGES ratings "
+                "changed since the published model. Meant for a periodic job"
+            ),
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Re-count only the users who rated since the published model; "
+                "falls back to a full retrain when that is not possible"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options["if_stale"]:
+            changes = ratings_changed_since(read_model_meta())
+            if changes < settings.RECOMMENDER_RETRAIN_MIN_CHANGES:
+                self.stdout.write(f"Model is current ({changes} rating changes), skipping")
+                return
+
+        meta = train_item_neighbors(incremental=options["incremental"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained ({meta['mode']}) neighbors for {meta['recipes']} recipes from {meta['ratings']} ratings "
+            f"({meta['neighbor_pairs']} pairs, {meta['train_ms']}ms)"
+        ))
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipes.utils.suggestions import store_suggestion_feed
+from recipes.utils.versioning import CATALOG_VERSION_KEY, cache_is_shared, get_version
+
+
+class Command(BaseCommand):
+    help = "Precompute and cache the suggestion feed of every user"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "user_ids",
+            nargs="*",
+            type=int,
+            help="Only warm these users' feeds (defaults to all active users)",
+        )
+
+    def handle(self, *args, **options):
+        # Feeds written to a per-process cache would vanish with this command
+        if not cache_is_shared():
+            raise CommandError(
+                "The default cache is per-process, so warmed feeds would not reach "
+                "the web workers; configure a shared cache (see CACHES in settings)"
+            )
+
+        users = get_user_model().objects.filter(is_active=True)
+        if options["user_ids"]:
+            users = users.filter(pk__in=options["user_ids"])
+
+        catalog_version = get_version(CATALOG_VERSION_KEY)
+        warmed = 0
+        for user in users.iterator():
+            store_suggestion_feed(user, catalog_version)
+            warmed += 1
+        self.stdout.write(self.style.SUCCESS(f"Warmed suggestion feeds for {warmed} users"))
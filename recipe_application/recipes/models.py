@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User,AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from recipes.utils.ingredient_names import canonical_ingredient_name
 
 
 class User(AbstractUser):
@@ -30,13 +31,29 @@ class User(AbstractUser):
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    canonical_name = models.CharField(max_length=100, db_index=True, editable=False)
     image_url = models.URLField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        self.canonical_name = canonical_ingredient_name(self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
+class IngredientAlias(models.Model):
+    alias = models.CharField(max_length=100, unique=True)
+    ingredient = models.ForeignKey(Ingredient, related_name='aliases', on_delete=models.CASCADE)
+
+    def save(self, *args, **kwargs):
+        self.alias = canonical_ingredient_name(self.alias)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.alias} -> {self.ingredient.name}"
+
 class Recipe(models.Model):
     DIFFICULTY_CHOICES = [
         ('easy', 'Easy'),
@@ -86,12 +103,78 @@ class Recipe(models.Model):
     dietary_restrictions = models.JSONField(default=list, blank=True)
     nutrients = models.JSONField(default=dict)
     is_featured = models.BooleanField(default=False)
+    # Maintained from RecipeRating writes, see recipes.utils.ratings
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.FloatField(null=True, blank=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Chosen from RecipeViewSet's filterset_fields/ordering_fields and the
+        # suggestion feed; check_query_plans verifies none of them scans
+        indexes = [
+            models.Index(fields=['cuisine', 'cooking_time'], name='recipe_cuisine_cooking_idx'),
+            models.Index(fields=['difficulty', 'cooking_time'], name='recipe_difficulty_cooking_idx'),
+            # SQLite compares booleans as bare columns, which a (flag, ...)
+            # index cannot serve, so each flag value gets a partial index
+            # holding just its rows instead
+            models.Index(
+                fields=['cooking_time', 'id'],
+                condition=models.Q(is_vegetarian=True),
+                name='recipe_veg_cooking_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                condition=models.Q(is_gluten_free=True),
+                name='recipe_gf_cooking_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                condition=models.Q(is_vegetarian=False),
+                name='recipe_nonveg_cooking_idx',
+            ),
+            models.Index(
+                fields=['cooking_time', 'id'],
+                condition=models.Q(is_gluten_free=False),
+                name='recipe_non_gf_cooking_idx',
+            ),
+            models.Index(fields=['cooking_time', 'id'], name='recipe_cooking_time_idx'),
+            models.Index(fields=['total_time', 'id'], name='recipe_total_time_idx'),
+            models.Index(fields=['calories_per_serving', 'id'], name='recipe_calories_idx'),
+            # Ranked suggestion feeds for users with dietary preferences
+            models.Index(
+                fields=['-average_rating', '-rating_count'],
+                condition=models.Q(is_vegetarian=True),
+                name='recipe_veg_rating_idx',
+            ),
+            models.Index(
+                fields=['-average_rating', '-rating_count'],
+                condition=models.Q(is_gluten_free=True),
+                name='recipe_gf_rating_idx',
+            ),
+        ]
+
+    # Written only by recipes.utils.ratings, with F() updates
+    RATING_AGGREGATE_FIELDS = ('rating_sum', 'rating_count', 'average_rating')
+
     def save(self, *args, **kwargs):
         if not self.total_time:
             self.total_time = self.preparation_time + self.cooking_time
+        # Updates leave the rating aggregates alone: the in-memory copies may
+        # predate a concurrent rating, and writing them back would undo its delta
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            kwargs['update_fields'] = [
+                name for name in update_fields if name not in self.RATING_AGGREGATE_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -132,6 +215,21 @@ class RecipeRating(models.Model):
 
     class Meta:
         unique_together = ['user','recipe']
+        indexes = [
+            # Liked-cuisine lookup in the suggestion feed
+            models.Index(fields=['user', 'rating'], name='rating_user_rating_idx'),
+            # Ratings changed since the recommender was last trained
+            models.Index(fields=['updated_at'], name='rating_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the recipe's rating aggregates in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.rating} stars for {self.recipe.title} by {self.user.username}"
@@ -1,7 +1,11 @@
 from rest_framework import serializers
+from django.db import transaction
+from django.db.models import Prefetch
 from recipes.models import *
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from recipes.utils.pagination import decode_cursor
+from recipes.utils.recipe_writes import sync_recipe_ingredients
 
 
 User = get_user_model()
@@ -59,7 +63,14 @@ class IngredientSerializer(serializers.ModelSerializer):
         model = Ingredient
         fields = '__all__'
 
+class IngredientBulkSerializer(IngredientSerializer):
+    class Meta(IngredientSerializer.Meta):
+        # Existing names are upserted, not rejected
+        extra_kwargs = {'name': {'validators': []}}
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
+    # Plain id so a whole ingredient list is checked in one query by RecipeSerializer
+    ingredient = serializers.IntegerField(source='ingredient_id')
     ingredient_name = serializers.CharField(source='ingredient.name', read_only=True)
 
     class Meta:
@@ -78,7 +89,79 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = ['rating_sum']
+
+    # Related data each declared field reads, loaded up front by setup_eager_loading
+    prefetch_plan = {
+        'ingredients': [
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+        ],
+        'substitutes': [
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+            Prefetch(
+                'recipeingredient_set__ingredient__substitutions',
+                queryset=Substitution.objects.select_related('substitute'),
+            ),
+        ],
+    }
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Prefetch everything the serializer's fields touch in a fixed number of queries."""
+        lookups = {}
+        for field_name in cls().fields:
+            for prefetch in cls.prefetch_plan.get(field_name, []):
+                lookups.setdefault(prefetch.prefetch_to, prefetch)
+        return queryset.prefetch_related(*lookups.values())
+
+    def validate_ingredients(self, rows):
+        # The list replaces the recipe's ingredients, so every row must be
+        # complete; in a PATCH DRF would otherwise skip missing nested fields
+        row_fields = [
+            field for field in self.fields['ingredients'].child.fields.values()
+            if not field.read_only
+        ]
+        missing = [
+            {field.field_name: [field.error_messages['required']]
+             for field in row_fields if field.source not in row}
+            for row in rows
+        ]
+        if any(missing):
+            raise serializers.ValidationError(missing)
+
+        ingredient_ids = [row['ingredient_id'] for row in rows]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError("Each ingredient may only be listed once.")
+        known = set(Ingredient.objects.filter(pk__in=ingredient_ids).values_list('pk', flat=True))
+        unknown = sorted(set(ingredient_ids) - known)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown ingredient ids: {unknown}")
+        return rows
+
+    def _reload(self, recipe):
+        return self.setup_eager_loading(Recipe.objects.filter(pk=recipe.pk)).get()
+
+    def create(self, validated_data):
+        rows = validated_data.pop('recipeingredient_set', [])
+        with transaction.atomic():
+            recipe = super().create(validated_data)
+            sync_recipe_ingredients(recipe, rows)
+        return self._reload(recipe)
+
+    def update(self, instance, validated_data):
+        rows = validated_data.pop('recipeingredient_set', None)
+        with transaction.atomic():
+            recipe = super().update(instance, validated_data)
+            # Leave the ingredient list alone when a partial update omits it
+            if rows is not None:
+                sync_recipe_ingredients(recipe, rows)
+        return self._reload(recipe)
 
     def get_substitutes(self, obj):
         substitutes = {}
@@ -130,4 +213,52 @@ class RecipeRatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeRating
         fields = '__all__'
-        read_only_fields = ['user']
\ No newline at end of file
+        read_only_fields = ['user']
+
+class CookingTimeRangeSerializer(serializers.Serializer):
+    min = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    max = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+
+
+class MatchFiltersSerializer(serializers.Serializer):
+    difficulty = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    cooking_time = CookingTimeRangeSerializer(required=False, allow_null=True)
+
+
+class DietaryPreferencesSerializer(serializers.Serializer):
+    vegetarian = serializers.BooleanField(required=False, default=False)
+    gluten_free = serializers.BooleanField(required=False, default=False)
+
+
+class MatchIngredientsSerializer(serializers.Serializer):
+    """Request body of match_ingredients; ``result_fields`` comes from the view."""
+    ingredients = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+    dietary_preferences = DietaryPreferencesSerializer(required=False, default=dict)
+    filters = MatchFiltersSerializer(required=False, default=dict)
+    fields = serializers.ListField(
+        child=serializers.CharField(), required=False, allow_null=True, allow_empty=True
+    )
+    # Without a limit every match is returned, as before paging existed
+    limit = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+    min_match_percentage = serializers.FloatField(required=False, min_value=0, max_value=100)
+    cursor = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    def validate_fields(self, value):
+        result_fields = self.context["result_fields"]
+        if not value:
+            return list(result_fields)
+        unknown = set(value) - set(result_fields)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return value
+
+    def validate_cursor(self, value):
+        if not value:
+            return 0
+        try:
+            offset = decode_cursor(value).get("o", 0)
+        except ValueError:
+            raise serializers.ValidationError("Invalid cursor")
+        if type(offset) is not int or offset < 0:
+            raise serializers.ValidationError("Invalid cursor")
+        return offset
@@ -0,0 +1,115 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from recipes.models import (
+    Ingredient,
+    IngredientAlias,
+    Recipe,
+    RecipeIngredient,
+    RecipeRating,
+    Substitution,
+    User,
+    UserPreference,
+)
+from recipes.utils.ingredient_fuzzy import invalidate_fuzzy_index
+from recipes.utils.ingredient_index import bump_index_version
+from recipes.utils.jwt_auth import invalidate_cached_user
+from recipes.utils.ratings import apply_rating_delta
+from recipes.utils.search import get_search_backend
+from recipes.utils.suggestions import invalidate_suggestion_feed
+from recipes.utils.versioning import CATALOG_VERSION_KEY, bump_version
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=IngredientAlias)
+def invalidate_ingredient_index(sender, **kwargs):
+    bump_index_version()
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Substitution)
+@receiver([post_save, post_delete], sender=RecipeRating)
+def invalidate_catalog(sender, **kwargs):
+    bump_version(CATALOG_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=RecipeRating)
+@receiver([post_save, post_delete], sender=UserPreference)
+def invalidate_user_suggestions(sender, instance, **kwargs):
+    invalidate_suggestion_feed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_fuzzy_index(sender, **kwargs):
+    invalidate_fuzzy_index()
+
+
+@receiver(pre_save, sender=RecipeRating)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if instance.pk and not raw:
+        instance._previous_rating = (
+            RecipeRating.objects.filter(pk=instance.pk)
+            .values_list("recipe_id", "rating")
+            .first()
+        )
+
+
+@receiver(post_save, sender=RecipeRating)
+def update_rating_aggregates_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_rating", None)
+    if previous is None:
+        apply_rating_delta(instance.recipe_id, instance.rating, 1)
+        return
+
+    previous_recipe_id, previous_rating = previous
+    if previous_recipe_id == instance.recipe_id:
+        if previous_rating != instance.rating:
+            apply_rating_delta(instance.recipe_id, instance.rating - previous_rating, 0)
+    else:
+        apply_rating_delta(previous_recipe_id, -previous_rating, -1)
+        apply_rating_delta(instance.recipe_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=RecipeRating)
+def update_rating_aggregates_on_delete(sender, instance, **kwargs):
+    apply_rating_delta(instance.recipe_id, -instance.rating, -1)
+
+
+def ensure_search_index(sender, **kwargs):
+    get_search_backend().ensure_index()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    get_search_backend().index_recipes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_index(sender, instance, **kwargs):
+    get_search_backend().remove_recipes([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def reindex_recipe_ingredients(sender, instance, **kwargs):
+    get_search_backend().index_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    recipe_ids = RecipeIngredient.objects.filter(ingredient=instance).values_list(
+        "recipe_id", flat=True
+    )
+    get_search_backend().index_recipes(recipe_ids)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
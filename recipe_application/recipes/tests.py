@@ -1,3 +1,1464 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from recipes.models import (
+    Ingredient,
+    IngredientAlias,
+    Recipe,
+    RecipeIngredient,
+    RecipeRating,
+    Substitution,
+    User,
+)
+from recipes.serializers import RecipeRatingSerializer
+from recipes.signals import ensure_search_index
+from recipes.utils import profiling
+from recipes.utils.bulk_writes import validate_items
+from recipes.utils.catalog_import import CatalogImporter, read_records
+from recipes.utils.db_routing import (
+    STICKY_COOKIE_NAME, STICKY_HEADER, PrimaryReplicaRouter, ReplicaRoutingMiddleware,
+)
+from recipes.utils.image_hashing import BKTree, PerceptualScanCache, hamming_distance
+from recipes.utils.image_processing import (
+    ImagePreprocessingError,
+    IngredientExtractor,
+    preprocess_image,
+)
+from recipes.utils.ingredient_fuzzy import ingredient_fuzzy_index
+from recipes.utils.ingredient_index import ingredient_index
+from recipes.utils.ingredient_names import (
+    canonical_ingredient_name,
+    match_ingredient_names,
+    resolve_ingredient_keys,
+)
+from recipes.utils import jwt_auth
+from recipes.utils.jwt_auth import CACHE_KEY_PREFIX
+from recipes.utils.log_pipeline import (
+    JSONFormatter,
+    QueuedStreamHandler,
+    RateLimitFilter,
+    dropped_records,
+)
+from recipes.utils.metrics import get_request_metrics
+from recipes.utils.pagination import RecipeCursorPagination, encode_cursor
+from recipes.utils.query_plans import TEMP_SORT, full_scans
+from recipes.utils.ratings import rebuild_rating_aggregates
+from recipes.utils.recommendations import rating_statistics, read_current, read_model_meta
+from recipes.utils.scan_jobs import ScanJobQueue
+from recipes.utils.scan_store import SQLiteResultStore, TwoTierResultStore
+from recipes.utils.search import get_search_backend
+from recipes.utils.versioning import (
+    CATALOG_VERSION_KEY, FileVersionStore, bump_version, get_version,
+)
+from recipes.views import RecipeViewSet
+
+
+class RecipeQueryBudgetTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+        ingredients = list(Ingredient.objects.all()[:6])
+        for ingredient, substitute in zip(ingredients, reversed(ingredients)):
+            Substitution.objects.create(ingredient=ingredient, substitute=substitute, ratio=1.0)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        # The paginator EXPLAINs each filtered query shape once per process
+        self.client.get("/api/recipes/", {"cooking_time__lte": 1})
+        # recipes, recipe ingredients, substitutions
+        for cooking_time in (5, 20, 60):
+            with self.subTest(cooking_time=cooking_time):
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        "/api/recipes/", {"cooking_time__lte": cooking_time}
+                    )
+                self.assertEqual(response.status_code, 200)
+
+    def test_full_page_includes_substitutes(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/recipes/")
+        results = response.json()["results"]
+        self.assertEqual(len(results), 10)
+        self.assertTrue(any(recipe["substitutes"] for recipe in results))
+
+    def test_detail_query_count(self):
+        recipe = Recipe.objects.first()
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryPlanTests(TestCase):
+    def test_supported_filters_use_indexes(self):
+        call_command("check_query_plans", stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_filtered_keyset_pages_walk_the_index(self):
+        # Each filter has an index ordered by the sort column, so a later page
+        # starts where the last one ended instead of sorting every match
+        paginator = RecipeCursorPagination()
+        for lookup, ordering in (
+            ({"cuisine": "Italian"}, "cooking_time"),
+            ({"difficulty": "easy"}, "-cooking_time"),
+            ({"is_vegetarian": True}, "cooking_time"),
+            ({"calories_per_serving__lte": 500}, "-calories_per_serving"),
+        ):
+            with self.subTest(lookup=lookup, ordering=ordering):
+                [queryset] = paginator.keyset_querysets(
+                    Recipe.objects.filter(**lookup),
+                    ordering.lstrip("-"),
+                    ordering.startswith("-"),
+                    (30, 1),
+                )
+                self.assertEqual(full_scans(queryset[:11]), [])
+                self.assertNotIn(TEMP_SORT, queryset[:11].explain())
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def read_alias(self, request, write=False, view_func=None):
+        """Where a read made while handling ``request`` would go."""
+        seen = []
+
+        def get_response(request):
+            if view_func is not None:
+                middleware.process_view(request, view_func, (), {})
+            seen.append(self.router.db_for_read(Recipe))
+            if write:
+                self.router.db_for_write(Recipe)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return seen[0], response
+
+    def test_safe_requests_read_from_replicas(self):
+        alias, response = self.read_alias(self.factory.get("/api/recipes/"))
+        self.assertEqual(alias, "replica_0")
+        self.assertNotIn(STICKY_COOKIE_NAME, response.cookies)
+
+    def test_writes_pin_the_writing_client_only(self):
+        _, response = self.read_alias(
+            self.factory.post("/api/recipes/", REMOTE_ADDR="10.0.0.1"), write=True
+        )
+        cookie = response.cookies[STICKY_COOKIE_NAME]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_STICKY_SECONDS)
+        self.assertEqual(response[STICKY_HEADER], cookie.value)
+
+        writer = self.factory.get("/api/recipes/", REMOTE_ADDR="10.0.0.1")
+        writer.COOKIES[STICKY_COOKIE_NAME] = cookie.value
+        self.assertEqual(self.read_alias(writer)[0], "default")
+        # Clients without cookies echo the header instead
+        writer = self.factory.get("/api/recipes/", HTTP_X_DB_STICKY=response[STICKY_HEADER])
+        self.assertEqual(self.read_alias(writer)[0], "default")
+        # Another client behind the same address keeps reading replicas
+        neighbour = self.factory.get("/api/recipes/", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(self.read_alias(neighbour)[0], "replica_0")
+
+    def test_unsafe_requests_that_do_not_write_do_not_pin(self):
+        alias, response = self.read_alias(self.factory.post("/api/recipes/"))
+        self.assertEqual(alias, "default")
+        self.assertNotIn(STICKY_COOKIE_NAME, response.cookies)
+        self.assertFalse(response.has_header(STICKY_HEADER))
+
+    def test_read_only_actions_read_from_replicas(self):
+        match = RecipeViewSet.as_view({"post": "match_ingredients"})
+        create = RecipeViewSet.as_view({"post": "create"})
+        request = self.factory.post("/api/recipes/match_ingredients/")
+        self.assertEqual(self.read_alias(request, view_func=match)[0], "replica_0")
+        request = self.factory.post("/api/recipes/")
+        self.assertEqual(self.read_alias(request, view_func=create)[0], "default")
+
+        _, response = self.read_alias(self.factory.post("/api/recipes/"), write=True)
+        request = self.factory.post(
+            "/api/recipes/match_ingredients/", HTTP_X_DB_STICKY=response[STICKY_HEADER]
+        )
+        self.assertEqual(self.read_alias(request, view_func=match)[0], "default")
+
+    def test_forged_or_expired_tokens_are_ignored(self):
+        _, response = self.read_alias(self.factory.post("/api/recipes/"), write=True)
+        signed = response[STICKY_HEADER]
+        for value in ("1", signed + "x"):
+            request = self.factory.get("/api/recipes/", HTTP_X_DB_STICKY=value)
+            request.COOKIES[STICKY_COOKIE_NAME] = value
+            self.assertEqual(self.read_alias(request)[0], "replica_0")
+
+        request = self.factory.get("/api/recipes/", HTTP_X_DB_STICKY=signed)
+        request.COOKIES[STICKY_COOKIE_NAME] = signed
+        with mock.patch("time.time", return_value=time.time() + settings.REPLICA_STICKY_SECONDS + 1):
+            self.assertEqual(self.read_alias(request)[0], "replica_0")
+
+    def test_write_pins_rest_of_request(self):
+        request = self.factory.get("/api/recipes/")
+
+        def get_response(request):
+            self.router.db_for_write(Recipe)
+            return HttpResponse(self.router.db_for_read(Recipe))
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        self.assertEqual(response.content, b"default")
+
+
+# The test database stands in for the replica; TestCase's transaction would
+# keep every read on the primary, hence TransactionTestCase
+@override_settings(DATABASE_REPLICAS=["default"])
+class ReplicaStickinessAPITests(TransactionTestCase):
+    def reads_replicas(self, client, **headers):
+        """Whether listing recipes with ``client`` read from a replica."""
+        cache.clear()
+        with mock.patch(
+            "recipes.utils.db_routing.random.choice", side_effect=lambda aliases: aliases[0]
+        ) as choice:
+            self.assertEqual(client.get("/api/recipes/", **headers).status_code, 200)
+        return choice.called
+
+    def test_api_clients_without_cookies_stay_on_the_primary_after_writing(self):
+        client = APIClient(enforce_csrf_checks=True)
+        response = client.post("/api/auth/signup/", {
+            "email": "writer@example.com",
+            "password": "Str0ng-passw0rd!",
+            "password2": "Str0ng-passw0rd!",
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        client.cookies.clear()
+
+        self.assertFalse(self.reads_replicas(client, HTTP_X_DB_STICKY=response[STICKY_HEADER]))
+        self.assertTrue(self.reads_replicas(client))
+
+
+class RequestMetricsTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+        get_request_metrics().clear()
+
+    def test_server_timing_and_histograms(self):
+        response = self.client.get("/api/recipes/", {"ordering": "-cooking_time"})
+        timing = response["Server-Timing"]
+        self.assertIn('desc="3 queries"', timing)
+        for metric in ("db;", "render;", "view;", "total;"):
+            self.assertIn(metric, timing)
+
+        staff = User.objects.create_user(username="staff", password="x", is_staff=True)
+        self.client.force_authenticate(staff)
+        exposition = self.client.get("/metrics").content.decode()
+        self.assertIn(
+            'recipes_sql_queries_count{route="recipe-list",method="GET"} 1', exposition
+        )
+        self.assertIn(
+            'recipes_sql_queries_bucket{route="recipe-list",method="GET",le="5.0"} 1', exposition
+        )
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_metrics_need_the_token_or_staff(self):
+        self.assertIn(self.client.get("/metrics").status_code, (401, 403))
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertIn(response.status_code, (401, 403))
+
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-me")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE recipes_request_duration_seconds histogram", response.content.decode())
+
+        user = User.objects.create_user(username="cook", password="x")
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    @override_settings(REQUEST_QUERY_BUDGET=2)
+    def test_requests_over_budget_are_flagged(self):
+        response = self.client.get("/api/recipes/", {"ordering": "total_time"})
+        self.assertEqual(response["X-Query-Budget-Exceeded"], "3/2")
+        exposition = get_request_metrics().render()
+        self.assertIn(
+            'recipes_query_budget_exceeded_total{route="recipe-list",method="GET"} 1', exposition
+        )
+
+
+class RequestProfilingTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        override = override_settings(REQUEST_PROFILE_DIR=self.profile_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = User.objects.create_user(
+            username="staff", email="staff@example.com", password="x", is_staff=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_staff_header_profiles_the_request(self):
+        response = self.client.get(
+            "/api/recipes/suggestions/", HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="req-00000001"
+        )
+        self.assertEqual(response["X-Profile-Id"], "req-00000001")
+
+        listed = self.client.get("/api/profiles/").json()
+        self.assertEqual([profile["request_id"] for profile in listed], ["req-00000001"])
+        self.assertEqual(listed[0]["view"], "recipe-suggestions")
+
+        profile = self.client.get("/api/profiles/req-00000001/").json()
+        self.assertGreater(profile["query_count"], 0)
+        self.assertTrue(all("sql" in query for query in profile["queries"]))
+        self.assertIn("self", profile["hottest"])
+        folded = self.client.get("/api/profiles/req-00000001/folded/")
+        self.assertEqual(folded.status_code, 200)
+
+    def test_profiling_stops_when_the_view_raises(self):
+        with mock.patch(
+            "recipes.views.RecipeViewSet.suggestions", side_effect=RuntimeError("view failed")
+        ), mock.patch(
+            "recipes.utils.custom_exception_handler.exception_handler",
+            side_effect=RuntimeError("handler failed"),
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.get(
+                    "/api/recipes/suggestions/", HTTP_X_PROFILE="1", HTTP_X_REQUEST_ID="req-00000002"
+                )
+
+        self.assertEqual(connection.execute_wrappers, [])
+        self.assertFalse(
+            any(thread.name == "request-profiler" for thread in threading.enumerate())
+        )
+        # Every slot is free again
+        slots = [profiling._slots.acquire(blocking=False) for _ in range(
+            settings.REQUEST_PROFILE_MAX_CONCURRENT
+        )]
+        for acquired in filter(None, slots):
+            profiling._slots.release()
+        self.assertTrue(all(slots))
+        profile = self.client.get("/api/profiles/req-00000002/").json()
+        self.assertEqual(profile["status"], 500)
+
+    def test_header_is_ignored_for_other_users(self):
+        self.client.force_authenticate(User.objects.create_user(
+            username="cook", email="cook@example.com", password="x"
+        ))
+        response = self.client.get("/api/recipes/suggestions/", HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(self.client.get("/api/profiles/").status_code, 403)
+
+
+class LoggingPipelineTests(SimpleTestCase):
+    def make_logger(self, name, *filters):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(JSONFormatter())
+        test_logger = logging.getLogger(name)
+        test_logger.addHandler(handler)
+        test_logger.propagate = False
+        for log_filter in filters:
+            test_logger.addFilter(log_filter)
+        self.addCleanup(test_logger.removeHandler, handler)
+        return test_logger, handler, stream
+
+    def test_records_are_written_as_json_by_the_writer_thread(self):
+        test_logger, handler, stream = self.make_logger("recipes.tests.queued")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            test_logger.exception("Failed %s", "import", extra={"batch": 3})
+        handler.flush()
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry["message"], "Failed import")
+        self.assertEqual(entry["batch"], 3)
+        self.assertIn("ValueError: boom", entry["exception"])
+
+    def test_rate_limit_reports_suppressed_records(self):
+        rate_limit = RateLimitFilter(rate=0.0001, burst=2)
+        test_logger, handler, stream = self.make_logger("recipes.tests.limited", rate_limit)
+        for number in range(5):
+            test_logger.info("Message %d", number)
+        test_logger.error("Always written")
+        rate_limit._buckets[("recipes.tests.limited", "Message %d")][0] = 1
+        test_logger.info("Message %d", 5)
+        handler.flush()
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            [entry["message"] for entry in entries],
+            ["Message 0", "Message 1", "Always written", "Message 5"],
+        )
+        self.assertEqual(entries[-1]["suppressed"], 3)
+
+    def test_rate_limit_keeps_the_most_recent_buckets(self):
+        rate_limit = RateLimitFilter(max_keys=3)
+        test_logger, handler, stream = self.make_logger("recipes.tests.bounded", rate_limit)
+        for number in range(10):
+            test_logger.info(f"Message {number}")
+        test_logger.info("Message 8")
+        test_logger.info("Message 10")
+        self.assertEqual(
+            [template for _, template in rate_limit._buckets],
+            ["Message 9", "Message 8", "Message 10"],
+        )
+
+    def test_dropped_records_are_exported(self):
+        before = dropped_records()
+        handler = QueuedStreamHandler(io.StringIO(), queue_size=1)
+        # No writer is running, so the second record finds the queue full
+        for number in range(2):
+            handler.enqueue(logging.makeLogRecord({"msg": f"Message {number}"}))
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(dropped_records(), before + 1)
+        self.assertIn(
+            f"recipes_log_records_dropped_total {before + 1}", get_request_metrics().render()
+        )
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="cook", email="cook@example.com", password="x"
+        )
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/preferences/current/")
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries if '"recipes_user"' in query["sql"]]
+
+    def test_repeat_requests_skip_the_user_lookup(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.user_queries()
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get("/api/preferences/current/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_per_process_cache_keeps_no_shared_entry(self):
+        self.user_queries()
+        self.assertIsNone(cache.get(f"{CACHE_KEY_PREFIX}{self.user.pk}"))
+
+    def test_shared_entry_holds_only_auth_fields(self):
+        with mock.patch("recipes.utils.jwt_auth._use_shared_tier", return_value=True):
+            self.assertEqual(len(self.user_queries()), 1)
+            entry = cache.get(f"{CACHE_KEY_PREFIX}{self.user.pk}")
+            self.assertEqual(
+                set(entry),
+                {"pk", "is_active", "is_staff", "is_superuser", "password_fingerprint"},
+            )
+            self.assertNotIn(self.user.password, entry.values())
+            self.assertEqual(self.user_queries(), [])
+
+            # Saving drops the shared entry, so every worker reloads the user
+            self.user.is_active = False
+            self.user.save()
+            self.assertIsNone(cache.get(f"{CACHE_KEY_PREFIX}{self.user.pk}"))
+            response = self.client.get("/api/preferences/current/")
+            self.assertEqual(response.status_code, 401)
+
+    def test_shared_tier_sits_behind_the_process_cache(self):
+        key = f"{CACHE_KEY_PREFIX}{self.user.pk}"
+        with mock.patch("recipes.utils.jwt_auth._use_shared_tier", return_value=True):
+            self.user_queries()
+            with mock.patch.object(jwt_auth, "cache") as shared:
+                self.assertEqual(self.user_queries(), [])
+            shared.get.assert_not_called()
+
+            # A worker that has not seen the user reads the shared entry
+            jwt_auth._local_users.pop(str(self.user.pk))
+            self.assertEqual(self.user_queries(), [])
+            self.assertIsNotNone(cache.get(key))
+
+    def test_file_cache_is_not_a_shared_tier(self):
+        file_cache = {"default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": tempfile.gettempdir(),
+        }}
+        with override_settings(CACHES=file_cache):
+            self.assertFalse(jwt_auth._use_shared_tier())
+
+
+class IngredientNameTests(TestCase):
+    def test_canonical_names(self):
+        cases = {
+            "Tomatoes": "tomato",
+            "  Cherry   Tomatoes ": "cherry tomato",
+            "berries": "berry",
+            "peaches": "peach",
+            "asparagus": "asparagus",
+            "hummus": "hummus",
+            "glass": "glass",
+            "chicken pieces": "chicken",
+            "eggs": "egg",
+            "pea": "pea",
+        }
+        for raw, expected in cases.items():
+            with self.subTest(raw=raw):
+                self.assertEqual(canonical_ingredient_name(raw), expected)
+
+    def test_ingredient_and_alias_store_canonical_keys(self):
+        ingredient = Ingredient.objects.create(name="Scallions")
+        self.assertEqual(ingredient.canonical_name, "scallion")
+        alias = IngredientAlias.objects.create(alias="Green Onions", ingredient=ingredient)
+        self.assertEqual(alias.alias, "green onion")
+
+    def test_names_resolve_through_aliases(self):
+        ingredient = Ingredient.objects.create(name="scallion")
+        IngredientAlias.objects.create(alias="spring onion", ingredient=ingredient)
+        self.assertEqual(
+            resolve_ingredient_keys(["Spring Onions", "leeks"]),
+            {"Spring Onions": "scallion", "leeks": "leek"},
+        )
+        matched, unmatched = match_ingredient_names(["spring onions"], fuzzy=False)
+        self.assertEqual([row["id"] for row in matched], [ingredient.pk])
+        self.assertEqual(unmatched, [])
+
+    def test_index_follows_alias_changes(self):
+        ingredient = Ingredient.objects.create(name="scallion")
+        self.assertEqual(ingredient_index.snapshot().resolve("spring onions"), "spring onion")
+
+        alias = IngredientAlias.objects.create(alias="spring onion", ingredient=ingredient)
+        self.assertEqual(ingredient_index.snapshot().resolve("spring onions"), "scallion")
+
+        alias.delete()
+        self.assertEqual(ingredient_index.snapshot().resolve("spring onions"), "spring onion")
+
+
+class IngredientFuzzyMatchTests(TestCase):
+    def setUp(self):
+        self.tomato, self.cheddar, self.cherry = (
+            Ingredient.objects.create(name=name)
+            for name in ("Tomatoes", "Cheddar Cheese", "Cherry Tomatoes")
+        )
+
+    def test_lookup_ranks_by_trigram_similarity(self):
+        results = ingredient_fuzzy_index.lookup("tomatos", limit=2, min_similarity=0)
+        self.assertEqual([row["id"] for row in results], [self.tomato.pk, self.cherry.pk])
+        self.assertGreater(results[0]["similarity"], results[1]["similarity"])
+        self.assertEqual(ingredient_fuzzy_index.lookup("tomatos", limit=0), [])
+
+    def test_index_follows_ingredient_changes(self):
+        self.assertEqual(ingredient_fuzzy_index.lookup("basil"), [])
+        basil = Ingredient.objects.create(name="Basil")
+        self.assertEqual([row["id"] for row in ingredient_fuzzy_index.lookup("basill")], [basil.pk])
+
+    def test_every_name_is_matched_or_unmatched(self):
+        matched, unmatched = match_ingredient_names(
+            ["tomatoes", "tomatto", "tomatoe", "chedar cheese", "xylophone"]
+        )
+        self.assertEqual(
+            [(row["id"], row.get("detected")) for row in matched],
+            [
+                (self.tomato.pk, None),
+                (self.tomato.pk, "tomatto"),
+                (self.tomato.pk, "tomatoe"),
+                (self.cheddar.pk, "chedar cheese"),
+            ],
+        )
+        self.assertEqual(unmatched, ["xylophone"])
+
+    def test_resolve_endpoint_clamps_limit(self):
+        client = APIClient()
+        for limit, expected in (("-50", 1), ("0", 1), ("1", 1), ("500", 2)):
+            with self.subTest(limit=limit):
+                response = client.get(
+                    "/api/ingredients/resolve/", {"name": "tomato", "limit": limit}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()["tomato"]), expected)
+        response = client.get("/api/ingredients/resolve/", {"name": "tomato", "limit": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class IngredientIndexTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def test_snapshot_is_unchanged_by_a_rebuild(self):
+        before = ingredient_index.snapshot()
+        mask = before.filter_mask(vegetarian=True)
+        Recipe.objects.first().delete()
+
+        after = ingredient_index.snapshot()
+        self.assertIsNot(after, before)
+        self.assertEqual(len(after.recipe_ids), len(before.recipe_ids) - 1)
+        # The old snapshot still scores with the mask it produced
+        total, _ = before.match(["salt"], threshold=-1, mask=mask)
+        self.assertEqual(total, int(mask.sum()))
+        self.assertEqual(len(mask), len(before.recipe_ids))
+
+    def test_snapshot_is_reused_until_the_catalog_changes(self):
+        self.assertIs(ingredient_index.snapshot(), ingredient_index.snapshot())
+
+    def test_match_ingredients_ranks_by_match_fraction(self):
+        recipe = Recipe.objects.first()
+        names = list(recipe.recipeingredient_set.values_list("ingredient__name", flat=True))
+        response = APIClient().post(
+            "/api/recipes/match_ingredients/",
+            {"ingredients": names, "min_match_percentage": 0},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        first = response.json()["results"][0]
+        self.assertEqual(first["match_percentage"], 100.0)
+
+    def match(self, **data):
+        return APIClient().post(
+            "/api/recipes/match_ingredients/",
+            {"ingredients": ["Parmesan Cheese", "Tomatoes", "Ground Beef"], "min_match_percentage": 0, **data},
+            format="json",
+        )
+
+    def test_match_ingredients_without_limit_returns_every_match(self):
+        body = self.match().json()
+        self.assertGreater(body["count"], 0)
+        self.assertEqual(len(body["results"]), body["count"])
+        self.assertIsNone(body["next_cursor"])
+
+    def test_match_ingredients_pages_with_cursor(self):
+        everything = [recipe["id"] for recipe in self.match().json()["results"]]
+        self.assertGreater(len(everything), 4)
+        first = self.match(limit=2).json()
+        second = self.match(limit=2, cursor=first["next_cursor"]).json()
+        self.assertEqual(
+            [recipe["id"] for recipe in first["results"] + second["results"]], everything[:4]
+        )
+
+    def test_match_ingredients_rejects_malformed_cursor(self):
+        for cursor in (5, ["o"], "not-a-cursor"):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.match(cursor=cursor).status_code, 400)
+
+    def test_match_ingredients_rejects_malformed_body(self):
+        for data in (
+            {"fields": "title"},
+            {"fields": ["title", "secret"]},
+            {"filters": {"cooking_time": 30}},
+            {"filters": {"cooking_time": {"min": "soon"}}},
+            {"filters": {"difficulty": {"is": "easy"}}},
+            {"filters": ["easy"]},
+            {"dietary_preferences": ["vegetarian"]},
+            {"ingredients": [{"name": "Tomatoes"}]},
+            {"ingredients": "Tomatoes"},
+            {"limit": 0},
+            {"min_match_percentage": 101},
+            {"cursor": encode_cursor({"o": -1})},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.match(**data).status_code, 400)
+
+
+class RecipeSearchTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+        get_search_backend.cache_clear()
+        self.addCleanup(get_search_backend.cache_clear)
+        base = Recipe.objects.first()
+        self.in_title, self.in_description = [
+            Recipe.objects.create(
+                title=title,
+                description=description,
+                instructions="Stir.",
+                cooking_time=10,
+                preparation_time=5,
+                calories_per_serving=100,
+                protein_per_serving=1.0,
+                cuisine=base.cuisine,
+                serving_size="1 bowl",
+            )
+            for title, description in (
+                ("Quinceberry tart", "A sweet bake."),
+                ("Plain tart", "Topped with quinceberry jam."),
+            )
+        ]
+
+    def titles(self, **params):
+        response = self.client.get("/api/recipes/", params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe["title"] for recipe in response.json()["results"]]
+
+    def test_fts_ranks_title_matches_first(self):
+        self.assertEqual(self.titles(q="quinceberry"), ["Quinceberry tart", "Plain tart"])
+
+    def test_search_parameter_is_still_accepted(self):
+        self.assertEqual(self.titles(search="quinceberry"), self.titles(q="quinceberry"))
+
+    def test_prefix_terms_and_fts_syntax_in_queries(self):
+        self.assertEqual(self.titles(q="quinceb"), ["Quinceberry tart", "Plain tart"])
+        self.assertEqual(self.titles(q='quinceberry" OR "tart'), [])
+
+    @override_settings(RECIPE_SEARCH_BACKEND="recipes.utils.search.DatabaseSearchBackend")
+    def test_database_fallback_backend(self):
+        self.assertEqual(
+            sorted(self.titles(q="quinceberry")), ["Plain tart", "Quinceberry tart"]
+        )
+        self.assertEqual(self.titles(q="quinceberry sweet"), ["Quinceberry tart"])
+
+    def test_post_migrate_creates_the_fts_table(self):
+        backend = get_search_backend()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {backend.table}")
+        ensure_search_index(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {backend.table}")
+            self.assertEqual(cursor.fetchone()[0], Recipe.objects.count())
+        self.assertEqual(self.titles(q="quinceberry")[0], "Quinceberry tart")
+
+
+class RecipeCursorPaginationTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, params):
+        response = self.client.get("/api/recipes/", params).json()
+        seen = [recipe["id"] for recipe in response["results"]]
+        while response["next"]:
+            response = self.client.get(response["next"]).json()
+            seen += [recipe["id"] for recipe in response["results"]]
+        return seen
+
+    def test_pages_cover_every_recipe_once_for_each_ordering(self):
+        recipe_count = Recipe.objects.count()
+        for ordering in ("", "cooking_time", "-calories_per_serving", "-average_rating"):
+            with self.subTest(ordering=ordering):
+                seen = self.walk({"ordering": ordering})
+                self.assertEqual(len(seen), recipe_count)
+                self.assertEqual(len(set(seen)), recipe_count)
+
+    def test_filtered_pages_keep_the_ordering(self):
+        expected = list(
+            Recipe.objects.filter(is_vegetarian=True)
+            .order_by("-calories_per_serving", "-id")
+            .values_list("id", flat=True)
+        )
+        seen = self.walk({"is_vegetarian": "true", "ordering": "-calories_per_serving"})
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_positions_are_not_found(self):
+        for payload in (
+            {"v": 1, "id": "abc"},
+            {"v": {"a": 1}, "id": 1},
+            {"id": [1]},
+            {"v": 1},
+            {"v": "soon", "id": 1},
+            {"v": True, "id": 1},
+            {"v": 1, "id": 1.5},
+            {"v": None, "id": 1},
+        ):
+            with self.subTest(payload=payload):
+                response = self.client.get(
+                    "/api/recipes/", {"ordering": "cooking_time", "cursor": encode_cursor(payload)}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_deep_page_costs_the_same_as_first_page(self):
+        first = self.client.get("/api/recipes/", {"ordering": "cooking_time"}).json()
+        with self.assertNumQueries(3):
+            self.client.get(first["next"])
+
+    def test_count_is_opt_in(self):
+        self.assertNotIn("count", self.client.get("/api/recipes/").json())
+        response = self.client.get("/api/recipes/", {"count": "true"}).json()
+        self.assertEqual(response["count"], Recipe.objects.count())
+
+
+class FileVersionStoreTests(SimpleTestCase):
+    def setUp(self):
+        version_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(version_dir.cleanup)
+        self.enterContext(override_settings(VERSION_DIR=version_dir.name))
+
+    def test_bump_reaches_other_workers(self):
+        # Each store stands in for a worker with its own per-process cache
+        worker, other = FileVersionStore(), FileVersionStore()
+        first = worker.get(CATALOG_VERSION_KEY)
+        self.assertEqual(other.get(CATALOG_VERSION_KEY), first)
+        other.bump(CATALOG_VERSION_KEY)
+        self.assertNotEqual(worker.get(CATALOG_VERSION_KEY), first)
+        self.assertEqual(worker.get(CATALOG_VERSION_KEY), other.get(CATALOG_VERSION_KEY))
+
+    def test_versions_bypass_the_cache(self):
+        version = get_version(CATALOG_VERSION_KEY)
+        cache.clear()
+        self.assertEqual(get_version(CATALOG_VERSION_KEY), version)
+        bump_version(CATALOG_VERSION_KEY)
+        self.assertNotEqual(get_version(CATALOG_VERSION_KEY), version)
+
+
+class ResponseCacheTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_repeat_reads_skip_the_database(self):
+        first = self.client.get("/api/recipes/", {"ordering": "cooking_time"})
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/recipes/", {"ordering": "cooking_time"})
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_conditional_get_returns_not_modified(self):
+        recipe = Recipe.objects.first()
+        etag = self.client.get(f"/api/recipes/{recipe.pk}/")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/api/recipes/{recipe.pk}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_alone_is_not_honoured(self):
+        # Rating writes change aggregates without touching updated_at, so
+        # only the ETag can say a copy is current
+        recipe = Recipe.objects.first()
+        self.client.get(f"/api/recipes/{recipe.pk}/")
+        response = self.client.get(
+            f"/api/recipes/{recipe.pk}/", HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        recipe = Recipe.objects.first()
+        self.client.get(f"/api/recipes/{recipe.pk}/")
+        cache.delete(CATALOG_VERSION_KEY)
+        Recipe.objects.filter(pk=recipe.pk).update(title="Renamed without signals")
+        response = self.client.get(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.json()["title"], "Renamed without signals")
+
+    def test_catalog_write_invalidates(self):
+        recipe = Recipe.objects.first()
+        etag = self.client.get(f"/api/recipes/{recipe.pk}/")["ETag"]
+        recipe.title = "Renamed"
+        recipe.save()
+        response = self.client.get(f"/api/recipes/{recipe.pk}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "Renamed")
+
+
+class NestedRecipeWriteTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.ingredient_ids = list(Ingredient.objects.order_by("id").values_list("id", flat=True))
+
+    def put_ingredients(self, recipe, ingredient_ids, unit="g"):
+        return self.client.patch(f"/api/recipes/{recipe.pk}/", {
+            "ingredients": [
+                {"ingredient": ingredient_id, "quantity": "1", "unit": unit}
+                for ingredient_id in ingredient_ids
+            ],
+        }, format="json")
+
+    def test_update_applies_only_the_diff(self):
+        recipe = Recipe.objects.first()
+        self.put_ingredients(recipe, self.ingredient_ids[:4])
+        response = self.put_ingredients(recipe, self.ingredient_ids[2:6])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row["ingredient"] for row in response.json()["ingredients"]],
+            self.ingredient_ids[2:6],
+        )
+
+    def test_query_count_does_not_grow_with_ingredient_count(self):
+        small, large = Recipe.objects.order_by("id")[:2]
+        self.put_ingredients(small, self.ingredient_ids[:2])
+        self.put_ingredients(large, self.ingredient_ids[:10])
+        with CaptureQueriesContext(connection) as small_queries:
+            self.put_ingredients(small, self.ingredient_ids[1:3], unit="kg")
+        with CaptureQueriesContext(connection) as large_queries:
+            self.put_ingredients(large, self.ingredient_ids[5:15], unit="kg")
+        self.assertEqual(len(small_queries), len(large_queries))
+
+    def test_patch_rows_must_be_complete(self):
+        recipe = Recipe.objects.first()
+        self.put_ingredients(recipe, self.ingredient_ids[:2])
+        for row in ({"ingredient": self.ingredient_ids[0]}, {"ingredient": self.ingredient_ids[5]}):
+            with self.subTest(row=row):
+                response = self.client.patch(
+                    f"/api/recipes/{recipe.pk}/", {"ingredients": [row]}, format="json"
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(
+                    set(response.json()["ingredients"][0]), {"quantity", "unit"}
+                )
+        self.assertEqual(
+            sorted(recipe.recipeingredient_set.values_list("ingredient_id", flat=True)),
+            self.ingredient_ids[:2],
+        )
+
+    def test_rejects_unknown_and_repeated_ingredients(self):
+        recipe = Recipe.objects.first()
+        self.assertEqual(self.put_ingredients(recipe, [999999]).status_code, 400)
+        self.assertEqual(self.put_ingredients(recipe, self.ingredient_ids[:1] * 2).status_code, 400)
+
+
+class ImportRecipesTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def import_lines(self, records, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as handle:
+            handle.write("\n".join(json.dumps(record) for record in records))
+        self.addCleanup(os.remove, handle.name)
+        call_command("import_recipes", handle.name, *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def recipe(self, **overrides):
+        return {
+            "title": "Imported Curry", "description": "d", "instructions": "i",
+            "cooking_time": 30, "preparation_time": 10, "calories_per_serving": 400,
+            "protein_per_serving": 12, "cuisine": "thai", "serving_size": "1 bowl",
+            "ingredients": [{"name": "tomato", "quantity": "2", "unit": "pcs"}, "lemongrass"],
+            **overrides,
+        }
+
+    def test_import_resolves_ingredients_and_skips_bad_records(self):
+        recipe_count = Recipe.objects.count()
+        self.import_lines([self.recipe(), {"title": "No details"}])
+        self.assertEqual(Recipe.objects.count(), recipe_count + 1)
+        recipe = Recipe.objects.get(title="Imported Curry")
+        self.assertEqual(recipe.total_time, 40)
+        self.assertEqual(
+            set(recipe.ingredients.values_list("name", flat=True)), {"Tomatoes", "lemongrass"}
+        )
+
+    def test_upsert_replaces_matching_recipe(self):
+        self.import_lines([self.recipe()])
+        self.import_lines([self.recipe(cooking_time=5, ingredients=["eggs"])], "--upsert")
+        recipe = Recipe.objects.get(title="Imported Curry")
+        self.assertEqual(recipe.cooking_time, 5)
+        self.assertEqual(list(recipe.ingredients.values_list("name", flat=True)), ["Eggs"])
+
+    def test_upsert_replaces_ingredient_rows_without_per_row_signals(self):
+        self.import_lines([self.recipe()])
+        search = lambda: APIClient().get("/api/recipes/", {"q": "lemongrass"}).json()["results"]
+        self.assertEqual([recipe["title"] for recipe in search()], ["Imported Curry"])
+        deleted = []
+
+        def record_delete(instance, **kwargs):
+            deleted.append(instance)
+
+        post_delete.connect(record_delete, sender=RecipeIngredient)
+        self.addCleanup(post_delete.disconnect, record_delete, sender=RecipeIngredient)
+        self.import_lines([self.recipe(ingredients=["eggs"])], "--upsert")
+        self.assertEqual(deleted, [])
+        # The batch is reindexed even though no signal fired
+        self.assertEqual(search(), [])
+
+    def test_non_object_lines_are_skipped(self):
+        importer = CatalogImporter()
+        lines = io.StringIO("\n".join(["[1, 2]", "5", '"curry"', json.dumps(self.recipe())]))
+        summary = importer.run(read_records(lines, "jsonl", "recipe"))
+        self.assertEqual(summary["recipes_created"], 1)
+        self.assertEqual(summary["skipped"], 3)
+        self.assertEqual(
+            importer.errors, [(line, "record must be a JSON object") for line in (1, 2, 3)]
+        )
+
+    def test_error_list_is_capped(self):
+        importer = CatalogImporter()
+        with mock.patch("recipes.utils.catalog_import.MAX_REPORTED_ERRORS", 2):
+            summary = importer.run((line, {"type": "unknown"}) for line in range(5))
+        self.assertEqual(summary["skipped"], 5)
+        self.assertEqual(len(importer.errors), 2)
+
+
+class RatingAggregateTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.first, self.second = Recipe.objects.order_by("id")[:2]
+        Recipe.objects.filter(pk__in=[self.first.pk, self.second.pk]).update(
+            rating_sum=0, rating_count=0, average_rating=None
+        )
+        self.cook = User.objects.create_user("cook", "cook@example.com", "secret")
+        self.critic = User.objects.create_user("critic", "critic@example.com", "secret")
+
+    def aggregates(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.rating_sum, recipe.rating_count, recipe.average_rating
+
+    def test_deltas_follow_create_update_move_and_delete(self):
+        rating = RecipeRating.objects.create(user=self.cook, recipe=self.first, rating=4)
+        RecipeRating.objects.create(user=self.critic, recipe=self.first, rating=2)
+        self.assertEqual(self.aggregates(self.first), (6, 2, 3.0))
+
+        rating.rating = 5
+        rating.save()
+        self.assertEqual(self.aggregates(self.first), (7, 2, 3.5))
+
+        rating.recipe = self.second
+        rating.save()
+        self.assertEqual(self.aggregates(self.first), (2, 1, 2.0))
+        self.assertEqual(self.aggregates(self.second), (5, 1, 5.0))
+
+        rating.delete()
+        self.assertEqual(self.aggregates(self.second), (0, 0, None))
+
+    def test_rebuild_repairs_drifted_aggregates(self):
+        RecipeRating.objects.create(user=self.cook, recipe=self.first, rating=4)
+        Recipe.objects.filter(pk=self.first.pk).update(rating_sum=40, rating_count=3)
+        self.assertEqual(rebuild_rating_aggregates([self.first.pk, self.second.pk]), 2)
+        self.assertEqual(self.aggregates(self.first), (4, 1, 4.0))
+        self.assertEqual(self.aggregates(self.second), (0, 0, None))
+
+    def test_recipe_save_keeps_concurrent_rating_deltas(self):
+        stale = Recipe.objects.get(pk=self.first.pk)
+        RecipeRating.objects.create(user=self.cook, recipe=self.first, rating=4)
+        stale.title = "Edited"
+        stale.save()
+        self.assertEqual(self.aggregates(self.first), (4, 1, 4.0))
+        self.assertEqual(self.first.title, "Edited")
+
+
+class BulkRatingTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.user = User.objects.create_user("cook", "cook@example.com", "secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_upsert_reports_each_item_and_refreshes_aggregates(self):
+        first, second = Recipe.objects.order_by("id")[:2]
+        RecipeRating.objects.create(user=self.user, recipe=first, rating=1)
+        response = self.client.post("/api/ratings/bulk/", [
+            {"recipe": first.id, "rating": 4},
+            {"recipe": second.id, "rating": 9},
+            {"recipe": second.id, "rating": 5},
+        ], format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [item["status"] for item in response.json()["results"]],
+            ["updated", "invalid", "created"],
+        )
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.rating_count, first.average_rating), (1, 4.0))
+        self.assertEqual((second.rating_count, second.average_rating), (1, 5.0))
+
+    def test_items_are_validated_with_one_recipe_query(self):
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True)[:20])
+        items = [{"recipe": recipe_id, "rating": 4} for recipe_id in recipe_ids]
+        items += [{"recipe": 0, "rating": 4}, {"recipe": "abc", "rating": 4}, {"recipe": recipe_ids[0]}]
+        with self.assertNumQueries(1):
+            valid, errors = validate_items(RecipeRatingSerializer(data=items, many=True))
+        self.assertEqual([data["recipe"].pk for _, data in valid], recipe_ids)
+        self.assertEqual(sorted(errors), [len(recipe_ids), len(recipe_ids) + 1, len(recipe_ids) + 2])
+        self.assertEqual(errors[len(recipe_ids)]["recipe"][0].code, "does_not_exist")
+
+
+class SuggestionFeedTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.user = User.objects.create_user("cook", "cook@example.com", "secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_feed_is_served_from_cache_until_invalidated(self):
+        first = self.client.get("/api/recipes/suggestions/").json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/recipes/suggestions/").json(), first)
+
+        rated = first["results"][0]["id"]
+        RecipeRating.objects.create(user=self.user, recipe_id=rated, rating=5)
+        response = self.client.get("/api/recipes/suggestions/").json()
+        self.assertNotIn(rated, [recipe["id"] for recipe in response["results"]])
+
+    def test_warming_requires_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, "per-process"):
+            call_command("warm_suggestion_feeds", stdout=io.StringIO())
+
+    def test_warmed_feeds_are_served(self):
+        # Tests run on LocMemCache, which is shared within the test process
+        with mock.patch(
+            "recipes.management.commands.warm_suggestion_feeds.cache_is_shared",
+            return_value=True,
+        ):
+            call_command("warm_suggestion_feeds", str(self.user.pk), stdout=io.StringIO())
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/recipes/suggestions/")
+        self.assertEqual(response.status_code, 200)
+
+
+class RecommendationTests(TestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        model_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(model_dir.cleanup)
+        self.enterContext(override_settings(RECOMMENDER_MODEL_DIR=model_dir.name))
+
+        self.recipes = list(Recipe.objects.order_by("id")[:4])
+        a, b, c, d = self.recipes
+        # Fans of a also love b and dislike c; d is rated independently
+        for index in range(6):
+            user = User.objects.create_user(f"fan{index}", f"fan{index}@example.com", "secret")
+            for recipe, rating in ((a, 5), (b, 5), (c, 1), (d, 1 + index % 5)):
+                RecipeRating.objects.create(user=user, recipe=recipe, rating=rating)
+        call_command("train_recommender", stdout=io.StringIO())
+
+        self.user = User.objects.create_user("cook", "cook@example.com", "secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recommends_neighbors_of_liked_recipes(self):
+        a, b, c, _ = self.recipes
+        RecipeRating.objects.create(user=self.user, recipe=a, rating=5)
+        RecipeRating.objects.create(user=self.user, recipe=c, rating=1)
+        response = self.client.get("/api/recipes/recommendations/").json()
+        self.assertEqual(response["source"], "item_neighbors")
+        self.assertEqual(response["results"][0]["id"], b.id)
+        self.assertNotIn(a.id, [recipe["id"] for recipe in response["results"]])
+
+    def test_retraining_within_a_second_publishes_a_new_generation(self):
+        model_dir = settings.RECOMMENDER_MODEL_DIR
+        first = read_current(Path(model_dir))
+        call_command("train_recommender", stdout=io.StringIO())
+        second = read_current(Path(model_dir))
+        self.assertNotEqual(first, second)
+        self.assertEqual(sorted(os.listdir(model_dir)), sorted(["CURRENT", first, second]))
+
+    def test_cold_start_falls_back_to_suggestions(self):
+        response = self.client.get("/api/recipes/recommendations/").json()
+        self.assertEqual(response["source"], "suggestions")
+
+    def test_anonymous_users_are_unauthorized(self):
+        response = APIClient().get("/api/recipes/recommendations/")
+        self.assertEqual(response.status_code, 401)
+
+    def neighbors(self):
+        model_dir = Path(settings.RECOMMENDER_MODEL_DIR)
+        name = read_current(model_dir)
+        return {
+            key: np.load(model_dir / name / f"{key}.npy")
+            for key in ("recipe_ids", "indptr", "neighbors", "similarities")
+        }
+
+    def test_incremental_retrain_matches_a_full_one(self):
+        a, b, c, d = self.recipes
+        fan = User.objects.get(username="fan0")
+        RecipeRating.objects.filter(user=fan, recipe=d).update(rating=5, updated_at=timezone.now())
+        RecipeRating.objects.filter(user=fan, recipe=c).delete()
+        RecipeRating.objects.create(user=self.user, recipe=b, rating=4)
+        RecipeRating.objects.create(user=self.user, recipe=d, rating=2)
+
+        call_command("train_recommender", "--incremental", stdout=io.StringIO())
+        meta = read_model_meta()
+        self.assertEqual((meta["mode"], meta["changed_users"]), ("incremental", 2))
+        incremental = self.neighbors()
+        call_command("train_recommender", stdout=io.StringIO())
+        full = self.neighbors()
+        for key in ("recipe_ids", "indptr", "neighbors"):
+            np.testing.assert_array_equal(incremental[key], full[key])
+        np.testing.assert_allclose(incremental["similarities"], full["similarities"], rtol=1e-5)
+
+    def test_deletion_by_an_unchanged_user_retrains_fully(self):
+        RecipeRating.objects.filter(user__username="fan1", recipe=self.recipes[3]).delete()
+        call_command("train_recommender", "--incremental", stdout=io.StringIO())
+        self.assertEqual(read_model_meta()["mode"], "full")
+
+    def test_heavy_raters_are_capped_to_their_strongest_opinions(self):
+        rows = np.array([(1, recipe_id, 3) for recipe_id in range(1, 1001)] + [(1, 1001, 5)])
+        rows[:10, 2] = 1
+        statistics = rating_statistics(rows, max_items_per_user=20)
+        self.assertEqual(len(statistics["pair_keys"]), 20 * 19)
+        self.assertEqual(np.count_nonzero(statistics["item_norms"] > 1), 11)
+
+
+class StubIngredientExtractor:
+    """Stands in for the Gemini-backed extractor."""
+
+    def extract_ingredients(self, image_data):
+        if image_data == b"empty":
+            return {"status": "error", "ingredients": None, "error": "No ingredients detected in the image"}
+        return {"status": "success", "ingredients": ["tomatoes", "eggs", "dragon fruit"], "error": None}
+
+    def extract_many(self, images, max_workers):
+        return [self.extract_ingredients(image_data) for image_data in images]
+
+
+@override_settings(INGREDIENT_EXTRACTOR_CLASS="recipes.tests.StubIngredientExtractor")
+class ScanImageJobTests(TransactionTestCase):
+    fixtures = ["initial_data"]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def scan(self, data, **params):
+        image = SimpleUploadedFile("fridge.jpg", data, content_type="image/jpeg")
+        query = "".join(f"?{key}={value}" for key, value in params.items())
+        return self.client.post(f"/api/ingredients/scan_image/{query}", {"image": image})
+
+    def wait_for(self, status_url):
+        for _ in range(100):
+            job = self.client.get(status_url).json()
+            if job["status"] in ("completed", "failed"):
+                return job
+            time.sleep(0.02)
+        self.fail("scan job did not finish")
+
+    def test_sync_scan_matches_canonical_names(self):
+        response = self.scan(b"image").json()
+        self.assertEqual({i["name"] for i in response["matched_ingredients"]}, {"Tomatoes", "Eggs"})
+        self.assertEqual(response["unmatched_ingredients"], ["dragon fruit"])
+
+    def test_job_mode_returns_immediately_and_completes(self):
+        response = self.scan(b"image", mode="job")
+        self.assertEqual(response.status_code, 202)
+        job = self.wait_for(response.json()["status_url"])
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["result"]["total_detected"], 3)
+
+    def test_job_mode_reports_extraction_errors(self):
+        response = self.scan(b"empty", mode="job")
+        job = self.wait_for(response.json()["status_url"])
+        self.assertEqual(job["status"], "failed")
+
+    def test_job_state_is_read_from_the_shared_cache(self):
+        response = self.scan(b"image", mode="job")
+        job = self.wait_for(response.json()["status_url"])
+        # A queue in another worker holds no state of its own
+        self.assertEqual(ScanJobQueue().get(job["job_id"]), job)
+
+    def test_batch_scan_merges_images(self):
+        images = [
+            SimpleUploadedFile(name, data, content_type="image/jpeg")
+            for name, data in (("fridge.jpg", b"image"), ("pantry.jpg", b"empty"))
+        ]
+        response = self.client.post("/api/ingredients/scan_images/", {"images": images})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual({i["name"] for i in body["matched_ingredients"]}, {"Tomatoes", "Eggs"})
+        self.assertEqual(
+            [(image["name"], image["status"]) for image in body["images"]],
+            [("fridge.jpg", "success"), ("pantry.jpg", "error")],
+        )
+
+    def test_batch_scan_without_any_success(self):
+        image = SimpleUploadedFile("empty.jpg", b"empty", content_type="image/jpeg")
+        response = self.client.post("/api/ingredients/scan_images/", {"images": [image]})
+        self.assertEqual(response.status_code, 422)
+
+    def test_unknown_job(self):
+        response = self.client.get(f"/api/ingredients/scan_jobs/{'0' * 32}/")
+        self.assertEqual(response.status_code, 404)
+
+
+def make_image(size=(640, 480), image_format="PNG", quality=95, seed=0):
+    """A smooth gradient photo stand-in; ``seed`` shifts the pattern."""
+    img = Image.new("RGB", size)
+    width, height = size
+    img.putdata([
+        ((x * 255 // width + seed) % 256, (y * 255 // height) % 256, ((x + y) * seed) % 256)
+        for y in range(height)
+        for x in range(width)
+    ])
+    output = io.BytesIO()
+    img.save(output, format=image_format, quality=quality)
+    return output.getvalue()
+
+
+@override_settings(INGREDIENT_SCAN_MAX_EDGE=256)
+class ImagePreprocessingTests(SimpleTestCase):
+    def test_output_is_a_downscaled_jpeg(self):
+        jpeg_data, image_hash, stats = preprocess_image(make_image())
+        img = Image.open(io.BytesIO(jpeg_data))
+        self.assertEqual(img.format, "JPEG")
+        self.assertEqual(img.size, (256, 192))
+        self.assertEqual((stats["width"], stats["height"]), (256, 192))
+        self.assertLess(image_hash, 1 << 64)
+
+    def test_recompressed_copy_hashes_close(self):
+        _, original, _ = preprocess_image(make_image(seed=40))
+        _, recompressed, _ = preprocess_image(make_image(seed=40, image_format="JPEG", quality=30))
+        _, other, _ = preprocess_image(make_image(size=(480, 640), seed=200))
+        self.assertLessEqual(hamming_distance(original, recompressed), 6)
+        self.assertGreater(hamming_distance(original, other), 6)
+
+    @override_settings(INGREDIENT_SCAN_MAX_UPLOAD_BYTES=100)
+    def test_oversized_upload_is_rejected_before_decoding(self):
+        with self.assertRaisesMessage(ImagePreprocessingError, "exceeds"):
+            preprocess_image(make_image())
+
+    def test_unsupported_and_corrupt_images_are_rejected(self):
+        for data in (make_image(image_format="GIF"), b"not an image"):
+            with self.subTest(data=data[:8]):
+                with self.assertRaises(ImagePreprocessingError):
+                    preprocess_image(data)
+
+
+class BKTreeTests(SimpleTestCase):
+    def test_search_matches_a_linear_scan(self):
+        values = [(index * 0x9E3779B97F4A7C15) % (1 << 64) for index in range(300)]
+        tree = BKTree()
+        for value in values + values[:10]:
+            tree.add(value)
+        self.assertEqual(tree.size, len(values))
+
+        for query in values[::37]:
+            for max_distance in (0, 8, 28):
+                expected = sorted(
+                    (hamming_distance(query, value), value)
+                    for value in values
+                    if hamming_distance(query, value) <= max_distance
+                )
+                self.assertEqual(tree.search(query, max_distance), expected)
+
+    def test_empty_tree(self):
+        self.assertEqual(BKTree().search(0, 64), [])
+
+
+class TemporaryScanStoreMixin:
+    """Point INGREDIENT_SCAN_CACHE_PATH at a file that is removed afterwards."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "scan_cache.sqlite3")
+        override = override_settings(INGREDIENT_SCAN_CACHE_PATH=self.path)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ScanStoreTests(TemporaryScanStoreMixin, SimpleTestCase):
+
+    def test_sqlite_store_round_trips_unsigned_hashes_and_skips_expired_rows(self):
+        store = SQLiteResultStore(self.path, max_entries=10)
+        high, low = (1 << 64) - 1, 7
+        store.set(high, ["eggs"], time.time() + 60)
+        store.set(low, ["milk"], time.time() - 1)
+        self.assertEqual(store.get(high)[0], ["eggs"])
+        self.assertIsNone(store.get(low))
+        self.assertEqual([value for value, _ in store.hashes_since(0, 10)], [high])
+
+    def test_prune_drops_expired_then_oldest_rows(self):
+        store = SQLiteResultStore(self.path, max_entries=2)
+        now = time.time()
+        store.set(1, ["a"], now - 1)
+        for image_hash in (2, 3, 4):
+            store.set(image_hash, ["b"], now + image_hash)
+        self.assertEqual(store.prune(), 2)
+        self.assertEqual([value for value, _ in store.hashes_since(0, 10)], [3, 4])
+
+    def test_hashes_since_returns_the_newest_rows_after_a_watermark(self):
+        store = SQLiteResultStore(self.path, max_entries=10)
+        now = time.time()
+        for image_hash in range(1, 6):
+            store.set(image_hash, ["a"], now + 60 + image_hash)
+        self.assertEqual([value for value, _ in store.hashes_since(now + 62, 10)], [3, 4, 5])
+        self.assertEqual([value for value, _ in store.hashes_since(0, 2)], [4, 5])
+
+    def test_two_tier_store_promotes_l2_hits(self):
+        writer, reader = TwoTierResultStore(), TwoTierResultStore()
+        writer.set(42, ["tomatoes"])
+        self.assertEqual(reader.get(42), ["tomatoes"])
+        self.assertEqual(reader.get(42), ["tomatoes"])
+        self.assertIsNone(reader.get(43))
+        stats = reader.stats()
+        self.assertEqual(
+            (stats["l1_hits"], stats["l2_hits"], stats["misses"], stats["l2_entries"]),
+            (1, 1, 1, 1),
+        )
+
+    def test_stats_on_a_fresh_store(self):
+        stats = TwoTierResultStore().stats()
+        self.assertEqual((stats["l1_entries"], stats["hit_rate"]), (0, None))
+
+
+class PerceptualScanCacheTests(TemporaryScanStoreMixin, SimpleTestCase):
+    def test_near_duplicates_hit(self):
+        scan_cache = PerceptualScanCache()
+        scan_cache.set(0b1111, ["eggs"])
+        self.assertEqual(scan_cache.get(0b1110), ["eggs"])
+        self.assertIsNone(scan_cache.get((1 << 64) - 1))
+        self.assertEqual(scan_cache.stats()["hit_distances"], {1: 1})
+
+    @override_settings(INGREDIENT_SCAN_HASH_SYNC_INTERVAL=0)
+    def test_index_picks_up_other_workers_writes(self):
+        scan_cache, other_worker = PerceptualScanCache(), PerceptualScanCache()
+        self.assertIsNone(scan_cache.get(0b1110))
+        other_worker.set(0b1111, ["eggs"])
+        self.assertEqual(scan_cache.get(0b1110), ["eggs"])
+
+    @override_settings(INGREDIENT_SCAN_HASH_INDEX_SIZE=4)
+    def test_full_index_forgets_only_the_oldest_hashes(self):
+        scan_cache = PerceptualScanCache()
+        hashes = [0xFF << (8 * index) for index in range(5)]
+        for image_hash in hashes:
+            scan_cache.set(image_hash, [str(image_hash)])
+        self.assertEqual(scan_cache.stats()["indexed_hashes"], 3)
+        # Skip the exact-hash store lookups to see what the index still holds
+        scan_cache.store.l1._entries.clear()
+        scan_cache._next_sync = float("inf")
+        self.assertIsNone(scan_cache.get(hashes[0] ^ 1))
+        self.assertEqual(scan_cache.get(hashes[-1] ^ 1), [str(hashes[-1])])
+
+
+class FakeGeminiExtractor(IngredientExtractor):
+    """The real extractor with the model call replaced."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _generate(self, jpeg_data, stats):
+        self.calls.append(jpeg_data)
+        return {"status": "success", "ingredients": [f"item {len(self.calls)}"], "error": None}
+
+
+@override_settings(INGREDIENT_SCAN_MAX_EDGE=256)
+class ExtractManyTests(TemporaryScanStoreMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("recipes.utils.image_processing.scan_cache", PerceptualScanCache())
+        self.scan_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.extractor = FakeGeminiExtractor()
+
+    def test_duplicates_and_cached_images_are_not_sent(self):
+        fridge, pantry, counter = (make_image(seed=seed) for seed in (0, 90, 180))
+        _, cached_hash, _ = preprocess_image(counter)
+        self.scan_cache.set(cached_hash, ["cached"])
+
+        results = self.extractor.extract_many(
+            [fridge, pantry, fridge, counter, b"junk"], max_workers=2
+        )
+        self.assertEqual(len(self.extractor.calls), 2)
+        self.assertEqual(results[2]["duplicate_of"], 0)
+        self.assertEqual(results[2]["ingredients"], results[0]["ingredients"])
+        self.assertEqual(results[3]["ingredients"], ["cached"])
+        self.assertEqual(results[4]["status"], "error")
+
+        # Extracted results are cached for the next batch
+        self.extractor.extract_many([fridge, pantry], max_workers=2)
+        self.assertEqual(len(self.extractor.calls), 2)
 
-# Create your tests here.
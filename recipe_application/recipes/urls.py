@@ -8,6 +8,7 @@ router.register(r'recipes', views.RecipeViewSet)
 router.register(r'preferences', views.UserPreferenceViewSet, basename='preferences')
 router.register(r'ratings', views.RecipeRatingViewSet)
 router.register(r'auth', views.AuthViewSet, basename='auth')
+router.register(r'profiles', views.ProfileViewSet, basename='profiles')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -0,0 +1,197 @@
+# bulk_writes.py
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from recipes.utils.ingredient_names import canonical_ingredient_name
+from recipes.utils.versioning import CATALOG_VERSION_KEY, bump_version
+from typing import Any, Dict, Iterable, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchedQuerySet:
+    """
+    Stands in for a PrimaryKeyRelatedField's queryset during bulk
+    validation, answering each item's ``get(pk=...)`` from one ``in_bulk``.
+    """
+
+    def __init__(self, queryset, values: Iterable[Any]):
+        self.model = queryset.model
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.model._meta.pk.to_python(value))
+            except DjangoValidationError:
+                pass
+        self._objects = queryset.in_bulk(pks)
+
+    def get(self, pk):
+        try:
+            pk = self.model._meta.pk.to_python(pk)
+        except DjangoValidationError:
+            # The field reports it as a value of the wrong type
+            raise ValueError(pk)
+        try:
+            return self._objects[pk]
+        except KeyError:
+            raise self.model.DoesNotExist
+
+
+def validate_items(serializer) -> Tuple[List[Tuple[int, dict]], Dict[int, dict]]:
+    """
+    Validate a ``many=True`` serializer item by item.
+
+    Returns the ``(index, validated_data)`` pairs of the valid items and the
+    errors of the others keyed by index, so one bad item does not reject
+    the whole batch. Each item is validated once, and the objects behind
+    primary-key fields are fetched with one query per field, not per item.
+    """
+    child = serializer.child
+    items = serializer.initial_data
+    for field in child.fields.values():
+        if isinstance(field, PrimaryKeyRelatedField) and not field.read_only:
+            field.queryset = PrefetchedQuerySet(
+                field.get_queryset(),
+                [item.get(field.field_name) for item in items if isinstance(item, dict)],
+            )
+
+    valid, errors = [], {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, child.run_validation(item)))
+        except ValidationError as exc:
+            errors[index] = exc.detail
+    return valid, errors
+
+
+def upsert_ratings(user, items: List[Tuple[int, dict]]) -> Dict[int, dict]:
+    """
+    Create or update a user's ratings in one statement.
+
+    Ratings conflict on (user, recipe); a recipe repeated in the batch keeps
+    its last rating. Aggregates are rebuilt once for the touched recipes.
+    """
+    from recipes.models import RecipeRating
+    from recipes.utils.ratings import rebuild_rating_aggregates
+    from recipes.utils.suggestions import invalidate_suggestion_feed
+
+    latest = {}
+    for index, data in items:
+        latest[data["recipe"].pk] = (index, data)
+    recipe_ids = list(latest)
+
+    with transaction.atomic():
+        existing = set(
+            RecipeRating.objects.filter(user=user, recipe_id__in=recipe_ids)
+            .values_list("recipe_id", flat=True)
+        )
+        RecipeRating.objects.bulk_create(
+            [
+                RecipeRating(
+                    user=user,
+                    recipe_id=recipe_id,
+                    rating=data["rating"],
+                    comment=data.get("comment", ""),
+                )
+                for recipe_id, (_, data) in latest.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "recipe"],
+            update_fields=["rating", "comment", "updated_at"],
+        )
+        rebuild_rating_aggregates(recipe_ids)
+        ids = dict(
+            RecipeRating.objects.filter(user=user, recipe_id__in=recipe_ids)
+            .values_list("recipe_id", "id")
+        )
+
+    # bulk_create skips the signals that keep these caches current
+    bump_version(CATALOG_VERSION_KEY)
+    invalidate_suggestion_feed(user.pk)
+
+    results = {}
+    for index, data in items:
+        recipe_id = data["recipe"].pk
+        if latest[recipe_id][0] != index:
+            results[index] = {"status": "superseded", "by": latest[recipe_id][0]}
+        else:
+            results[index] = {
+                "status": "updated" if recipe_id in existing else "created",
+                "id": ids[recipe_id],
+            }
+    return results
+
+
+def upsert_ingredients(items: List[Tuple[int, dict]]) -> Dict[int, dict]:
+    """Create ingredients, updating the image of those whose name already exists."""
+    from recipes.models import Ingredient
+    from recipes.utils.ingredient_fuzzy import invalidate_fuzzy_index
+    from recipes.utils.ingredient_index import bump_index_version
+
+    latest = {}
+    for index, data in items:
+        latest[data["name"]] = (index, data)
+    names = list(latest)
+
+    with transaction.atomic():
+        existing = set(Ingredient.objects.filter(name__in=names).values_list("name", flat=True))
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(
+                    name=name,
+                    canonical_name=canonical_ingredient_name(name),
+                    image_url=data.get("image_url", ""),
+                )
+                for name, (_, data) in latest.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=["image_url", "updated_at"],
+        )
+        ids = dict(Ingredient.objects.filter(name__in=names).values_list("name", "id"))
+
+    bump_index_version()
+    bump_version(CATALOG_VERSION_KEY)
+    invalidate_fuzzy_index()
+
+    results = {}
+    for index, data in items:
+        name = data["name"]
+        if latest[name][0] != index:
+            results[index] = {"status": "superseded", "by": latest[name][0]}
+        else:
+            results[index] = {
+                "status": "updated" if name in existing else "created",
+                "id": ids[name],
+            }
+    return results
+
+
+def bulk_response(results: Dict[int, dict], errors: Dict[int, dict]):
+    """Per-item statuses in request order; 207 when only some items were written."""
+    items = []
+    for index in sorted({*results, *errors}):
+        if index in errors:
+            items.append({"index": index, "status": "invalid", "errors": errors[index]})
+        else:
+            items.append({"index": index, **results[index]})
+
+    if not results:
+        response_status = status.HTTP_400_BAD_REQUEST
+    elif errors:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_200_OK
+    return Response(
+        {
+            "results": items,
+            "created": sum(item["status"] == "created" for item in items),
+            "updated": sum(item["status"] == "updated" for item in items),
+            "invalid": len(errors),
+        },
+        status=response_status,
+    )
@@ -0,0 +1,414 @@
+# catalog_import.py
+import csv
+import json
+import time
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from recipes.utils.ingredient_names import canonical_ingredient_name
+from recipes.utils.recipe_writes import delete_without_signals
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+RECORD_TYPES = ("recipe", "ingredient", "substitution")
+
+# CSV cells that carry JSON documents
+JSON_COLUMNS = ("ingredients", "dietary_restrictions", "nutrients")
+
+# Stay under SQLite's bound-parameter limit in IN (...) lookups
+LOOKUP_CHUNK = 500
+
+# Skipped records kept with their messages; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportRecordError(ValueError):
+    pass
+
+
+def _chunks(values: List, size: int = LOOKUP_CHUNK) -> Iterator[List]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def read_records(stream: TextIO, input_format: str, record_type: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Yield ``(line_number, record)`` pairs one at a time.
+
+    JSON Lines records may set their own ``type``. CSV rows all take
+    ``record_type``, empty cells are treated as missing and the JSON columns
+    are decoded.
+    """
+    if input_format == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ImportRecordError(f"invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                yield line_number, ImportRecordError("record must be a JSON object")
+                continue
+            record.setdefault("type", record_type)
+            yield line_number, record
+        return
+
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        record = {key: value for key, value in row.items() if value not in ("", None)}
+        try:
+            for column in JSON_COLUMNS:
+                if column in record:
+                    record[column] = json.loads(record[column])
+        except json.JSONDecodeError as e:
+            yield line_number, ImportRecordError(f"invalid JSON in column: {e}")
+            continue
+        record["type"] = record_type
+        yield line_number, record
+
+
+class CatalogImporter:
+    """
+    Bulk-load recipes, ingredients and substitutions.
+
+    Records are buffered and written ``batch_size`` at a time, one
+    transaction per batch, with ``bulk_create``/``bulk_update``. Ingredient
+    names resolve through an in-memory canonical-name map loaded once, and
+    names not in the catalog are created on the way. In upsert mode recipes
+    are matched by title, ingredients by name and substitutions by their
+    ingredient pair; matched recipes get their ingredient rows replaced.
+
+    Bulk writes skip model signals: each batch is reindexed for search and
+    bumps the catalog versions once, and callers must run ``finish()``
+    afterwards for the rest of what those signals would have done. Only the
+    first ``MAX_REPORTED_ERRORS`` skipped records are kept in ``errors``;
+    ``counts["skipped"]`` counts them all.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        upsert: bool = False,
+        progress: Optional[Callable[[dict], None]] = None,
+    ):
+        from recipes.models import Ingredient, IngredientAlias, Recipe
+
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.progress = progress
+        self.started = time.perf_counter()
+        self.counts = {
+            "recipes_created": 0,
+            "recipes_updated": 0,
+            "recipe_ingredients": 0,
+            "ingredients_created": 0,
+            "ingredients_updated": 0,
+            "substitutions_created": 0,
+            "substitutions_updated": 0,
+            "skipped": 0,
+        }
+        self.errors: List[Tuple[int, str]] = []
+        self._buffers: Dict[str, List[Tuple[int, dict]]] = {kind: [] for kind in RECORD_TYPES}
+
+        self.recipe_fields = {
+            field.name: field
+            for field in Recipe._meta.concrete_fields
+            if field.editable and not field.primary_key
+            and field.name not in ("created_at", "updated_at")
+        }
+        self.ingredient_ids: Dict[str, int] = dict(
+            Ingredient.objects.values_list("canonical_name", "id")
+        )
+        self.ingredient_ids.update(IngredientAlias.objects.values_list("alias", "ingredient_id"))
+
+    # Record conversion
+
+    def _recipe_values(self, record: dict) -> dict:
+        values = {}
+        for name, field in self.recipe_fields.items():
+            if name in record and record[name] is not None:
+                value = record[name]
+                if field.get_internal_type() == "BooleanField" and isinstance(value, str):
+                    value = value.strip().lower() in ("1", "true", "t", "yes", "y")
+                values[name] = field.clean(value, None)
+            elif field.has_default() or field.blank or field.null:
+                values[name] = field.get_default()
+            else:
+                raise ImportRecordError(f"missing required field '{name}'")
+        if not values.get("total_time"):
+            values["total_time"] = values["preparation_time"] + values["cooking_time"]
+        return values
+
+    def _ingredient_rows(self, record: dict) -> List[dict]:
+        rows = record.get("ingredients") or []
+        if not isinstance(rows, list):
+            raise ImportRecordError("'ingredients' must be a list")
+        normalized = []
+        for row in rows:
+            if isinstance(row, str):
+                row = {"name": row}
+            if not isinstance(row, dict) or not row.get("name"):
+                raise ImportRecordError("each ingredient needs a 'name'")
+            normalized.append({
+                "name": str(row["name"]).strip(),
+                "quantity": str(row.get("quantity", "")),
+                "unit": str(row.get("unit", "")),
+            })
+        return normalized
+
+    # Ingredient resolution
+
+    def _resolve_ingredient_names(
+        self, names: Iterable[str], image_urls: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Make sure every name maps to an ingredient id, creating the missing ones."""
+        from recipes.models import Ingredient
+
+        image_urls = image_urls or {}
+        missing = {}
+        for name in names:
+            canonical = canonical_ingredient_name(name)
+            if canonical not in self.ingredient_ids:
+                missing.setdefault(canonical, name)
+        if not missing:
+            return
+
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, canonical_name=canonical, image_url=image_urls.get(name, ""))
+                for canonical, name in missing.items()
+            ],
+            ignore_conflicts=True,
+        )
+        canonicals = list(missing)
+        for chunk in _chunks(canonicals):
+            self.ingredient_ids.update(
+                Ingredient.objects.filter(canonical_name__in=chunk).values_list("canonical_name", "id")
+            )
+        self.counts["ingredients_created"] += len(missing)
+
+    def ingredient_id(self, name: str) -> int:
+        return self.ingredient_ids[canonical_ingredient_name(name)]
+
+    # Batch writers
+
+    def _write_ingredients(self, batch: List[Tuple[int, dict]]) -> None:
+        from recipes.models import Ingredient
+
+        rows = {}
+        for line_number, record in batch:
+            name = str(record.get("name", "")).strip()
+            if not name:
+                self._skip(line_number, "missing required field 'name'")
+                continue
+            rows[name] = record.get("image_url", "")
+
+        existing = {
+            self.ingredient_id(name): image_url
+            for name, image_url in rows.items()
+            if canonical_ingredient_name(name) in self.ingredient_ids
+        }
+        self._resolve_ingredient_names(rows, image_urls=rows)
+        if self.upsert and existing:
+            now = timezone.now()
+            Ingredient.objects.bulk_update(
+                [
+                    Ingredient(pk=pk, image_url=image_url, updated_at=now)
+                    for pk, image_url in existing.items()
+                ],
+                ["image_url", "updated_at"],
+            )
+            self.counts["ingredients_updated"] += len(existing)
+
+    def _write_recipes(self, batch: List[Tuple[int, dict]]) -> List[int]:
+        from recipes.models import Recipe, RecipeIngredient
+
+        # Keyed by title so a title repeated within a batch is written once
+        prepared: Dict[str, Tuple[dict, List[dict]]] = {}
+        for line_number, record in batch:
+            try:
+                values = self._recipe_values(record)
+                ingredients = self._ingredient_rows(record)
+            except ValidationError as e:
+                self._skip(line_number, "; ".join(e.messages))
+                continue
+            except (ImportRecordError, TypeError, ValueError) as e:
+                self._skip(line_number, str(e))
+                continue
+            key = values["title"] if self.upsert else len(prepared)
+            prepared[key] = (values, ingredients)
+
+        self._resolve_ingredient_names(
+            row["name"] for _, ingredients in prepared.values() for row in ingredients
+        )
+
+        existing = {}
+        if self.upsert:
+            for chunk in _chunks(list(prepared)):
+                existing.update(Recipe.objects.filter(title__in=chunk).values_list("title", "id"))
+
+        now = timezone.now()
+        to_create, to_update, written = [], [], []
+        for key, (values, ingredients) in prepared.items():
+            if key in existing:
+                recipe = Recipe(pk=existing[key], updated_at=now, **values)
+                to_update.append(recipe)
+            else:
+                recipe = Recipe(**values)
+                to_create.append(recipe)
+            written.append((recipe, ingredients))
+
+        Recipe.objects.bulk_create(to_create)
+        if to_update:
+            Recipe.objects.bulk_update(to_update, [*self.recipe_fields, "updated_at"])
+            # One DELETE per chunk without per-row signals; flush() reindexes
+            # and bumps the versions once for the whole batch
+            delete_without_signals(
+                RecipeIngredient, "recipe", [recipe.pk for recipe in to_update]
+            )
+
+        recipe_ingredients = []
+        for recipe, ingredients in written:
+            by_ingredient = {}
+            for row in ingredients:
+                by_ingredient[self.ingredient_id(row["name"])] = row
+            recipe_ingredients.extend(
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    quantity=row["quantity"],
+                    unit=row["unit"],
+                )
+                for ingredient_id, row in by_ingredient.items()
+            )
+        RecipeIngredient.objects.bulk_create(recipe_ingredients, batch_size=self.batch_size)
+
+        self.counts["recipes_created"] += len(to_create)
+        self.counts["recipes_updated"] += len(to_update)
+        self.counts["recipe_ingredients"] += len(recipe_ingredients)
+        return [recipe.pk for recipe, _ in written]
+
+    def _write_substitutions(self, batch: List[Tuple[int, dict]]) -> None:
+        from recipes.models import Substitution
+
+        rows = {}
+        for line_number, record in batch:
+            try:
+                ratio = float(record["ratio"])
+                pair = (str(record["ingredient"]).strip(), str(record["substitute"]).strip())
+            except KeyError as e:
+                self._skip(line_number, f"missing required field {e}")
+                continue
+            except (TypeError, ValueError) as e:
+                self._skip(line_number, str(e))
+                continue
+            rows[pair] = (ratio, record.get("notes"))
+
+        self._resolve_ingredient_names(name for pair in rows for name in pair)
+        by_ids = {
+            (self.ingredient_id(ingredient), self.ingredient_id(substitute)): values
+            for (ingredient, substitute), values in rows.items()
+        }
+
+        existing = {}
+        if self.upsert:
+            ingredient_ids = list({ingredient_id for ingredient_id, _ in by_ids})
+            for chunk in _chunks(ingredient_ids):
+                for pk, ingredient_id, substitute_id in Substitution.objects.filter(
+                    ingredient_id__in=chunk
+                ).values_list("id", "ingredient_id", "substitute_id"):
+                    if (ingredient_id, substitute_id) in by_ids:
+                        existing[(ingredient_id, substitute_id)] = pk
+
+        to_create, to_update = [], []
+        for (ingredient_id, substitute_id), (ratio, notes) in by_ids.items():
+            substitution = Substitution(
+                pk=existing.get((ingredient_id, substitute_id)),
+                ingredient_id=ingredient_id,
+                substitute_id=substitute_id,
+                ratio=ratio,
+                notes=notes,
+            )
+            (to_update if substitution.pk else to_create).append(substitution)
+
+        Substitution.objects.bulk_create(to_create)
+        if to_update:
+            Substitution.objects.bulk_update(to_update, ["ratio", "notes"])
+        self.counts["substitutions_created"] += len(to_create)
+        self.counts["substitutions_updated"] += len(to_update)
+
+    # Driving
+
+    def _skip(self, line_number: int, message: str) -> None:
+        self.counts["skipped"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_number, message))
+        logger.warning("Skipping record on line %d: %s", line_number, message)
+
+    def add(self, line_number: int, record) -> None:
+        if isinstance(record, Exception):
+            self._skip(line_number, str(record))
+            return
+        record_type = record.get("type")
+        if record_type not in RECORD_TYPES:
+            self._skip(line_number, f"unknown record type {record_type!r}")
+            return
+        self._buffers[record_type].append((line_number, record))
+        if sum(len(buffer) for buffer in self._buffers.values()) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        from recipes.utils.search import get_search_backend
+
+        buffers = self._buffers
+        self._buffers = {kind: [] for kind in RECORD_TYPES}
+        with transaction.atomic():
+            # Ingredients first: the other record types refer to them by name
+            if buffers["ingredient"]:
+                self._write_ingredients(buffers["ingredient"])
+            recipe_ids = self._write_recipes(buffers["recipe"]) if buffers["recipe"] else []
+            if buffers["substitution"]:
+                self._write_substitutions(buffers["substitution"])
+            backend = get_search_backend()
+            for chunk in _chunks(recipe_ids):
+                backend.index_recipes(chunk)
+        # Readers pick up each committed batch rather than waiting for the end
+        self._bump_versions()
+
+        if self.progress:
+            self.progress(self.summary())
+
+    def run(self, records: Iterable[Tuple[int, dict]]) -> dict:
+        for line_number, record in records:
+            self.add(line_number, record)
+        self.flush()
+        self.finish()
+        return self.summary()
+
+    def _bump_versions(self) -> None:
+        from recipes.utils.ingredient_index import bump_index_version
+        from recipes.utils.versioning import CATALOG_VERSION_KEY, bump_version
+
+        bump_index_version()
+        bump_version(CATALOG_VERSION_KEY)
+
+    def finish(self) -> None:
+        """Do what the skipped post_save signals would have done."""
+        from recipes.utils.ingredient_fuzzy import invalidate_fuzzy_index
+
+        self._bump_versions()
+        if self.counts["ingredients_created"] or self.counts["ingredients_updated"]:
+            invalidate_fuzzy_index()
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        recipes = self.counts["recipes_created"] + self.counts["recipes_updated"]
+        return {
+            **self.counts,
+            "elapsed_s": round(elapsed, 2),
+            "recipes_per_s": round(recipes / elapsed, 1) if elapsed else None,
+        }
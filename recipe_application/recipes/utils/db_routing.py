@@ -0,0 +1,137 @@
+# db_routing.py
+import contextvars
+import random
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, connections
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE_NAME = "db_sticky"
+# Echoed back by clients that do not send cookies (JWT API clients, the
+# cross-origin frontend)
+STICKY_HEADER = "X-DB-Sticky"
+STICKY_SALT = "recipes.db_routing.sticky"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Routing state of the current request: {"replica_reads": bool, "wrote": bool}.
+# A dict rather than two variables so the router's updates reach the
+# middleware even when the view runs in a copied context.
+_request_state = contextvars.ContextVar("db_routing_state", default=None)
+
+
+def _sticky_signer() -> signing.TimestampSigner:
+    return signing.TimestampSigner(salt=STICKY_SALT)
+
+
+def _is_sticky(request) -> bool:
+    """Whether the client wrote within the last REPLICA_STICKY_SECONDS."""
+    header = "HTTP_" + STICKY_HEADER.upper().replace("-", "_")
+    for value in (request.COOKIES.get(STICKY_COOKIE_NAME), request.META.get(header)):
+        if not value:
+            continue
+        try:
+            _sticky_signer().unsign(value, max_age=settings.REPLICA_STICKY_SECONDS)
+        except signing.BadSignature:
+            continue
+        return True
+    return False
+
+
+def pin_to_primary() -> None:
+    """Send the rest of the current request's reads to the primary."""
+    state = _request_state.get()
+    if state is not None:
+        state["replica_reads"] = False
+        state["wrote"] = True
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to the primary; reads go to a random replica from
+    DATABASE_REPLICAS, but only for requests that ReplicaRoutingMiddleware
+    marked as read-only.
+
+    Everything else reads from the primary: management commands, background
+    threads, other requests, reads inside a transaction on the primary and
+    any read after the request has written.
+    """
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        state = _request_state.get()
+        if (
+            state is None
+            or not state["replica_reads"]
+            or not settings.DATABASE_REPLICAS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints) -> str:
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool:
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let read-only requests read from replicas, with read-your-writes
+    stickiness.
+
+    A request is read-only if its method is safe or its viewset lists the
+    action in ``replica_read_actions`` (e.g. a search sent as POST). The
+    response to a request that wrote carries a signed token, both as a
+    cookie and in the STICKY_HEADER response header, and for
+    REPLICA_STICKY_SECONDS after it was issued a client that sends either
+    back reads from the primary, so it never sees a replica that has not
+    caught up with its own write.
+
+    The state travels with the client rather than living in any one
+    worker, and clients sharing an address do not pin each other.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {
+            "replica_reads": request.method in SAFE_METHODS and not _is_sticky(request),
+            "wrote": False,
+        }
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state["wrote"]:
+            sticky = _sticky_signer().sign("1")
+            response[STICKY_HEADER] = sticky
+            response.set_cookie(
+                STICKY_COOKIE_NAME,
+                sticky,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _request_state.get()
+        if state is None or state["wrote"] or request.method in SAFE_METHODS:
+            return None
+        actions = getattr(view_func, "actions", None) or {}
+        view_class = getattr(view_func, "cls", None)
+        read_actions = getattr(view_class, "replica_read_actions", ())
+        if actions.get(request.method.lower()) in read_actions:
+            state["replica_reads"] = not _is_sticky(request)
+        return None
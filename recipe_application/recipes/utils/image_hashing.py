@@ -0,0 +1,183 @@
+# image_hashing.py
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from PIL import Image
+from recipes.utils.scan_store import TwoTierResultStore
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    64-bit difference hash: one bit per horizontally adjacent pixel pair of a
+    9x8 grayscale thumbnail. Re-compression and resizing flip few bits.
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes under Hamming distance."""
+
+    def __init__(self):
+        self.root: Optional[Tuple[int, Dict[int, tuple]]] = None
+        self.size = 0
+
+    def add(self, value: int) -> None:
+        if self.root is None:
+            self.root = (value, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """All ``(distance, hash)`` pairs within ``max_distance``, closest first."""
+        if self.root is None:
+            return []
+        results = []
+        stack = [self.root]
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                results.append((distance, node_value))
+            for child_distance, child in children.items():
+                # Triangle inequality prunes every subtree that cannot match
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(results)
+
+
+class PerceptualScanCache:
+    """
+    Scan-result cache keyed by perceptual hash.
+
+    Results live in a two-tier store under their exact hash: a per-process
+    LRU backed by a SQLite file every worker on the host shares, so exact
+    repeats hit from any process and across restarts. Each process also
+    indexes known hashes in BK-trees to find near-duplicates within
+    ``INGREDIENT_SCAN_HASH_DISTANCE`` bits. Every
+    ``INGREDIENT_SCAN_HASH_SYNC_INTERVAL`` seconds the index picks up the
+    hashes other workers wrote to the store since the last sync.
+
+    BK-trees cannot drop single entries, so the index keeps two generations
+    of at most half of ``INGREDIENT_SCAN_HASH_INDEX_SIZE`` each: when the
+    current one fills up the previous one is discarded and the current one
+    takes its place, so only the oldest hashes are forgotten.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._tree = BKTree()
+        self._previous_tree = BKTree()
+        self._next_sync = 0.0
+        # Expiry of the newest store row the index has seen
+        self._synced_until = 0.0
+        self.store = TwoTierResultStore()
+        self._exact_hits = 0
+        self._near_hits = 0
+        self._misses = 0
+        self._hit_distances = Counter()
+
+    def _index(self, image_hash: int) -> None:
+        # Caller holds self._lock
+        if self._tree.size >= max(1, settings.INGREDIENT_SCAN_HASH_INDEX_SIZE // 2):
+            self._previous_tree, self._tree = self._tree, BKTree()
+        self._tree.add(image_hash)
+
+    def _sync_tree(self) -> None:
+        if time.monotonic() < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = time.monotonic() + settings.INGREDIENT_SCAN_HASH_SYNC_INTERVAL
+            rows = self.store.l2.hashes_since(
+                self._synced_until, settings.INGREDIENT_SCAN_HASH_INDEX_SIZE
+            )
+            with self._lock:
+                for image_hash, expires_at in rows:
+                    self._index(image_hash)
+                    self._synced_until = max(self._synced_until, expires_at)
+        except Exception:
+            logger.exception("Could not sync the perceptual hash index")
+        finally:
+            self._sync_lock.release()
+
+    def get(self, image_hash: int) -> Optional[List[str]]:
+        self._sync_tree()
+        cached = self.store.get(image_hash)
+        if cached:
+            with self._lock:
+                self._exact_hits += 1
+                self._hit_distances[0] += 1
+            return cached
+
+        max_distance = settings.INGREDIENT_SCAN_HASH_DISTANCE
+        with self._lock:
+            candidates = sorted(
+                self._tree.search(image_hash, max_distance)
+                + self._previous_tree.search(image_hash, max_distance)
+            )
+
+        for distance, candidate in candidates:
+            if distance == 0:
+                continue
+            cached = self.store.get(candidate)
+            if cached:
+                with self._lock:
+                    self._near_hits += 1
+                    self._hit_distances[distance] += 1
+                return cached
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, image_hash: int, ingredients: List[str]) -> None:
+        self.store.set(image_hash, ingredients)
+        with self._lock:
+            self._index(image_hash)
+
+    def stats(self) -> dict:
+        store_stats = self.store.stats()
+        with self._lock:
+            lookups = self._exact_hits + self._near_hits + self._misses
+            return {
+                "exact_hits": self._exact_hits,
+                "near_hits": self._near_hits,
+                "misses": self._misses,
+                "hit_rate": (
+                    (self._exact_hits + self._near_hits) / lookups if lookups else None
+                ),
+                "hit_distances": dict(sorted(self._hit_distances.items())),
+                "max_distance": settings.INGREDIENT_SCAN_HASH_DISTANCE,
+                "indexed_hashes": self._tree.size + self._previous_tree.size,
+                "store": store_stats,
+            }
+
+
+scan_cache = PerceptualScanCache()
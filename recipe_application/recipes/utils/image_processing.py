@@ -2,14 +2,81 @@
 import google.generativeai as genai
 from PIL import Image
 import io
-import hashlib
-from django.core.cache import cache
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from recipes.utils.image_hashing import dhash, scan_cache
 from typing import List, Optional, Dict, Union
 import logging
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_FORMATS = ["JPEG", "PNG", "JPG"]
+
+
+class ImagePreprocessingError(ValueError):
+    pass
+
+
+def preprocess_image(image_data: bytes) -> tuple[bytes, int, Dict[str, float]]:
+    """
+    Decode an upload once, shrink it, hash it and re-encode it as a compact
+    JPEG.
+
+    Oversized payloads are rejected before any decoding. JPEGs are decoded
+    in draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8 while
+    decoding instead of materializing the full-resolution bitmap.
+
+    Returns the encoded bytes, the perceptual hash and per-stage
+    timings/sizes.
+    """
+    max_bytes = settings.INGREDIENT_SCAN_MAX_UPLOAD_BYTES
+    if len(image_data) > max_bytes:
+        raise ImagePreprocessingError(
+            f"Image size exceeds {max_bytes // (1024 * 1024)}MB limit"
+        )
+
+    stats = {"bytes_in": len(image_data)}
+    max_edge = settings.INGREDIENT_SCAN_MAX_EDGE
+
+    start = time.perf_counter()
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        if img.format not in SUPPORTED_FORMATS:
+            raise ImagePreprocessingError(f"Unsupported image format: {img.format}")
+        if img.format == "JPEG":
+            img.draft("RGB", (max_edge, max_edge))
+        img.load()
+    except ImagePreprocessingError:
+        raise
+    except Exception as e:
+        raise ImagePreprocessingError(f"Image validation failed: {str(e)}")
+    stats["decode_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_edge, max_edge), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    stats["resize_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    image_hash = dhash(img)
+    stats["hash_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    output = io.BytesIO()
+    img.save(
+        output,
+        format="JPEG",
+        quality=settings.INGREDIENT_SCAN_JPEG_QUALITY,
+        optimize=True,
+    )
+    stats["encode_ms"] = (time.perf_counter() - start) * 1000
+    stats["bytes_out"] = output.tell()
+    stats["width"], stats["height"] = img.size
+
+    return output.getvalue(), image_hash, stats
+
 
 class IngredientExtractor:
     def __init__(self):
@@ -17,96 +84,84 @@ class IngredientExtractor:
             genai.configure(api_key=settings.GEMINI_API_KEY)
             self.model = genai.GenerativeModel("gemini-1.5-flash")
         except Exception as e:
-            logger.error(f"Failed to initialize Gemini API: {str(e)}")
+            logger.error("Failed to initialize Gemini API: %s", e)
             raise RuntimeError(f"Gemini API initialization failed: {str(e)}")
 
-    def _get_image_hash(self, image_data: bytes) -> str:
-        """Generate a hash for the image data to use as cache key."""
-        return hashlib.md5(image_data).hexdigest()
-
-    def _validate_image(self, image_data: bytes) -> tuple[bool, str]:
-        """Validate image format and size."""
-        try:
-            img = Image.open(io.BytesIO(image_data))
-
-            # Check file size
-            if len(image_data) > 4 * 1024 * 1024:
-                return False, "Image size exceeds 4MB limit"
+    def _generate(
+        self, jpeg_data: bytes, stats: Dict[str, float]
+    ) -> Dict[str, Union[List[str], str, None]]:
+        """Send a preprocessed image to Gemini and parse the ingredient list."""
+        # Prepare the prompt
+        prompt = """
+        Please analyze this image and list only the visible food ingredients.
+        Format the response as a simple comma-separated list of ingredients.
+        Only include clearly visible ingredients.
+        """
+
+        # Process image with Gemini
+        start = time.perf_counter()
+        response = self.model.generate_content(
+            [prompt, {"mime_type": "image/jpeg", "data": jpeg_data}]
+        )
+        stats["model_ms"] = (time.perf_counter() - start) * 1000
+        logger.debug("Ingredient scan stages: %s", stats)
+
+        if not response or not response.text:
+            logger.error("Gemini API returned empty response")
+            return {
+                "status": "error",
+                "ingredients": None,
+                "error": "Failed to extract ingredients from image",
+            }
 
-            # Check image format
-            if img.format not in ["JPEG", "PNG", "JPG"]:
-                return False, f"Unsupported image format: {img.format}"
+        # Parse response
+        ingredients = [
+            ingredient.strip().lower()
+            for ingredient in response.text.split(",")
+            if ingredient.strip()
+        ]
 
-            # Convert to RGB if needed
-            if img.mode != "RGB":
-                img = img.convert("RGB")
+        if not ingredients:
+            return {
+                "status": "error",
+                "ingredients": None,
+                "error": "No ingredients detected in the image",
+            }
 
-            return True, "Image validation successful"
-        except Exception as e:
-            return False, f"Image validation failed: {str(e)}"
+        return {"status": "success", "ingredients": ingredients, "error": None}
 
     def extract_ingredients(
         self, image_data: bytes
     ) -> Dict[str, Union[List[str], str, None]]:
         """Extract ingredients from image with detailed error handling."""
         try:
-            # Check cache first
-            image_hash = self._get_image_hash(image_data)
-            cached_result = cache.get(f"ingredient_scan_{image_hash}")
-            if cached_result:
-                return {
-                    "status": "success",
-                    "ingredients": cached_result,
-                    "error": None,
-                }
-
-            # Validate image
-            is_valid, validation_message = self._validate_image(image_data)
-            if not is_valid:
-                logger.error(f"Image validation failed: {validation_message}")
+            # Validate, downscale, hash and re-encode the image in one decode
+            try:
+                jpeg_data, image_hash, stats = preprocess_image(image_data)
+            except ImagePreprocessingError as e:
+                logger.error("Image validation failed: %s", e)
                 return {
                     "status": "error",
                     "ingredients": None,
-                    "error": validation_message,
+                    "error": str(e),
                 }
 
-            # Prepare the prompt
-            prompt = """
-            Please analyze this image and list only the visible food ingredients.
-            Format the response as a simple comma-separated list of ingredients.
-            Only include clearly visible ingredients.
-            """
-
-            # Process image with Gemini
-            img = Image.open(io.BytesIO(image_data))
-            response = self.model.generate_content([prompt, img])
-
-            if not response or not response.text:
-                logger.error("Gemini API returned empty response")
+            # Check cache for this image or a near-duplicate of it
+            cached_result = scan_cache.get(image_hash)
+            if cached_result:
                 return {
-                    "status": "error",
-                    "ingredients": None,
-                    "error": "Failed to extract ingredients from image",
+                    "status": "success",
+                    "ingredients": cached_result,
+                    "error": None,
                 }
 
-            # Parse response
-            ingredients = [
-                ingredient.strip().lower()
-                for ingredient in response.text.split(",")
-                if ingredient.strip()
-            ]
-
-            if not ingredients:
-                return {
-                    "status": "error",
-                    "ingredients": None,
-                    "error": "No ingredients detected in the image",
-                }
+            result = self._generate(jpeg_data, stats)
 
-            # Cache the result for 24 hours
-            cache.set(f"ingredient_scan_{image_hash}", ingredients, timeout=86400)
+            # Cache the result under the image's perceptual hash
+            if result["status"] == "success":
+                scan_cache.set(image_hash, result["ingredients"])
 
-            return {"status": "success", "ingredients": ingredients, "error": None}
+            return result
 
         except Exception as e:
             logger.exception("Error in ingredient extraction:")
@@ -115,3 +170,65 @@ class IngredientExtractor:
                 "ingredients": None,
                 "error": f"Ingredient extraction failed: {str(e)}",
             }
+
+    def extract_many(
+        self, images: List[bytes], max_workers: int
+    ) -> List[Dict[str, Union[List[str], str, int, None]]]:
+        """
+        Extract ingredients from several images at once.
+
+        Every image is preprocessed and hashed first. Images with the same
+        perceptual hash are sent once, cache lookups happen for the whole
+        batch up front, and the remaining misses are extracted concurrently
+        on at most ``max_workers`` threads. Results are returned in input
+        order; duplicates carry ``duplicate_of`` with the index they reuse.
+        """
+        results: List[Optional[dict]] = [None] * len(images)
+        first_index_by_hash: Dict[int, int] = {}
+        pending: Dict[int, tuple] = {}
+
+        for index, image_data in enumerate(images):
+            try:
+                jpeg_data, image_hash, stats = preprocess_image(image_data)
+            except ImagePreprocessingError as e:
+                results[index] = {"status": "error", "ingredients": None, "error": str(e)}
+                continue
+
+            if image_hash in first_index_by_hash:
+                results[index] = {"duplicate_of": first_index_by_hash[image_hash]}
+                continue
+            first_index_by_hash[image_hash] = index
+
+            cached_result = scan_cache.get(image_hash)
+            if cached_result:
+                results[index] = {"status": "success", "ingredients": cached_result, "error": None}
+            else:
+                pending[index] = (jpeg_data, image_hash, stats)
+
+        def generate(index: int) -> dict:
+            jpeg_data, image_hash, stats = pending[index]
+            try:
+                result = self._generate(jpeg_data, stats)
+            except Exception as e:
+                logger.exception("Error in ingredient extraction:")
+                return {
+                    "status": "error",
+                    "ingredients": None,
+                    "error": f"Ingredient extraction failed: {str(e)}",
+                }
+            if result["status"] == "success":
+                scan_cache.set(image_hash, result["ingredients"])
+            return result
+
+        if pending:
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(max_workers, len(pending))),
+                thread_name_prefix="ingredient-scan-batch",
+            ) as executor:
+                for index, result in zip(pending, executor.map(generate, pending)):
+                    results[index] = result
+
+        for index, result in enumerate(results):
+            if "duplicate_of" in result:
+                results[index] = {**results[result["duplicate_of"]], **result}
+        return results
@@ -0,0 +1,151 @@
+# ingredient_fuzzy.py
+import threading
+import numpy as np
+from django.conf import settings
+from typing import Dict, List, Optional
+from recipes.utils.ingredient_names import canonical_ingredient_name
+from recipes.utils.versioning import bump_version, get_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+FUZZY_INDEX_VERSION_KEY = "ingredient_fuzzy_index_version"
+
+
+def trigrams(name: str) -> set:
+    """Word trigrams padded like pg_trgm: "onion" -> "  o", " on", ..., "on "."""
+    grams = set()
+    for word in name.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def invalidate_fuzzy_index() -> None:
+    bump_version(FUZZY_INDEX_VERSION_KEY)
+
+
+class FuzzySnapshot:
+    """
+    One immutable build of the trigram index over canonical ingredient names.
+
+    A lookup adds one to every ingredient sharing each of the term's
+    trigrams, then scores all ingredients at once with the Jaccard
+    similarity ``shared / (term + ingredient - shared)``.
+    """
+
+    __slots__ = ("version", "ingredient_ids", "ingredient_names", "trigram_counts", "postings")
+
+    def __init__(self, version=None, ingredient_ids=None, ingredient_names=None,
+                 trigram_counts=None, postings=None):
+        self.version = version
+        self.ingredient_ids = (
+            ingredient_ids if ingredient_ids is not None else np.empty(0, dtype=np.int64)
+        )
+        self.ingredient_names: List[str] = ingredient_names or []
+        self.trigram_counts = (
+            trigram_counts if trigram_counts is not None else np.empty(0, dtype=np.int32)
+        )
+        self.postings: Dict[str, np.ndarray] = postings or {}
+
+    @classmethod
+    def build(cls, version: str) -> "FuzzySnapshot":
+        from recipes.models import Ingredient
+
+        ids, names, counts = [], [], []
+        postings: Dict[str, List[int]] = {}
+        rows = Ingredient.objects.order_by("id").values_list("id", "name", "canonical_name")
+        for position, (ingredient_id, name, canonical_name) in enumerate(
+            rows.iterator(chunk_size=2000)
+        ):
+            grams = trigrams(canonical_name)
+            ids.append(ingredient_id)
+            names.append(name)
+            counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+
+        logger.info(
+            "Built ingredient fuzzy index: %d ingredients, %d trigrams",
+            len(ids),
+            len(postings),
+        )
+        return cls(
+            version=version,
+            ingredient_ids=np.array(ids, dtype=np.int64),
+            ingredient_names=names,
+            trigram_counts=np.array(counts, dtype=np.int32),
+            postings={
+                gram: np.array(positions, dtype=np.int64)
+                for gram, positions in postings.items()
+            },
+        )
+
+    def lookup(
+        self, term: str, limit: int = 3, min_similarity: Optional[float] = None
+    ) -> List[Dict[str, object]]:
+        """Best ``limit`` ingredients for ``term`` as ``{"id", "name", "similarity"}``."""
+        if min_similarity is None:
+            min_similarity = settings.INGREDIENT_FUZZY_MIN_SIMILARITY
+
+        grams = trigrams(canonical_ingredient_name(term))
+        if limit < 1 or not grams or not len(self.ingredient_ids):
+            return []
+
+        shared = np.zeros(len(self.ingredient_ids), dtype=np.int32)
+        for gram in grams:
+            positions = self.postings.get(gram)
+            if positions is not None:
+                shared[positions] += 1
+
+        candidates = np.flatnonzero(shared)
+        if not len(candidates):
+            return []
+        scores = shared[candidates] / (
+            len(grams) + self.trigram_counts[candidates] - shared[candidates]
+        )
+        keep = scores >= min_similarity
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[best], scores[best]
+        order = np.lexsort((candidates, -scores))
+
+        return [
+            {
+                "id": int(self.ingredient_ids[candidates[i]]),
+                "name": self.ingredient_names[candidates[i]],
+                "similarity": round(float(scores[i]), 3),
+            }
+            for i in order
+        ]
+
+
+class IngredientFuzzyIndex:
+    """
+    Process-wide holder of the current FuzzySnapshot, rebuilt off to the
+    side and published with one assignment when ingredients change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = FuzzySnapshot()
+
+    def snapshot(self) -> FuzzySnapshot:
+        """The current snapshot, rebuilt first if ingredients changed since."""
+        version = get_version(FUZZY_INDEX_VERSION_KEY)
+        snapshot = self._snapshot
+        if snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot.version != version:
+                    snapshot = self._snapshot = FuzzySnapshot.build(version)
+        return snapshot
+
+    def lookup(
+        self, term: str, limit: int = 3, min_similarity: Optional[float] = None
+    ) -> List[Dict[str, object]]:
+        return self.snapshot().lookup(term, limit=limit, min_similarity=min_similarity)
+
+
+ingredient_fuzzy_index = IngredientFuzzyIndex()
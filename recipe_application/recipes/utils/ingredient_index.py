@@ -0,0 +1,230 @@
+# ingredient_index.py
+import threading
+import numpy as np
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from recipes.utils.ingredient_names import canonical_ingredient_name
+from recipes.utils.versioning import bump_version, get_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_KEY = "ingredient_index_version"
+
+
+def get_index_version() -> str:
+    return get_version(INDEX_VERSION_KEY)
+
+
+def bump_index_version() -> None:
+    """Mark every process' index as stale after a catalog write."""
+    bump_version(INDEX_VERSION_KEY)
+
+
+class IndexSnapshot:
+    """
+    One immutable build of the ingredient match index.
+
+    Recipes are addressed by their position in ``recipe_ids``; each posting
+    list is a NumPy array of those positions, so scoring a pantry is one
+    indexed increment per pantry item followed by a single vectorized division.
+    The columns match_ingredients filters on are kept as parallel arrays so
+    filtering and top-k selection never touch the database. Nothing is
+    modified after construction, so a request holding a snapshot always sees
+    arrays of one length.
+    """
+
+    __slots__ = (
+        "version", "recipe_ids", "ingredient_totals", "is_vegetarian", "is_gluten_free",
+        "difficulty", "cooking_time", "recipe_ingredients", "postings", "aliases",
+    )
+
+    def __init__(
+        self,
+        version=None,
+        recipe_ids: Optional[np.ndarray] = None,
+        recipe_ingredients: Optional[List[FrozenSet[str]]] = None,
+        postings: Optional[Dict[str, np.ndarray]] = None,
+        aliases: Optional[Dict[str, str]] = None,
+        attributes: Optional[List[tuple]] = None,
+    ):
+        attributes = attributes or []
+        self.version = version
+        self.recipe_ids = np.empty(0, dtype=np.int64) if recipe_ids is None else recipe_ids
+        self.recipe_ingredients = recipe_ingredients or []
+        self.ingredient_totals = np.array(
+            [len(names) for names in self.recipe_ingredients], dtype=np.int32
+        )
+        self.postings = postings or {}
+        self.aliases = aliases or {}
+        self.is_vegetarian = np.array([row[0] for row in attributes], dtype=bool)
+        self.is_gluten_free = np.array([row[1] for row in attributes], dtype=bool)
+        self.difficulty = np.array([row[2].lower() for row in attributes], dtype=object)
+        self.cooking_time = np.array([row[3] for row in attributes], dtype=np.int64)
+
+    @classmethod
+    def build(cls, version) -> "IndexSnapshot":
+        from recipes.models import IngredientAlias, Recipe, RecipeIngredient
+
+        rows = RecipeIngredient.objects.order_by("recipe_id").values_list(
+            "recipe_id", "ingredient__canonical_name"
+        )
+
+        recipe_ids: List[int] = []
+        recipe_ingredients: List[set] = []
+        postings: Dict[str, List[int]] = {}
+        for recipe_id, name in rows.iterator(chunk_size=2000):
+            if not recipe_ids or recipe_ids[-1] != recipe_id:
+                recipe_ids.append(recipe_id)
+                recipe_ingredients.append(set())
+            position = len(recipe_ids) - 1
+            if name not in recipe_ingredients[position]:
+                recipe_ingredients[position].add(name)
+                postings.setdefault(name, []).append(position)
+
+        aliases = dict(
+            IngredientAlias.objects.values_list("alias", "ingredient__canonical_name")
+        )
+        attributes = Recipe.objects.values_list(
+            "id", "is_vegetarian", "is_gluten_free", "difficulty", "cooking_time"
+        )
+        attributes_by_id = {row[0]: row[1:] for row in attributes.iterator(chunk_size=2000)}
+        # A recipe deleted mid-build is dropped on the rebuild its signal triggers
+        snapshot = cls(
+            version=version,
+            recipe_ids=np.array(recipe_ids, dtype=np.int64),
+            recipe_ingredients=[frozenset(names) for names in recipe_ingredients],
+            postings={
+                name: np.array(positions, dtype=np.int64)
+                for name, positions in postings.items()
+            },
+            aliases=aliases,
+            attributes=[
+                attributes_by_id.get(recipe_id, (False, False, "", 0)) for recipe_id in recipe_ids
+            ],
+        )
+        logger.info(
+            "Built ingredient index: %d recipes, %d ingredients",
+            len(snapshot.recipe_ids),
+            len(snapshot.postings),
+        )
+        return snapshot
+
+    def resolve(self, name: str) -> str:
+        """Canonical key for a user-supplied ingredient name."""
+        key = canonical_ingredient_name(name)
+        return self.aliases.get(key, key)
+
+    def filter_mask(
+        self,
+        vegetarian: bool = False,
+        gluten_free: bool = False,
+        difficulty: Optional[str] = None,
+        min_cooking_time: Optional[int] = None,
+        max_cooking_time: Optional[int] = None,
+    ) -> np.ndarray:
+        """Boolean mask over this snapshot's recipes that pass the given filters."""
+        mask = np.ones(len(self.recipe_ids), dtype=bool)
+        if vegetarian:
+            mask &= self.is_vegetarian
+        if gluten_free:
+            mask &= self.is_gluten_free
+        if difficulty:
+            mask &= self.difficulty == difficulty.lower()
+        if min_cooking_time is not None:
+            mask &= self.cooking_time >= min_cooking_time
+        if max_cooking_time is not None:
+            mask &= self.cooking_time <= max_cooking_time
+        return mask
+
+    def _top_k(self, candidates: np.ndarray, fractions: np.ndarray, k: int) -> np.ndarray:
+        """
+        The ``k`` best candidates ordered by match fraction, then recipe id.
+
+        Uses a partition instead of sorting every candidate; ties at the
+        cut-off keep the lowest positions so pages are stable across calls.
+        """
+        if k <= 0:
+            return candidates[:0]
+        scores = fractions[candidates]
+        if k < len(candidates):
+            cutoff = np.partition(scores, len(scores) - k)[len(scores) - k]
+            above = candidates[scores > cutoff]
+            ties = candidates[scores == cutoff][: k - len(above)]
+            candidates = np.concatenate([above, ties])
+            scores = fractions[candidates]
+        return candidates[np.lexsort((candidates, -scores))]
+
+    def match(
+        self,
+        ingredients: Iterable[str],
+        threshold: float = 0.3,
+        mask: Optional[np.ndarray] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Tuple[int, List[Tuple[int, float, FrozenSet[str], FrozenSet[str]]]]:
+        """
+        Score every recipe in the snapshot against the pantry in one pass.
+
+        Returns the number of recipes whose match fraction is above
+        ``threshold`` (and inside ``mask``, which must come from this
+        snapshot's ``filter_mask``) together with the
+        ``(recipe_id, match_fraction, matching_names, recipe_names)`` rows for
+        the requested ``offset``/``limit`` window, best first.
+        """
+        available = frozenset(self.resolve(i) for i in ingredients)
+
+        if not len(self.recipe_ids):
+            return 0, []
+
+        matched_counts = np.zeros(len(self.recipe_ids), dtype=np.int32)
+        for name in available:
+            positions = self.postings.get(name)
+            if positions is not None:
+                matched_counts[positions] += 1
+
+        fractions = matched_counts / self.ingredient_totals
+        selected = fractions > threshold
+        if mask is not None:
+            selected &= mask
+        candidates = np.flatnonzero(selected)
+
+        k = len(candidates) if limit is None else min(offset + limit, len(candidates))
+        window = self._top_k(candidates, fractions, k)[offset:]
+        return len(candidates), [
+            (
+                int(self.recipe_ids[position]),
+                float(fractions[position]),
+                self.recipe_ingredients[position] & available,
+                self.recipe_ingredients[position],
+            )
+            for position in window
+        ]
+
+
+class IngredientMatchIndex:
+    """
+    Process-wide holder of the current IndexSnapshot.
+
+    A rebuild happens off to the side and is published with one assignment,
+    so readers either get the old snapshot or the new one, never a mix.
+    Callers take one snapshot per request with ``snapshot()`` and use it for
+    both filtering and matching.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = IndexSnapshot()
+
+    def snapshot(self) -> IndexSnapshot:
+        """The current snapshot, rebuilt first if the catalog changed since."""
+        version = get_index_version()
+        snapshot = self._snapshot
+        if snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot.version != version:
+                    snapshot = self._snapshot = IndexSnapshot.build(version)
+        return snapshot
+
+
+ingredient_index = IngredientMatchIndex()
@@ -0,0 +1,101 @@
+# ingredient_names.py
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+# Words that end in "s" but are not plurals
+INVARIANT_WORDS = {
+    "asparagus", "couscous", "hummus", "molasses", "swiss", "citrus",
+    "octopus", "bass", "watercress", "lemongrass",
+}
+
+# Plural endings where the whole "es" has to go (tomatoes -> tomato)
+ES_PLURAL_SUFFIXES = ("oes", "ches", "shes", "sses", "xes", "zes")
+
+REMOVED_SUFFIXES = (" pieces", " piece")
+
+
+def _singularize(word: str) -> str:
+    if len(word) <= 3 or word in INVARIANT_WORDS:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(ES_PLURAL_SUFFIXES):
+        return word[:-2]
+    if word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=4096)
+def canonical_ingredient_name(name: str) -> str:
+    """
+    Normalize an ingredient name to the key stored in Ingredient.canonical_name.
+
+    Only the last word is singularized so "cheeses" becomes "cheese" and
+    "cherry tomatoes" becomes "cherry tomato".
+    """
+    name = re.sub(r"\s+", " ", name.lower()).strip()
+
+    for suffix in REMOVED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[: -len(suffix)].strip()
+
+    if not name:
+        return name
+
+    words = name.split(" ")
+    words[-1] = _singularize(words[-1])
+    return " ".join(words)
+
+
+def resolve_ingredient_keys(names: Iterable[str]) -> Dict[str, str]:
+    """Map each raw name to its canonical key, following the alias table."""
+    from recipes.models import IngredientAlias
+
+    keys = {name: canonical_ingredient_name(name) for name in names}
+    aliases = dict(
+        IngredientAlias.objects.filter(alias__in=set(keys.values())).values_list(
+            "alias", "ingredient__canonical_name"
+        )
+    )
+    return {name: aliases.get(key, key) for name, key in keys.items()}
+
+
+def match_ingredient_names(
+    names: List[str], fuzzy: bool = True
+) -> Tuple[List[dict], List[str]]:
+    """
+    Match raw ingredient names against the Ingredient table on canonical keys.
+
+    Names without an exact canonical match fall back to the in-memory
+    trigram index when ``fuzzy`` is set; those matches also carry the
+    ``detected`` name and their ``similarity``, one row per name even when
+    several resolve to the same ingredient. Returns the matched rows and
+    the names left unmatched; every name is accounted for in one of them.
+    """
+    from recipes.models import Ingredient
+    from recipes.utils.ingredient_fuzzy import ingredient_fuzzy_index
+
+    keys = resolve_ingredient_keys(names)
+    matched_ingredients = list(
+        Ingredient.objects.filter(canonical_name__in=set(keys.values())).values(
+            "id", "name", "canonical_name"
+        )
+    )
+
+    matched_keys = {ing.pop("canonical_name") for ing in matched_ingredients}
+    unmatched_ingredients = [name for name in names if keys[name] not in matched_keys]
+    if not fuzzy or not unmatched_ingredients:
+        return matched_ingredients, unmatched_ingredients
+
+    still_unmatched = []
+    for name in unmatched_ingredients:
+        best = ingredient_fuzzy_index.lookup(keys[name], limit=1)
+        if best:
+            matched_ingredients.append({**best[0], "detected": name})
+        else:
+            still_unmatched.append(name)
+    return matched_ingredients, still_unmatched
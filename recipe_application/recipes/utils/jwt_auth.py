@@ -0,0 +1,131 @@
+# jwt_auth.py
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from recipes.utils.scan_store import LRUCache
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = "auth_user_"
+
+# The only user fields cached; every other field is deferred and loads from
+# the database if a view reads it
+CACHED_FIELDS = ("is_active", "is_staff", "is_superuser")
+
+# Shared caches worth asking before the database: a network round trip is
+# cheaper than the user query, where a file cache's open, read and unpickle
+# per request is not worth it
+SHARED_TIER_BACKENDS = (
+    "django.core.cache.backends.redis.RedisCache",
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+)
+
+# user id -> cached entry, for this process
+_local_users = LRUCache(settings.AUTH_USER_CACHE_LOCAL_MAX_ENTRIES)
+
+
+def _use_shared_tier() -> bool:
+    return settings.CACHES["default"]["BACKEND"] in SHARED_TIER_BACKENDS
+
+
+def _cache_key(user_id) -> str:
+    return f"{CACHE_KEY_PREFIX}{user_id}"
+
+
+def invalidate_cached_user(user_id) -> None:
+    """Drop a user's cached entry, shared and in this process."""
+    cache.delete(_cache_key(user_id))
+    _local_users.pop(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from a cache instead
+    of loading the row on every request.
+
+    An entry holds only the primary key, ``CACHED_FIELDS`` and the
+    fingerprint of the password hash that revoked-token checks compare
+    tokens against, never the hash itself. The user built from it has every
+    other field deferred.
+
+    Entries are kept in this process for AUTH_USER_CACHE_LOCAL_TTL seconds,
+    which bounds how long other workers keep a stale copy, so most requests
+    touch no cache backend at all. On a miss, if the default cache is one
+    of SHARED_TIER_BACKENDS, the entry is read from (or stored in) it for
+    up to AUTH_USER_CACHE_TTL before falling back to the database. Saving
+    or deleting a user deletes the shared entry and this process's copy;
+    writes that skip signals, such as ``QuerySet.update()``, take effect
+    when they expire.
+    The inactive-user and revoked-token checks run on every request, as in
+    JWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        entry = self.load_entry(user_id)
+        if entry is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not entry["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry["password_fingerprint"]:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        # A fresh instance per request, so nothing a view sets on it leaks
+        # into another request
+        values = {self.user_model._meta.pk.attname: entry["pk"]}
+        values.update((name, entry[name]) for name in CACHED_FIELDS)
+        field_names = [
+            field.attname for field in self.user_model._meta.concrete_fields
+            if field.attname in values
+        ]
+        return self.user_model.from_db(
+            DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names]
+        )
+
+    def load_entry(self, user_id) -> Optional[dict]:
+        # Claims arrive as str or int depending on how the token was made
+        local_key = str(user_id)
+        entry = _local_users.get(local_key)
+        if entry is not None:
+            return entry
+
+        shared = _use_shared_tier()
+        if shared:
+            entry = cache.get(_cache_key(user_id))
+        if entry is None:
+            entry = self._fetch_entry(user_id)
+            if entry is not None and shared:
+                cache.set(_cache_key(user_id), entry, timeout=settings.AUTH_USER_CACHE_TTL)
+        if entry is not None:
+            _local_users.set(local_key, entry, time.time() + settings.AUTH_USER_CACHE_LOCAL_TTL)
+        return entry
+
+    def _fetch_entry(self, user_id) -> Optional[dict]:
+        row = (
+            self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values("pk", "password", *CACHED_FIELDS)
+            .first()
+        )
+        if row is None:
+            return None
+        row["password_fingerprint"] = get_md5_hash_password(row.pop("password"))
+        return row
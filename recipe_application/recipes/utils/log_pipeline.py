@@ -0,0 +1,173 @@
+# log_pipeline.py
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# LogRecord attributes that are not ``extra`` fields
+RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))
+) | {"message", "asctime", "suppressed"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra`` fields alongside the message."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class QueuedStreamHandler(QueueHandler):
+    """
+    Hand records to a background thread that writes them to a stream.
+
+    The calling thread only merges the message arguments and renders any
+    traceback (both need objects that may not outlive the call), then puts
+    the record on a bounded queue. Formatting and the write happen on the
+    writer thread. When the queue is full the record is dropped and counted
+    rather than blocking the request; ``dropped_records()`` sums the drops
+    of every handler in the process for ``/metrics``.
+
+    The formatter configured for this handler is used by the writer. The
+    writer thread starts on first use in each process, so it survives
+    pre-fork servers.
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, stream=None, queue_size: int = 10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._listener: Optional[QueueListener] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self.instances.add(self)
+
+    def setFormatter(self, fmt) -> None:
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self._listener.stop)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._ensure_listener()
+        super().emit(record)
+
+    def flush(self) -> None:
+        """Wait until the writer has caught up with everything queued so far."""
+        if self._pid == os.getpid():
+            self.queue.join()
+        self.target.flush()
+
+
+def dropped_records() -> int:
+    """Records every QueuedStreamHandler in this process has dropped so far."""
+    return sum(handler.dropped for handler in list(QueuedStreamHandler.instances))
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Sample and rate-limit high-volume messages.
+
+    Records below ``max_level`` are kept with probability ``sample_rate``,
+    then pass a token bucket per (logger, message template) allowing
+    ``rate`` records a second with bursts of ``burst``. The first record
+    through after some were suppressed carries their count in
+    ``suppressed``. Records at ``max_level`` and above always pass.
+
+    Only the ``max_keys`` most recently used buckets are kept, so messages
+    formatted with ``%`` or f-strings before logging (one template each)
+    cannot grow the table without bound. An evicted bucket starts full
+    again and its suppressed count is lost.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 50, sample_rate: float = 1.0,
+                 max_level: str = "WARNING", max_keys: int = 1000):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_rate = sample_rate
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self.max_keys = max_keys
+        # (logger, template) -> [tokens, last refill, suppressed], least recently used first
+        self._buckets: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.max_level:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
@@ -0,0 +1,309 @@
+# metrics.py
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.renderers import JSONRenderer
+from recipes.utils.log_pipeline import dropped_records
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Timings of the request being handled on this thread, or None outside one
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """What one request spent in the database, rendering and the view."""
+
+    __slots__ = ("queries", "sql_seconds", "render_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook; runs around every query on the thread
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that counts the time spent encoding the response body
+    towards the request's render time. Serializers run inside the view, so
+    their ``to_representation`` shows up in view time.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            timings = _current.get()
+            if timings is not None:
+                timings.render_seconds += time.perf_counter() - start
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in the Prometheus sense."""
+
+    def __init__(self, name: str, help_text: str, buckets: List[float], labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.labels = labels
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(snapshot):
+            labels = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_add_label(labels, 'le', le)} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for label_values, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _add_label(labels: str, name: str, value: str) -> str:
+    pair = f'{name}="{value}"'
+    return "{" + pair + "}" if not labels else labels[:-1] + "," + pair + "}"
+
+
+class RequestMetrics:
+    """
+    In-process request histograms, one series per (route, method).
+
+    Each worker process keeps its own; scrape every worker, or sum them in
+    the Prometheus query.
+    """
+
+    ROUTE_LABELS = ("route", "method")
+
+    def __init__(self):
+        seconds = settings.REQUEST_METRICS_SECONDS_BUCKETS
+        self.request_seconds = Histogram(
+            "recipes_request_duration_seconds", "Time spent handling the request.", seconds, self.ROUTE_LABELS
+        )
+        self.view_seconds = Histogram(
+            "recipes_view_duration_seconds", "Time spent in the view.", seconds, self.ROUTE_LABELS
+        )
+        self.sql_seconds = Histogram(
+            "recipes_sql_duration_seconds", "Time spent running SQL queries.", seconds, self.ROUTE_LABELS
+        )
+        self.render_seconds = Histogram(
+            "recipes_render_duration_seconds", "Time spent rendering the response body.", seconds, self.ROUTE_LABELS
+        )
+        self.queries = Histogram(
+            "recipes_sql_queries", "SQL queries per request.", settings.REQUEST_METRICS_QUERY_BUCKETS, self.ROUTE_LABELS
+        )
+        self.responses = Counter(
+            "recipes_responses_total", "Responses by status code.", self.ROUTE_LABELS + ("status",)
+        )
+        self.over_budget = Counter(
+            "recipes_query_budget_exceeded_total", "Requests that ran more queries than their budget.", self.ROUTE_LABELS
+        )
+
+    @property
+    def families(self):
+        return (
+            self.request_seconds,
+            self.view_seconds,
+            self.sql_seconds,
+            self.render_seconds,
+            self.queries,
+            self.responses,
+            self.over_budget,
+        )
+
+    def render(self) -> str:
+        lines = []
+        for family in self.families:
+            lines.extend(family.render())
+        lines.extend(
+            [
+                "# HELP recipes_log_records_dropped_total Log records dropped because the log writer fell behind.",
+                "# TYPE recipes_log_records_dropped_total counter",
+                f"recipes_log_records_dropped_total {dropped_records()}",
+            ]
+        )
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for family in self.families:
+            family.clear()
+
+
+_metrics: Optional[RequestMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_request_metrics() -> RequestMetrics:
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = RequestMetrics()
+    return _metrics
+
+
+def _route(request) -> Tuple[str, Optional[type]]:
+    """The resolved URL name (e.g. ``recipe-detail``) and the view class, if any."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched", None
+    view_class = getattr(match.func, "cls", None) or getattr(match.func, "view_class", None)
+    return match.view_name or match.route or "unnamed", view_class
+
+
+def _query_budget(view_class) -> Optional[int]:
+    """A view's ``query_budget`` attribute, falling back to REQUEST_QUERY_BUDGET."""
+    budget = getattr(view_class, "query_budget", None)
+    return settings.REQUEST_QUERY_BUDGET if budget is None else budget
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure query count, SQL time, render time and view time per
+    resolved route, send them back in a ``Server-Timing`` header and record
+    them in the histograms behind the ``/metrics`` endpoint.
+
+    Requests that run more queries than the view's ``query_budget`` (or
+    REQUEST_QUERY_BUDGET) are logged and flagged with an
+    ``X-Query-Budget-Exceeded`` header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        end = time.perf_counter()
+        total = end - start
+        view_seconds = end - request._view_started if hasattr(request, "_view_started") else 0.0
+
+        route, view_class = _route(request)
+        method = request.method
+        metrics = get_request_metrics()
+        metrics.request_seconds.observe(total, route, method)
+        metrics.view_seconds.observe(view_seconds, route, method)
+        metrics.sql_seconds.observe(timings.sql_seconds, route, method)
+        metrics.render_seconds.observe(timings.render_seconds, route, method)
+        metrics.queries.observe(timings.queries, route, method)
+        metrics.responses.inc(route, method, str(response.status_code))
+
+        budget = _query_budget(view_class)
+        if budget is not None and timings.queries > budget:
+            metrics.over_budget.inc(route, method)
+            logger.warning(
+                "%s %s (%s) ran %d queries, over its budget of %d",
+                method, request.path, route, timings.queries, budget,
+            )
+            response["X-Query-Budget-Exceeded"] = f"{timings.queries}/{budget}"
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={timings.sql_seconds * 1000:.2f};desc="{timings.queries} queries"',
+                f"render;dur={timings.render_seconds * 1000:.2f}",
+                f"view;dur={view_seconds * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The view clock runs from here until the response is back in
+        # __call__, so it also covers the later middleware's light work
+        request._view_started = time.perf_counter()
+        return None
+
+
+def has_metrics_token(request) -> bool:
+    """Whether the request carries ``Authorization: Bearer <METRICS_TOKEN>``."""
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"
+    )
+
+
+def metrics_response() -> HttpResponse:
+    """Prometheus text exposition of this process's request metrics."""
+    return HttpResponse(get_request_metrics().render(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,291 @@
+# pagination.py
+import base64
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F, Func, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Whether the plain ORDER BY of a filtered page walks an index, by SQL shape
+_plan_choices: dict = {}
+PLAN_CHOICES_MAX = 1024
+
+
+class Unindexed(Func):
+    """
+    SQLite's unary ``+``: the same value, but the planner will not walk an
+    index to produce it in order.
+    """
+
+    template = "+%(expressions)s"
+    arity = 1
+
+
+def encode_cursor(payload: dict) -> str:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(encoded: str) -> dict:
+    """Decode an opaque cursor; raises ValueError if it was tampered with."""
+    if not isinstance(encoded, str):
+        raise ValueError("Invalid cursor")
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+class RecipeCursorPagination(BasePagination):
+    """
+    Keyset pagination on one of the view's ``ordering_fields`` plus an id
+    tiebreaker, so every page costs the same regardless of depth.
+
+    Querysets that arrive already ordered by something other than a plain
+    field (e.g. search rank) are paged by offset instead. Totals are only
+    computed when the client asks for them with ``?count=true`` and are
+    cached for ``RECIPE_COUNT_CACHE_TIMEOUT`` seconds.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    default_ordering = "id"
+    tiebreaker = "id"
+    invalid_cursor_message = "Invalid cursor"
+
+    def _get_ordering(self, request, view) -> Optional[str]:
+        ordering_param = OrderingFilter.ordering_param
+        valid_fields = getattr(view, "ordering_fields", None) or []
+        for term in request.query_params.get(ordering_param, "").split(","):
+            term = term.strip()
+            if term.lstrip("-") in valid_fields:
+                return term
+        return None
+
+    def _encode_cursor(self, payload: dict) -> str:
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encode_cursor(payload)
+        )
+
+    def _decode_cursor(self, request) -> Optional[dict]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            return decode_cursor(encoded)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _cursor_position(self, cursor: dict, model, field: str):
+        """
+        The ``(value, pk)`` a keyset cursor points after. The pk must be an
+        int and the value a scalar ``field`` accepts, or None if the field is
+        nullable; anything else was not issued by this paginator.
+        """
+        pk, value = cursor.get("id"), cursor.get("v")
+        model_field = model._meta.get_field(field)
+        if type(pk) is not int:
+            raise NotFound(self.invalid_cursor_message)
+        if value is None and model_field.null:
+            return None, pk
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return model_field.to_python(value), pk
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _keyset_filters(self, model, field: str, descending: bool, value, pk) -> List[Q]:
+        """
+        Rows strictly after ``(value, pk)``; descending sorts NULLs last.
+
+        Returned as filters to read in turn until a page is full. Each one
+        bounds the ordering column by itself, so SQLite starts at the
+        position in the column's index instead of walking it from the
+        beginning. NULLs, which sort first ascending and last descending,
+        are beyond any bound on the column and get a filter of their own.
+        """
+        tiebreaker = self.tiebreaker
+        if field == tiebreaker:
+            return [Q(**{f"{tiebreaker}__lt" if descending else f"{tiebreaker}__gt": pk})]
+        if descending:
+            if value is None:
+                return [Q(**{f"{field}__isnull": True, f"{tiebreaker}__lt": pk})]
+            after = Q(**{f"{field}__lte": value}) & (
+                Q(**{f"{field}__lt": value}) | Q(**{field: value, f"{tiebreaker}__lt": pk})
+            )
+            if model._meta.get_field(field).null:
+                return [after, Q(**{f"{field}__isnull": True})]
+            return [after]
+        if value is None:
+            return [
+                Q(**{f"{field}__isnull": True, f"{tiebreaker}__gt": pk}),
+                Q(**{f"{field}__isnull": False}),
+            ]
+        return [
+            Q(**{f"{field}__gte": value}) & (
+                Q(**{f"{field}__gt": value}) | Q(**{field: value, f"{tiebreaker}__gt": pk})
+            )
+        ]
+
+    def _order_by(self, field: str, descending: bool, hinted: bool = False):
+        """
+        ORDER BY for the keyset walk. With ``hinted`` the sort keys are hidden
+        from the planner, so it searches a filter's index and sorts the rows
+        it finds instead of walking the ordering column's index.
+        """
+        def key(name):
+            return Unindexed(F(name)) if hinted else F(name)
+
+        tiebreaker = self.tiebreaker
+        if field == tiebreaker:
+            return [key(tiebreaker).desc() if descending else key(tiebreaker).asc()]
+        if descending:
+            return [key(field).desc(nulls_last=True), key(tiebreaker).desc()]
+        return [key(field).asc(nulls_first=True), key(tiebreaker).asc()]
+
+    def get_count(self, queryset) -> int:
+        queryset = queryset.order_by()
+        key = "recipe_count_" + hashlib.md5(str(queryset.query).encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, timeout=settings.RECIPE_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param
+        )
+        self.count = None
+        if request.query_params.get(self.count_query_param, "").lower() in ("1", "true"):
+            self.count = self.get_count(queryset)
+
+        cursor = self._decode_cursor(request)
+        ordering = self._get_ordering(request, view)
+        if ordering is None and queryset.ordered:
+            return self._paginate_by_offset(queryset, cursor)
+        return self._paginate_by_keyset(queryset, cursor, ordering or self.default_ordering)
+
+    def _paginate_by_offset(self, queryset, cursor):
+        try:
+            offset = max(int((cursor or {}).get("o", 0)), 0)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        results = rows[: self.page_size]
+        self.next_link = (
+            self._encode_cursor({"o": offset + self.page_size})
+            if len(rows) > self.page_size
+            else None
+        )
+        self.previous_link = None
+        if offset > 0:
+            self.previous_link = (
+                self._encode_cursor({"o": max(offset - self.page_size, 0)})
+                if offset > self.page_size
+                else self.base_url
+            )
+        return results
+
+    def keyset_querysets(self, queryset, field: str, descending: bool, position=None) -> list:
+        """
+        The querysets that make up a keyset page of ``queryset`` after the
+        ``(value, pk)`` position, if given, to read in turn (without LIMIT)
+        until the page is full. Usually there is one; see _keyset_filters.
+
+        A filtered page keeps the plain ORDER BY when EXPLAIN shows SQLite
+        searching an index (or walking a partial one) for it, so deep pages
+        read no more rows than the first. Only when it would walk the whole
+        ordering index to find matching rows are the sort keys hinted, so it
+        searches the filter's index and sorts just those rows. The choice is
+        made once per query shape and process.
+        """
+        if position is None:
+            filters = [Q()]
+        else:
+            filters = self._keyset_filters(queryset.model, field, descending, *position)
+        filtered = bool(queryset.query.where)
+        return [self._planned(queryset.filter(f), field, descending, filtered) for f in filters]
+
+    def _planned(self, queryset, field: str, descending: bool, filtered: bool):
+        plain = queryset.order_by(*self._order_by(field, descending))
+        if not filtered or connection.vendor != "sqlite":
+            return plain
+        limited = plain[: self.page_size + 1]
+        shape = limited.query.sql_with_params()[0]
+        walks_index = _plan_choices.get(shape)
+        if walks_index is None:
+            from recipes.utils.query_plans import full_scans
+
+            walks_index = not full_scans(limited)
+            if len(_plan_choices) >= PLAN_CHOICES_MAX:
+                _plan_choices.clear()
+            _plan_choices[shape] = walks_index
+        if walks_index:
+            return plain
+        return queryset.order_by(*self._order_by(field, descending, hinted=True))
+
+    def _paginate_by_keyset(self, queryset, cursor, ordering):
+        field = ordering.lstrip("-")
+        descending = ordering.startswith("-")
+        reverse = bool(cursor and cursor.get("r"))
+        # Walking backwards is the same keyset query in the opposite direction
+        direction = descending != reverse
+
+        position = None
+        if cursor is not None:
+            position = self._cursor_position(cursor, queryset.model, field)
+        rows = []
+        for page_queryset in self.keyset_querysets(queryset, field, direction, position):
+            rows += page_queryset[: self.page_size + 1 - len(rows)]
+            if len(rows) > self.page_size:
+                break
+        has_more = len(rows) > self.page_size
+        results = rows[: self.page_size]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        def cursor_at(obj, **extra):
+            return {"v": getattr(obj, field), "id": getattr(obj, self.tiebreaker), **extra}
+
+        self.next_link = (
+            self._encode_cursor(cursor_at(results[-1])) if has_next and results else None
+        )
+        self.previous_link = (
+            self._encode_cursor(cursor_at(results[0], r=1))
+            if has_previous and results
+            else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        response = {
+            "next": self.next_link,
+            "previous": self.previous_link,
+            "results": data,
+        }
+        if self.count is not None:
+            response = {"count": self.count, **response}
+        return Response(response)
@@ -0,0 +1,300 @@
+# profiling.py
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from django.conf import settings
+from django.db import connections
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+REQUEST_ID_HEADER = "HTTP_X_REQUEST_ID"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# Profiles running at once per process; requests beyond this are not profiled
+_slots = threading.BoundedSemaphore(max(1, settings.REQUEST_PROFILE_MAX_CONCURRENT))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Project files relative to BASE_DIR; library frames keep their full path
+    base = f"{settings.BASE_DIR}{os.sep}"
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler for one thread.
+
+    A background thread reads the target thread's stack from
+    ``sys._current_frames()`` every ``interval`` seconds, so the profiled
+    request runs without tracing hooks; its only cost is the GIL the sampler
+    briefly takes.
+    """
+
+    def __init__(self, thread_id: int, interval: float, max_depth: int = 128):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = sys._getframe()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or frame is own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            # Root first, as in folded flame graph input
+            self.stacks[tuple(reversed(stack))] += 1
+
+
+class SQLRecorder:
+    """execute_wrapper hook keeping the statements a profiled request ran."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.statements: List[dict] = []
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.total += 1
+            if len(self.statements) < self.limit:
+                self.statements.append(
+                    {
+                        "alias": context["connection"].alias,
+                        "sql": sql,
+                        "ms": round((time.perf_counter() - start) * 1000, 3),
+                        "many": many,
+                    }
+                )
+
+
+def hottest_frames(stacks: Dict[Tuple[str, ...], int], limit: int = 20) -> Dict[str, list]:
+    """
+    Frames with the most samples: ``self`` counts samples where the frame
+    was running, ``total`` where it was anywhere on the stack.
+    """
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        if not stack:
+            continue
+        own[stack[-1]] += count
+        for frame in set(stack):
+            total[frame] += count
+    samples = sum(stacks.values()) or 1
+
+    def rows(counter):
+        return [
+            {"frame": frame, "samples": count, "percent": round(100 * count / samples, 1)}
+            for frame, count in counter.most_common(limit)
+        ]
+
+    return {"self": rows(own), "total": rows(total)}
+
+
+class ProfileStore:
+    """Recent profiles as JSON files in REQUEST_PROFILE_DIR, newest kept."""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> Path:
+        return Path(self._directory or settings.REQUEST_PROFILE_DIR)
+
+    def _path(self, request_id: str) -> Path:
+        return self.directory / f"{request_id}.json"
+
+    def save(self, profile: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(profile["request_id"])
+        staging = path.with_suffix(".tmp")
+        staging.write_text(json.dumps(profile))
+        os.replace(staging, path)
+        self.prune()
+
+    def prune(self) -> None:
+        for path in self._paths()[settings.REQUEST_PROFILE_MAX_STORED:]:
+            path.unlink(missing_ok=True)
+
+    def _paths(self) -> List[Path]:
+        if not self.directory.is_dir():
+            return []
+        paths = []
+        for path in self.directory.glob("*.json"):
+            try:
+                paths.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        return [path for _, path in sorted(paths, reverse=True)]
+
+    def get(self, request_id: str) -> Optional[dict]:
+        if not REQUEST_ID_PATTERN.match(request_id):
+            return None
+        try:
+            return json.loads(self._path(request_id).read_text())
+        except FileNotFoundError:
+            return None
+
+    def recent(self) -> List[dict]:
+        """Newest first, without the stacks and statements."""
+        summaries = []
+        for path in self._paths():
+            try:
+                profile = json.loads(path.read_text())
+            except (FileNotFoundError, ValueError):
+                continue
+            summaries.append(
+                {
+                    key: profile[key]
+                    for key in (
+                        "request_id", "started_at", "method", "path", "view", "trigger",
+                        "status", "duration_ms", "samples", "query_count",
+                    )
+                }
+                | {"hottest": profile["hottest"]["self"][:5]}
+            )
+        return summaries
+
+
+profile_store = ProfileStore()
+
+
+def folded_stacks(profile: dict) -> str:
+    """Samples in folded format (``a;b;c 12``), the input of flame graph tools."""
+    return "".join(f"{';'.join(row['stack'])} {row['samples']}\n" for row in profile["stacks"])
+
+
+class ProfiledViewMixin:
+    """
+    Profile a viewset's actions on demand.
+
+    A request is profiled when a staff user sends ``X-Profile: 1``, or at
+    random with probability REQUEST_PROFILE_SAMPLE_RATE. The action runs
+    under StackSampler while SQLRecorder keeps its statements; the result is
+    stored under the request ID (``X-Request-ID`` or a generated one), which
+    is returned in ``X-Profile-Id``.
+
+    Profiling starts once the user is authenticated and ``dispatch`` always
+    stops it, so an exception escaping the view still releases the slot,
+    the sampler thread and the query hooks, and its profile is stored with
+    status 500.
+    """
+
+    _profile = None
+
+    def _profile_trigger(self, request) -> Optional[str]:
+        if request.META.get(PROFILE_HEADER) == "1" and request.user.is_staff:
+            return "header"
+        rate = settings.REQUEST_PROFILE_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return "sampled"
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        response = None
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            return response
+        finally:
+            if self._profile is not None:
+                request_id = self._finish_profile(
+                    request, response.status_code if response is not None else 500
+                )
+                if request_id is not None and response is not None:
+                    response["X-Profile-Id"] = request_id
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        trigger = self._profile_trigger(request)
+        if trigger is None or not _slots.acquire(blocking=False):
+            return
+
+        request_id = request.META.get(REQUEST_ID_HEADER, "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        recorder = SQLRecorder(settings.REQUEST_PROFILE_MAX_STATEMENTS)
+        stack = ExitStack()
+        # Registered before anything can fail, so the slot is always returned
+        self._profile = {"stack": stack}
+        stack.callback(_slots.release)
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        sampler = StackSampler(threading.get_ident(), settings.REQUEST_PROFILE_INTERVAL)
+        sampler.start()
+        stack.callback(sampler.stop)
+        self._profile.update(
+            request_id=request_id,
+            trigger=trigger,
+            started_at=time.time(),
+            start=time.perf_counter(),
+            sampler=sampler,
+            recorder=recorder,
+        )
+
+    def _finish_profile(self, request, status_code: int) -> Optional[str]:
+        """Stop profiling and store the profile; its ID, or None if not stored."""
+        state, self._profile = self._profile, None
+        state["stack"].close()
+        if "sampler" not in state:
+            return None
+        duration = time.perf_counter() - state["start"]
+
+        stacks = state["sampler"].stacks
+        recorder = state["recorder"]
+        try:
+            profile_store.save(
+                {
+                    "request_id": state["request_id"],
+                    "started_at": state["started_at"],
+                    "method": request.method,
+                    "path": request.get_full_path(),
+                    "view": f"{self.basename}-{self.action}",
+                    "trigger": state["trigger"],
+                    "status": status_code,
+                    "duration_ms": round(duration * 1000, 3),
+                    "interval_ms": settings.REQUEST_PROFILE_INTERVAL * 1000,
+                    "samples": sum(stacks.values()),
+                    "hottest": hottest_frames(stacks),
+                    "stacks": [
+                        {"stack": list(stack), "samples": count}
+                        for stack, count in stacks.most_common()
+                    ],
+                    "query_count": recorder.total,
+                    "queries": recorder.statements,
+                }
+            )
+        except OSError:
+            logger.exception("Could not store profile %s", state["request_id"])
+            return None
+        return state["request_id"]
@@ -0,0 +1,130 @@
+# query_plans.py
+import itertools
+import re
+from django.db import connection
+from typing import Dict, Iterator, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Only "SEARCH table USING [COVERING] INDEX" narrows the rows read. "SCAN
+# table" walks all of them, and so does "SCAN table USING INDEX", just in
+# index order, unless the index is partial and so holds only matching rows
+SCAN = re.compile(r"\bSCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?")
+TEMP_SORT = "USE TEMP B-TREE"
+
+
+def sample_value(field, lookup: str):
+    """A representative filter value for ``field``; EXPLAIN only needs its type."""
+    if field.choices:
+        return field.choices[0][0]
+    internal_type = field.get_internal_type()
+    if internal_type == "BooleanField":
+        return True
+    if internal_type in ("PositiveIntegerField", "IntegerField", "FloatField"):
+        return 30
+    return "x"
+
+
+def recipe_list_plans(page_size: int = 10) -> Iterator[Tuple[str, object]]:
+    """
+    No filter and every single and pairwise combination of RecipeViewSet's
+    filters, each under every ordering, shaped like the first and a later
+    keyset page the paginator queries.
+    """
+    from recipes.models import Recipe
+    from recipes.utils.pagination import RecipeCursorPagination
+    from recipes.views import RecipeViewSet
+
+    filters: List[Dict] = []
+    for field_name, lookups in RecipeViewSet.filterset_fields.items():
+        field = Recipe._meta.get_field(field_name)
+        for lookup in lookups:
+            value = sample_value(field, lookup)
+            filters.append({f"{field_name}__{lookup}": value})
+            if field.get_internal_type() == "BooleanField":
+                filters.append({f"{field_name}__{lookup}": not value})
+
+    combinations = list(filters)
+    for first, second in itertools.combinations(filters, 2):
+        if first.keys() != second.keys():
+            combinations.append({**first, **second})
+
+    paginator = RecipeCursorPagination()
+    orderings = [paginator.default_ordering] + [
+        prefix + field for field in RecipeViewSet.ordering_fields for prefix in ("", "-")
+    ]
+    for lookup, ordering in itertools.product([{}] + combinations, orderings):
+        field = ordering.lstrip("-")
+        label = ", ".join(f"{key}={value}" for key, value in lookup.items())
+        # Every ordering column is numeric, so any number stands in for a
+        # later page's keyset position
+        pages = [("first", None), ("keyset", (30, 1))]
+        if Recipe._meta.get_field(field).null:
+            pages.append(("null keyset", (None, 1)))
+        for page, position in pages:
+            querysets = paginator.keyset_querysets(
+                Recipe.objects.filter(**lookup), field, ordering.startswith("-"), position
+            )
+            for queryset in querysets:
+                yield f"[{label}] ordering={ordering} {page} page", queryset[: page_size + 1]
+
+
+def suggestion_plans() -> Iterator[Tuple[str, object]]:
+    from recipes.models import Recipe, RecipeRating
+
+    yield "liked cuisines", RecipeRating.objects.filter(user_id=1, rating__gte=3).values_list(
+        "recipe__cuisine", flat=True
+    )
+    for flag in ("is_vegetarian", "is_gluten_free"):
+        yield f"ranked feed {flag}", Recipe.objects.filter(**{flag: True}).exclude(
+            ratings__user_id=1
+        ).order_by("-average_rating", "-rating_count")[:15]
+
+
+def partial_indexes() -> set:
+    """Names of the indexes declared with a condition on any installed model."""
+    from django.apps import apps
+
+    return {
+        index.name
+        for model in apps.get_models()
+        for index in model._meta.indexes
+        if index.condition is not None
+    }
+
+
+def full_scans(queryset) -> List[str]:
+    """
+    Tables the query scans rather than searches, from EXPLAIN QUERY PLAN.
+
+    Walking a partial index is accepted: SQLite only picks one whose
+    condition the query's WHERE implies, so every row it reads matches.
+    So is an unfiltered, limited query that needs no sort, which walks the
+    table or the ordering column's index and stops once the page is full.
+    With a filter that walk may read every row to fill the page, so it
+    counts as a full scan.
+    """
+    if connection.vendor != "sqlite":
+        raise NotImplementedError("Query plan checks are written for SQLite")
+    plan = queryset.explain()
+    bounded_walk = (
+        not queryset.query.where
+        and queryset.query.high_mark is not None
+        and TEMP_SORT not in plan
+    )
+    if bounded_walk:
+        return []
+    partial = partial_indexes()
+    return [table for table, index in SCAN.findall(plan) if index not in partial]
+
+
+def check_query_plans() -> Tuple[int, List[Tuple[str, List[str]]]]:
+    """Return how many queries were checked and the ones that scan a table."""
+    checked, failures = 0, []
+    for label, queryset in itertools.chain(recipe_list_plans(), suggestion_plans()):
+        checked += 1
+        scanned = full_scans(queryset)
+        if scanned:
+            failures.append((label, scanned))
+    return checked, failures
@@ -0,0 +1,54 @@
+# ratings.py
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Cast, Coalesce
+from typing import Iterable, Optional
+
+
+def _refresh_average(queryset) -> None:
+    queryset.update(
+        average_rating=Case(
+            When(
+                rating_count__gt=0,
+                then=Cast("rating_sum", FloatField()) / F("rating_count"),
+            ),
+            default=None,
+        )
+    )
+
+
+def apply_rating_delta(recipe_id: int, rating_delta: int, count_delta: int) -> None:
+    """Shift a recipe's stored rating sum/count and recompute its average."""
+    from recipes.models import Recipe
+
+    queryset = Recipe.objects.filter(pk=recipe_id)
+    queryset.update(
+        rating_sum=F("rating_sum") + rating_delta,
+        rating_count=F("rating_count") + count_delta,
+    )
+    _refresh_average(queryset)
+
+
+def rebuild_rating_aggregates(recipe_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute rating aggregates from RecipeRating rows.
+
+    Rebuilds every recipe when ``recipe_ids`` is None. Returns the number of
+    recipes updated.
+    """
+    from recipes.models import Recipe, RecipeRating
+
+    queryset = Recipe.objects.all()
+    if recipe_ids is not None:
+        queryset = queryset.filter(pk__in=list(recipe_ids))
+
+    ratings = RecipeRating.objects.filter(recipe=OuterRef("pk")).values("recipe")
+    updated = queryset.update(
+        rating_sum=Coalesce(
+            Subquery(ratings.annotate(total=Sum("rating")).values("total")), 0
+        ),
+        rating_count=Coalesce(
+            Subquery(ratings.annotate(total=Count("pk")).values("total")), 0
+        ),
+    )
+    _refresh_average(queryset)
+    return updated
@@ -0,0 +1,90 @@
+# recipe_writes.py
+from django.db import connections, router
+from recipes.utils.ingredient_index import bump_index_version
+from recipes.utils.search import get_search_backend
+from recipes.utils.versioning import CATALOG_VERSION_KEY, bump_version
+from typing import Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+DIFFED_FIELDS = ("quantity", "unit")
+
+# Stay under SQLite's bound-parameter limit in IN (...) lists
+DELETE_CHUNK = 500
+
+
+def delete_without_signals(model, field: str, values: List) -> int:
+    """
+    Delete the ``model`` rows whose ``field`` is in ``values`` with plain
+    DELETE statements and return how many went.
+
+    Unlike ``QuerySet.delete()`` the rows are not fetched first, no
+    pre_delete/post_delete signals are sent and ``on_delete`` cascades are
+    not followed, so use it only for tables nothing else references.
+    Callers do the receivers' work (search reindexing, version bumps)
+    themselves, once for the whole delete.
+    """
+    alias = router.db_for_write(model)
+    quote_name = connections[alias].ops.quote_name
+    table = quote_name(model._meta.db_table)
+    column = quote_name(model._meta.get_field(field).column)
+    deleted = 0
+    with connections[alias].cursor() as cursor:
+        for start in range(0, len(values), DELETE_CHUNK):
+            chunk = values[start:start + DELETE_CHUNK]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", chunk)
+            deleted += cursor.rowcount
+    return deleted
+
+
+def sync_recipe_ingredients(recipe, rows: List[dict]) -> Dict[str, int]:
+    """
+    Make a recipe's RecipeIngredient rows match ``rows``.
+
+    Rows are keyed by ``ingredient_id``. Only the differences are written:
+    one DELETE for rows no longer listed, one bulk INSERT for new ones and
+    one bulk UPDATE for changed quantities or units, so the query count does
+    not grow with the size of the recipe. Must run inside the transaction
+    that saved the recipe.
+    """
+    from recipes.models import RecipeIngredient
+
+    existing = {
+        recipe_ingredient.ingredient_id: recipe_ingredient
+        for recipe_ingredient in RecipeIngredient.objects.filter(recipe=recipe)
+    }
+    incoming = {row["ingredient_id"]: row for row in rows}
+
+    stale = [existing[ingredient_id].pk for ingredient_id in existing.keys() - incoming.keys()]
+    added = [
+        RecipeIngredient(recipe=recipe, **row)
+        for ingredient_id, row in incoming.items()
+        if ingredient_id not in existing
+    ]
+    changed = []
+    for ingredient_id in existing.keys() & incoming.keys():
+        recipe_ingredient = existing[ingredient_id]
+        row = incoming[ingredient_id]
+        if any(getattr(recipe_ingredient, field) != row[field] for field in DIFFED_FIELDS):
+            for field in DIFFED_FIELDS:
+                setattr(recipe_ingredient, field, row[field])
+            changed.append(recipe_ingredient)
+
+    if stale:
+        # The regular delete() would fetch the rows and send post_delete for
+        # each, reindexing the recipe once per removed row
+        delete_without_signals(RecipeIngredient, "id", stale)
+    if added:
+        RecipeIngredient.objects.bulk_create(added)
+    if changed:
+        RecipeIngredient.objects.bulk_update(changed, list(DIFFED_FIELDS))
+
+    if stale or added or changed:
+        # Bulk writes skip the RecipeIngredient signals
+        bump_index_version()
+        bump_version(CATALOG_VERSION_KEY)
+        get_search_backend().index_recipes([recipe.pk])
+
+    return {"deleted": len(stale), "created": len(added), "updated": len(changed)}
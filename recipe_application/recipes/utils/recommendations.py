@@ -0,0 +1,426 @@
+# recommendations.py
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import numpy as np
+from pathlib import Path
+from django.conf import settings
+from django.utils import timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+ARRAYS = ("recipe_ids", "indptr", "neighbors", "similarities")
+# Training state kept next to the model so the next run can be incremental
+STATE_ARRAYS = ("ratings", "pair_keys", "pair_dots", "pair_support", "item_ids", "item_norms")
+# Recipe ids fit in a signed 32-bit int, so a pair of them fits in an int64
+PAIR_KEY_BASE = 1 << 31
+
+
+def rating_statistics(
+    rows: np.ndarray,
+    max_items_per_user: Optional[int] = None,
+    max_pairs: int = 5_000_000,
+) -> Dict[str, np.ndarray]:
+    """
+    Sufficient statistics of adjusted-cosine similarity for ``rows``.
+
+    ``rows`` holds ``(user_id, recipe_id, rating)`` triples. Ratings are
+    centered on each user's mean and, for users with more than
+    ``max_items_per_user`` ratings, only the ratings furthest from their
+    mean are kept, so one heavy rater contributes a bounded number of pairs.
+    The sparse item-item dot products are then accumulated from the pairs
+    of items every user co-rated, in user groups of at most ``max_pairs``
+    pairs to bound memory.
+
+    Statistics are keyed by recipe id, so those of disjoint sets of users
+    can be combined with :func:`merge_statistics`.
+    """
+    if not len(rows):
+        return empty_statistics()
+    item_ids, item_index = np.unique(rows[:, 1], return_inverse=True)
+    _, user_index = np.unique(rows[:, 0], return_inverse=True)
+    item_count = len(item_ids)
+
+    order = np.argsort(user_index, kind="stable")
+    user_index, item_index = user_index[order], item_index[order]
+    values = rows[order, 2].astype(np.float64)
+
+    _, starts, counts = np.unique(user_index, return_index=True, return_counts=True)
+    user_means = np.add.reduceat(values, starts) / counts
+    values -= np.repeat(user_means, counts)
+
+    if max_items_per_user and counts.max() > max_items_per_user:
+        # Users stay grouped; within a user the strongest opinions come first
+        order = np.lexsort((-np.abs(values), user_index))
+        rank = np.arange(len(order)) - np.repeat(starts, counts)
+        keep = order[rank < max_items_per_user]
+        keep.sort()
+        user_index, item_index, values = user_index[keep], item_index[keep], values[keep]
+        _, starts, counts = np.unique(user_index, return_index=True, return_counts=True)
+
+    norms = np.bincount(item_index, weights=values ** 2, minlength=item_count)
+
+    pair_keys = np.empty(0, dtype=np.int64)
+    pair_dots = np.empty(0, dtype=np.float64)
+    pair_support = np.empty(0, dtype=np.float64)
+
+    pair_counts = counts.astype(np.int64) ** 2
+    pairs_before = np.cumsum(pair_counts) - pair_counts
+    group_start = 0
+    while group_start < len(starts):
+        group_stop = max(
+            group_start + 1,
+            int(np.searchsorted(pairs_before, pairs_before[group_start] + max_pairs, side="right")),
+        )
+        group_starts = starts[group_start:group_stop]
+        group_counts = counts[group_start:group_stop]
+
+        # Pair every rating with each rating of the same user
+        positions = np.arange(group_starts[0], group_starts[-1] + group_counts[-1])
+        repeats = np.repeat(group_counts, group_counts)
+        left = np.repeat(positions, repeats)
+        first_of_left = np.repeat(np.cumsum(repeats) - repeats, repeats)
+        right = np.repeat(np.repeat(group_starts, group_counts), repeats)
+        right += np.arange(len(left)) - first_of_left
+
+        left_items, right_items = item_index[left], item_index[right]
+        distinct = left_items != right_items
+        keys = left_items[distinct].astype(np.int64) * item_count + right_items[distinct]
+        dots = values[left[distinct]] * values[right[distinct]]
+
+        pair_keys, inverse = np.unique(np.concatenate([pair_keys, keys]), return_inverse=True)
+        pair_dots = np.bincount(inverse, weights=np.concatenate([pair_dots, dots]))
+        pair_support = np.bincount(
+            inverse, weights=np.concatenate([pair_support, np.ones(len(keys))])
+        )
+        group_start = group_stop
+
+    # item_ids is sorted, so re-keying by recipe id keeps pair_keys sorted
+    rows_, cols = pair_keys // item_count, pair_keys % item_count
+    return {
+        "pair_keys": item_ids[rows_] * PAIR_KEY_BASE + item_ids[cols],
+        "pair_dots": pair_dots,
+        "pair_support": pair_support,
+        "item_ids": item_ids,
+        "item_norms": norms,
+    }
+
+
+def empty_statistics() -> Dict[str, np.ndarray]:
+    return {
+        "pair_keys": np.empty(0, dtype=np.int64),
+        "pair_dots": np.empty(0, dtype=np.float64),
+        "pair_support": np.empty(0, dtype=np.float64),
+        "item_ids": np.empty(0, dtype=np.int64),
+        "item_norms": np.empty(0, dtype=np.float64),
+    }
+
+
+def merge_statistics(
+    base: Dict[str, np.ndarray], delta: Dict[str, np.ndarray], sign: int = 1
+) -> Dict[str, np.ndarray]:
+    """
+    Add (``sign=1``) or remove (``sign=-1``) the statistics of a disjoint
+    set of users. Pairs no user co-rates any more are dropped.
+    """
+    pair_keys, inverse = np.unique(
+        np.concatenate([base["pair_keys"], delta["pair_keys"]]), return_inverse=True
+    )
+    pair_dots = np.bincount(
+        inverse, weights=np.concatenate([base["pair_dots"], sign * delta["pair_dots"]])
+    )
+    pair_support = np.bincount(
+        inverse, weights=np.concatenate([base["pair_support"], sign * delta["pair_support"]])
+    )
+    # Support counts are whole numbers; the margin absorbs float drift
+    keep = pair_support > 0.5
+
+    item_ids, inverse = np.unique(
+        np.concatenate([base["item_ids"], delta["item_ids"]]), return_inverse=True
+    )
+    item_norms = np.bincount(
+        inverse, weights=np.concatenate([base["item_norms"], sign * delta["item_norms"]])
+    )
+    return {
+        "pair_keys": pair_keys[keep],
+        "pair_dots": pair_dots[keep],
+        "pair_support": pair_support[keep],
+        "item_ids": item_ids,
+        "item_norms": np.maximum(item_norms, 0),
+    }
+
+
+def neighbors_from_statistics(
+    statistics: Dict[str, np.ndarray], k: int, shrinkage: float
+) -> Dict[str, np.ndarray]:
+    """
+    Top-``k`` adjusted-cosine neighbors of every item.
+
+    Similarities are damped by ``co_raters / (co_raters + shrinkage)`` so
+    pairs supported by a handful of users do not dominate.
+
+    Returns CSR-style arrays: ``neighbors[indptr[i]:indptr[i + 1]]`` are the
+    neighbors of ``recipe_ids[i]``, most similar first.
+    """
+    recipe_ids = statistics["item_ids"]
+    item_count = len(recipe_ids)
+    norms = np.sqrt(statistics["item_norms"])
+    pair_keys = statistics["pair_keys"]
+    rows = np.searchsorted(recipe_ids, pair_keys // PAIR_KEY_BASE)
+    cols = np.searchsorted(recipe_ids, pair_keys % PAIR_KEY_BASE)
+    pair_support = statistics["pair_support"]
+
+    denominators = norms[rows] * norms[cols]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarities = (
+            statistics["pair_dots"] / denominators * (pair_support / (pair_support + shrinkage))
+        )
+    keep = (denominators > 0) & (similarities > 0)
+    rows, cols, similarities = rows[keep], cols[keep], similarities[keep]
+
+    # Rows are already sorted; order each row by descending similarity
+    order = np.lexsort((-similarities, rows))
+    rows, cols, similarities = rows[order], cols[order], similarities[order]
+    row_sizes = np.bincount(rows, minlength=item_count)
+    rank = np.arange(len(rows)) - np.repeat(np.cumsum(row_sizes) - row_sizes, row_sizes)
+    keep = rank < k
+    rows, cols, similarities = rows[keep], cols[keep], similarities[keep]
+
+    indptr = np.zeros(item_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=item_count), out=indptr[1:])
+    return {
+        "recipe_ids": recipe_ids,
+        "indptr": indptr,
+        "neighbors": cols.astype(np.int32),
+        "similarities": similarities.astype(np.float32),
+    }
+
+
+def _ratings(queryset) -> np.ndarray:
+    return np.array(
+        list(queryset.values_list("user_id", "recipe_id", "rating").iterator()), dtype=np.int64
+    ).reshape(-1, 3)
+
+
+def _update_statistics(directory: Path, meta: Optional[dict]):
+    """
+    The previous model's statistics with the users whose ratings changed
+    since it was trained swapped out, or None when a full retrain is needed.
+    """
+    from recipes.models import RecipeRating
+
+    name = read_current(directory)
+    if (
+        meta is None
+        or name is None
+        or meta.get("max_items_per_user") != settings.RECOMMENDER_MAX_ITEMS_PER_USER
+    ):
+        return None
+    try:
+        state = {key: np.load(directory / name / f"{key}.npy") for key in STATE_ARRAYS}
+    except FileNotFoundError:
+        return None
+
+    changed_users = RecipeRating.objects.filter(updated_at__gt=meta["trained_at"]).values("user_id")
+    current = _ratings(RecipeRating.objects.filter(user_id__in=changed_users))
+    previous = state.pop("ratings")
+    stale = np.isin(previous[:, 0], np.unique(current[:, 0]))
+    rows = np.concatenate([previous[~stale], current])
+    # A user who only deleted ratings leaves no updated row behind
+    if len(rows) != RecipeRating.objects.count():
+        return None
+
+    cap = settings.RECOMMENDER_MAX_ITEMS_PER_USER
+    statistics = merge_statistics(state, rating_statistics(previous[stale], cap), sign=-1)
+    statistics = merge_statistics(statistics, rating_statistics(current, cap))
+    return rows, statistics, len(np.unique(current[:, 0]))
+
+
+def train_item_neighbors(directory: Optional[Path] = None, incremental: bool = False) -> dict:
+    """
+    Fit item neighbors on every RecipeRating and publish them to disk.
+
+    With ``incremental`` only the users who rated since the published model
+    are re-counted; deletions by anyone else fall back to a full retrain.
+    """
+    from recipes.models import RecipeRating
+
+    directory = directory or Path(settings.RECOMMENDER_MODEL_DIR)
+    trained_at = timezone.now()
+    start = time.perf_counter()
+
+    updated = _update_statistics(directory, read_model_meta(directory)) if incremental else None
+    if updated is not None:
+        rows, statistics, changed_users = updated
+    else:
+        rows = _ratings(RecipeRating.objects.all())
+        statistics = rating_statistics(rows, settings.RECOMMENDER_MAX_ITEMS_PER_USER)
+        changed_users = None
+
+    arrays = neighbors_from_statistics(
+        statistics, k=settings.RECOMMENDER_NEIGHBORS, shrinkage=settings.RECOMMENDER_SHRINKAGE
+    )
+    arrays.update(statistics, ratings=rows)
+    meta = {
+        "trained_at": trained_at.isoformat(),
+        "mode": "full" if changed_users is None else "incremental",
+        "changed_users": changed_users,
+        "max_items_per_user": settings.RECOMMENDER_MAX_ITEMS_PER_USER,
+        "ratings": len(rows),
+        "recipes": len(arrays["recipe_ids"]),
+        "neighbor_pairs": len(arrays["neighbors"]),
+        "train_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    publish_model(arrays, meta, directory)
+    return meta
+
+
+def publish_model(arrays: Dict[str, np.ndarray], meta: dict, directory: Path) -> None:
+    """
+    Write a new model generation and atomically point CURRENT at it.
+
+    Readers keep using the generation they have mapped; only the current and
+    previous generations are kept on disk.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    # The random suffix keeps two publishes in the same second apart
+    name = f"model-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:12]}"
+    staging = directory / f".{name}"
+    staging.mkdir()
+    for key in ARRAYS + STATE_ARRAYS:
+        if key in arrays:
+            np.save(staging / f"{key}.npy", arrays[key])
+    (staging / META_FILE).write_text(json.dumps(meta))
+    os.replace(staging, directory / name)
+
+    previous = read_current(directory)
+    pointer = directory / f".{CURRENT_FILE}"
+    pointer.write_text(name)
+    os.replace(pointer, directory / CURRENT_FILE)
+
+    for path in directory.glob("model-*"):
+        if path.name not in (name, previous):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_current(directory: Path) -> Optional[str]:
+    try:
+        return (directory / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_model_meta(directory: Optional[Path] = None) -> Optional[dict]:
+    directory = directory or Path(settings.RECOMMENDER_MODEL_DIR)
+    name = read_current(directory)
+    if name is None:
+        return None
+    return json.loads((directory / name / META_FILE).read_text())
+
+
+def ratings_changed_since(meta: Optional[dict]) -> int:
+    """Approximate number of rating writes since the model in ``meta`` was trained."""
+    from recipes.models import RecipeRating
+
+    if meta is None:
+        return RecipeRating.objects.count()
+    updated = RecipeRating.objects.filter(updated_at__gt=meta["trained_at"]).count()
+    # Deletions leave no row behind; the shrinking total stands in for them
+    return updated + max(meta["ratings"] - RecipeRating.objects.count(), 0)
+
+
+class ItemNeighborModel:
+    """
+    Memory-mapped view of the published neighbor arrays.
+
+    Each request stats the CURRENT pointer and remaps only when a new
+    generation was published, so every worker process shares the arrays
+    through the page cache instead of holding its own copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pointer_stat: Optional[Tuple[int, int]] = None
+        self._arrays: Optional[Dict[str, np.ndarray]] = None
+
+    def ensure_current(self) -> Optional[Dict[str, np.ndarray]]:
+        directory = Path(settings.RECOMMENDER_MODEL_DIR)
+        try:
+            stat = os.stat(directory / CURRENT_FILE)
+            pointer_stat = (stat.st_mtime_ns, stat.st_ino)
+        except FileNotFoundError:
+            pointer_stat = None
+
+        if pointer_stat == self._pointer_stat:
+            return self._arrays
+        with self._lock:
+            if pointer_stat != self._pointer_stat:
+                name = read_current(directory) if pointer_stat else None
+                self._arrays = (
+                    {
+                        key: np.load(directory / name / f"{key}.npy", mmap_mode="r")
+                        for key in ARRAYS
+                    }
+                    if name
+                    else None
+                )
+                self._pointer_stat = pointer_stat
+                logger.info("Loaded recommender model %s", name)
+            return self._arrays
+
+    def recommend(self, user_ratings: Dict[int, int], limit: int) -> List[Tuple[int, float]]:
+        """
+        Score the recipes neighboring a user's rated recipes.
+
+        The predicted rating of a candidate is the user's mean plus the
+        similarity-weighted mean of their deviations on its rated neighbors.
+        Returns ``(recipe_id, predicted_rating)`` pairs, best first.
+        """
+        arrays = self.ensure_current()
+        if arrays is None or not user_ratings:
+            return []
+        recipe_ids = arrays["recipe_ids"]
+
+        rated_ids = np.fromiter(user_ratings.keys(), dtype=np.int64, count=len(user_ratings))
+        values = np.fromiter(user_ratings.values(), dtype=np.float64, count=len(user_ratings))
+        mean = values.mean()
+
+        positions = np.searchsorted(recipe_ids, rated_ids)
+        known = positions < len(recipe_ids)
+        known[known] = recipe_ids[positions[known]] == rated_ids[known]
+        positions, deviations = positions[known], values[known] - mean
+        if not len(positions):
+            return []
+
+        starts = arrays["indptr"][positions]
+        lengths = arrays["indptr"][positions + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return []
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        slots = np.repeat(starts, lengths) + offsets
+
+        candidates, inverse = np.unique(arrays["neighbors"][slots], return_inverse=True)
+        similarities = arrays["similarities"][slots].astype(np.float64)
+        weight = np.bincount(inverse, weights=similarities)
+        scores = mean + np.bincount(
+            inverse, weights=similarities * np.repeat(deviations, lengths)
+        ) / weight
+
+        unrated = ~np.isin(candidates, positions)
+        candidates, scores, weight = candidates[unrated], scores[unrated], weight[unrated]
+        top = np.lexsort((-weight, -scores))[:limit]
+        return [
+            (int(recipe_ids[candidates[i]]), round(float(np.clip(scores[i], 1, 5)), 3))
+            for i in top
+        ]
+
+
+item_neighbors = ItemNeighborModel()
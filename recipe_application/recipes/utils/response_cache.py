@@ -0,0 +1,62 @@
+# response_cache.py
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from recipes.utils.versioning import CATALOG_VERSION_KEY, get_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "response_"
+
+
+def response_cache_key(view, request, version: str) -> str:
+    query = sorted(request.query_params.lists())
+    raw = f"{request.get_host()}{request.path}?{query}"
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"{KEY_PREFIX}{view.basename}_{view.action}_{version}_{digest}"
+
+
+class CachedReadMixin:
+    """
+    Serve ``list`` and ``retrieve`` from the cache until the catalog changes.
+
+    Entries are keyed on the catalog version, so any catalog write makes
+    every stored response unreachable without deleting anything. Each entry
+    carries an ETag (hash of the payload), so a client revalidating an
+    unchanged response gets a 304 from two cache reads. There is no
+    Last-Modified: rating writes change aggregates without touching
+    ``updated_at``, so a date could not tell a client its copy is stale.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = response_cache_key(self, request, get_version(CATALOG_VERSION_KEY))
+        entry = cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            payload = json.dumps(response.data, cls=JSONEncoder, sort_keys=True)
+            entry = {
+                "data": response.data,
+                "etag": f'"{hashlib.md5(payload.encode()).hexdigest()}"',
+            }
+            cache.set(key, entry, timeout=settings.RESPONSE_CACHE_TTL)
+
+        not_modified = get_conditional_response(request, etag=entry["etag"])
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(entry["data"])
+        response["ETag"] = entry["etag"]
+        return response
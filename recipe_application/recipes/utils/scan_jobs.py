@@ -0,0 +1,170 @@
+# scan_jobs.py
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from recipes.utils.ingredient_names import match_ingredient_names
+from recipes.utils.versioning import cache_is_shared
+from typing import Dict, List, Optional, Union
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ScanQueueFull(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _build_extractor(class_path: str):
+    return import_string(class_path)()
+
+
+def get_ingredient_extractor():
+    """
+    Process-wide instance of the extractor configured by
+    INGREDIENT_EXTRACTOR_CLASS, so the Gemini client is set up only once.
+    """
+    return _build_extractor(settings.INGREDIENT_EXTRACTOR_CLASS)
+
+
+def scan_ingredients(image_data: bytes) -> Dict[str, Union[list, int, str, None]]:
+    """Extract ingredients from an image and match them against the database."""
+    result = get_ingredient_extractor().extract_ingredients(image_data)
+    if result["status"] == "error":
+        return {"status": "error", "error": result["error"]}
+
+    matched_ingredients, unmatched_ingredients = match_ingredient_names(
+        result["ingredients"]
+    )
+    return {
+        "status": "success",
+        "matched_ingredients": matched_ingredients,
+        "unmatched_ingredients": unmatched_ingredients,
+        "total_detected": len(result["ingredients"]),
+    }
+
+
+def scan_ingredients_batch(images: List[bytes]) -> Dict[str, list]:
+    """
+    Extract ingredients from several images and match the merged set
+    against the database in one query, with a per-image breakdown.
+    """
+    results = get_ingredient_extractor().extract_many(
+        images, max_workers=settings.INGREDIENT_SCAN_BATCH_FAN_OUT
+    )
+
+    detected = []
+    for result in results:
+        if result["status"] == "success":
+            detected.extend(result["ingredients"])
+    detected = list(dict.fromkeys(detected))
+
+    matched_ingredients, unmatched_ingredients = match_ingredient_names(detected)
+    unmatched = set(unmatched_ingredients)
+
+    breakdown = []
+    for result in results:
+        image = {"status": result["status"]}
+        if "duplicate_of" in result:
+            image["duplicate_of"] = result["duplicate_of"]
+        if result["status"] == "success":
+            image["matched"] = [i for i in result["ingredients"] if i not in unmatched]
+            image["unmatched"] = [i for i in result["ingredients"] if i in unmatched]
+        else:
+            image["error"] = result["error"]
+        breakdown.append(image)
+
+    return {
+        "matched_ingredients": matched_ingredients,
+        "unmatched_ingredients": unmatched_ingredients,
+        "total_detected": len(detected),
+        "images": breakdown,
+    }
+
+
+class ScanJobQueue:
+    """
+    Runs image scans on a bounded thread pool.
+
+    At most ``INGREDIENT_SCAN_WORKERS`` scans run at once and at most
+    ``INGREDIENT_SCAN_MAX_PENDING`` more wait behind them; further submissions
+    are rejected instead of queueing without bound. Job state lives in the
+    default cache, so with a cache every worker shares (such as Redis) a
+    status poll can land on any worker. With a per-process cache only the
+    worker that ran the job can answer, which is logged as a warning when
+    the queue starts.
+    """
+
+    key_prefix = "ingredient_scan_job_"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[threading.BoundedSemaphore] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                workers = settings.INGREDIENT_SCAN_WORKERS
+                self._executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="ingredient-scan"
+                )
+                self._slots = threading.BoundedSemaphore(
+                    workers + settings.INGREDIENT_SCAN_MAX_PENDING
+                )
+                if not cache_is_shared():
+                    logger.warning(
+                        "Scan jobs are stored in a per-process cache; status "
+                        "requests served by other workers will not find them"
+                    )
+            return self._executor
+
+    def _store(self, job_id: str, state: dict) -> None:
+        cache.set(
+            f"{self.key_prefix}{job_id}",
+            {"job_id": job_id, **state},
+            timeout=settings.INGREDIENT_SCAN_JOB_TTL,
+        )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return cache.get(f"{self.key_prefix}{job_id}")
+
+    def submit(self, image_data: bytes) -> str:
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            raise ScanQueueFull("Too many scans in progress, try again shortly")
+
+        job_id = uuid.uuid4().hex
+        self._store(job_id, {"status": "pending"})
+        try:
+            executor.submit(self._run, job_id, image_data)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id: str, image_data: bytes) -> None:
+        try:
+            self._store(job_id, {"status": "running"})
+            result = scan_ingredients(image_data)
+            if result.pop("status") == "error":
+                self._store(job_id, {"status": "failed", "error": result["error"]})
+            else:
+                self._store(job_id, {"status": "completed", "result": result})
+        except Exception as e:
+            logger.exception("Error in scan job %s:", job_id)
+            self._store(job_id, {
+                "status": "failed",
+                "error": str(e) if settings.DEBUG else "An unexpected error occurred",
+            })
+        finally:
+            self._slots.release()
+            close_old_connections()
+
+
+scan_job_queue = ScanJobQueue()
@@ -0,0 +1,226 @@
+# scan_store.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from typing import Any, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _signed(image_hash: int) -> int:
+    # SQLite integers are signed 64-bit; dHashes use the full unsigned range
+    return image_hash - (1 << 64) if image_hash >= (1 << 63) else image_hash
+
+
+def _unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: int) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: int, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: int) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteResultStore:
+    """
+    On-disk scan results shared by every worker process on the host.
+
+    One SQLite file in WAL mode, so readers never block on the writer.
+    Expired rows are skipped on read. Every ``prune_interval`` writes the
+    store drops expired rows, then the oldest rows beyond ``max_entries``.
+    """
+
+    prune_interval = 100
+
+    def __init__(self, path, max_entries: int):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS scan_results ("
+                "hash INTEGER PRIMARY KEY, ingredients TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS scan_results_expires_at ON scan_results (expires_at)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, image_hash: int) -> Optional[Tuple[List[str], float]]:
+        row = self._connection().execute(
+            "SELECT ingredients, expires_at FROM scan_results WHERE hash = ? AND expires_at > ?",
+            (_signed(image_hash), time.time()),
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, image_hash: int, ingredients: List[str], expires_at: float) -> None:
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO scan_results (hash, ingredients, expires_at) VALUES (?, ?, ?)",
+            (_signed(image_hash), json.dumps(ingredients), expires_at),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            prune = self._writes % self.prune_interval == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> int:
+        connection = self._connection()
+        expired = connection.execute(
+            "DELETE FROM scan_results WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+        # Rows expiring soonest were written first, so this drops the oldest
+        overflow = connection.execute(
+            "DELETE FROM scan_results WHERE hash IN ("
+            "SELECT hash FROM scan_results ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if expired or overflow:
+            logger.info("Pruned scan store: %d expired, %d over capacity", expired, overflow)
+        return expired + overflow
+
+    def hashes_since(self, expires_after: float, limit: int) -> List[Tuple[int, float]]:
+        """
+        Live ``(hash, expires_at)`` rows expiring after ``expires_after``,
+        oldest first. Every row is written with the same TTL, so this is what
+        any process wrote since a row with that expiry; when there are more
+        than ``limit`` the newest are returned.
+        """
+        rows = self._connection().execute(
+            "SELECT hash, expires_at FROM scan_results WHERE expires_at > ? "
+            "ORDER BY expires_at DESC LIMIT ?",
+            (max(expires_after, time.time()), limit),
+        ).fetchall()
+        return [(_unsigned(value), expires_at) for value, expires_at in reversed(rows)]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM scan_results").fetchone()[0]
+
+
+class TwoTierResultStore:
+    """
+    Per-process LRU in front of the host-wide SQLite store.
+
+    L2 hits are promoted into L1 with their remaining lifetime, so an entry
+    never outlives the TTL it was written with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._l1: Optional[LRUCache] = None
+        self._l2: Optional[SQLiteResultStore] = None
+        self._l1_hits = 0
+        self._l2_hits = 0
+        self._misses = 0
+
+    @property
+    def l1(self) -> LRUCache:
+        if self._l1 is None:
+            with self._lock:
+                if self._l1 is None:
+                    self._l1 = LRUCache(settings.INGREDIENT_SCAN_CACHE_L1_SIZE)
+        return self._l1
+
+    @property
+    def l2(self) -> SQLiteResultStore:
+        if self._l2 is None:
+            with self._lock:
+                if self._l2 is None:
+                    self._l2 = SQLiteResultStore(
+                        settings.INGREDIENT_SCAN_CACHE_PATH,
+                        settings.INGREDIENT_SCAN_CACHE_MAX_ENTRIES,
+                    )
+        return self._l2
+
+    def get(self, image_hash: int) -> Optional[List[str]]:
+        ingredients = self.l1.get(image_hash)
+        if ingredients is not None:
+            with self._lock:
+                self._l1_hits += 1
+            return ingredients
+
+        try:
+            stored = self.l2.get(image_hash)
+        except sqlite3.Error:
+            logger.exception("Scan store read failed")
+            stored = None
+        if stored is None:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        ingredients, expires_at = stored
+        self.l1.set(image_hash, ingredients, expires_at)
+        with self._lock:
+            self._l2_hits += 1
+        return ingredients
+
+    def set(self, image_hash: int, ingredients: List[str]) -> None:
+        expires_at = time.time() + settings.INGREDIENT_SCAN_CACHE_TTL
+        self.l1.set(image_hash, ingredients, expires_at)
+        try:
+            self.l2.set(image_hash, ingredients, expires_at)
+        except sqlite3.Error:
+            logger.exception("Scan store write failed")
+
+    def stats(self) -> dict:
+        # Outside the lock: the lazy l1 property takes it to build the LRU
+        l1_entries = len(self.l1)
+        with self._lock:
+            lookups = self._l1_hits + self._l2_hits + self._misses
+            stats = {
+                "l1_hits": self._l1_hits,
+                "l2_hits": self._l2_hits,
+                "misses": self._misses,
+                "hit_rate": (self._l1_hits + self._l2_hits) / lookups if lookups else None,
+                "l1_entries": l1_entries,
+            }
+        try:
+            stats["l2_entries"] = self.l2.count()
+        except sqlite3.Error:
+            stats["l2_entries"] = None
+        return stats
@@ -0,0 +1,169 @@
+# search.py
+import re
+from functools import lru_cache
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+from typing import Iterable, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize_query(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+
+class BaseSearchBackend:
+    """Interface for recipe full-text search backends."""
+
+    def filter_queryset(self, queryset, query: str):
+        raise NotImplementedError
+
+    def ensure_index(self) -> None:
+        pass
+
+    def index_recipes(self, recipe_ids: Iterable[int]) -> None:
+        pass
+
+    def remove_recipes(self, recipe_ids: Iterable[int]) -> None:
+        pass
+
+    def rebuild(self) -> None:
+        pass
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Portable fallback that ANDs icontains lookups per search term."""
+
+    search_fields = ["title", "description", "instructions", "ingredients__name"]
+
+    def filter_queryset(self, queryset, query: str):
+        for term in tokenize_query(query):
+            term_filter = Q()
+            for field in self.search_fields:
+                term_filter |= Q(**{f"{field}__icontains": term})
+            queryset = queryset.filter(term_filter)
+        return queryset.distinct()
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    SQLite FTS5 index over recipe title, description, instructions and
+    ingredient names, ranked with BM25.
+    """
+
+    table = "recipes_recipe_fts"
+    # BM25 column weights: title, description, instructions, ingredients
+    weights = (10.0, 4.0, 1.0, 6.0)
+
+    def _match_expression(self, query: str) -> str:
+        # Quote every term so user input can never be parsed as FTS syntax
+        return " ".join(f'"{term}"*' for term in tokenize_query(query))
+
+    def filter_queryset(self, queryset, query: str):
+        match = self._match_expression(query)
+        if not match:
+            return queryset
+        weights = ", ".join(str(weight) for weight in self.weights)
+        recipe_table = connection.ops.quote_name(queryset.model._meta.db_table)
+        matching_ids = RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        # bm25() is only defined inside a MATCH query, so each row's rank is
+        # a correlated lookup of that row in the FTS table
+        rank = RawSQL(
+            f"SELECT bm25({self.table}, {weights}) FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND {self.table}.rowid = {recipe_table}.id",
+            [match],
+            output_field=FloatField(),
+        )
+        return (
+            queryset.filter(pk__in=matching_ids)
+            .annotate(search_rank=rank)
+            .order_by("search_rank", "id")
+        )
+
+    def ensure_index(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [self.table],
+            )
+            if cursor.fetchone():
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                "title, description, instructions, ingredients, "
+                "tokenize = 'porter unicode61')"
+            )
+        self.rebuild()
+
+    def index_recipes(self, recipe_ids: Iterable[int]) -> None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", recipe_ids
+            )
+            cursor.execute(
+                f"INSERT INTO {self.table} "
+                "(rowid, title, description, instructions, ingredients) "
+                "SELECT r.id, r.title, r.description, r.instructions, "
+                "COALESCE((SELECT group_concat(i.name, ' ') "
+                "FROM recipes_recipeingredient ri "
+                "JOIN recipes_ingredient i ON i.id = ri.ingredient_id "
+                "WHERE ri.recipe_id = r.id), '') "
+                f"FROM recipes_recipe r WHERE r.id IN ({placeholders})",
+                recipe_ids,
+            )
+
+    def remove_recipes(self, recipe_ids: Iterable[int]) -> None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", recipe_ids
+            )
+
+    def rebuild(self) -> None:
+        from recipes.models import Recipe
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(recipe_ids), 500):
+            self.index_recipes(recipe_ids[start:start + 500])
+        logger.info("Rebuilt recipe search index: %d recipes", len(recipe_ids))
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> BaseSearchBackend:
+    return import_string(settings.RECIPE_SEARCH_BACKEND)()
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """
+    Filter and rank recipes with the configured backend using ``?q=``.
+
+    ``?search=``, the parameter of the SearchFilter this replaced, is still
+    accepted when ``q`` is not given.
+    """
+
+    search_param = "q"
+    legacy_search_param = "search"
+
+    def filter_queryset(self, request, queryset, view):
+        query = (
+            request.query_params.get(self.search_param)
+            or request.query_params.get(self.legacy_search_param, "")
+        ).strip()
+        if not query:
+            return queryset
+        return get_search_backend().filter_queryset(queryset, query)
@@ -0,0 +1,109 @@
+# suggestions.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from recipes.utils.versioning import CATALOG_VERSION_KEY, get_version
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEED_KEY_PREFIX = "suggestion_feed_"
+
+
+def _feed_key(user_id: int) -> str:
+    return f"{FEED_KEY_PREFIX}{user_id}"
+
+
+def compute_suggestion_feed(user) -> dict:
+    """Build a user's suggestions payload from their preferences and ratings."""
+    from recipes.models import Recipe, RecipeRating, UserPreference
+    from recipes.serializers import RecipeSerializer
+
+    # Get user's dietary preferences
+    user_prefs = UserPreference.objects.filter(user=user).first()
+
+    # Base queryset
+    queryset = RecipeSerializer.setup_eager_loading(Recipe.objects.all())
+    # Apply dietary preferences if they exist
+    if user_prefs:
+        if user_prefs.vegetarian:
+            queryset = queryset.filter(is_vegetarian=True)
+        if user_prefs.gluten_free:
+            queryset = queryset.filter(is_gluten_free=True)
+    # Get user's highly rated recipes (3+ stars)
+    liked_recipes = RecipeRating.objects.filter(
+        user=user,
+        rating__gte=3
+    ).values_list('recipe__cuisine', flat=True)
+
+    # Get most common cuisines from liked recipes
+    preferred_cuisines = list(set(liked_recipes))
+
+    if user_prefs and user_prefs.preferred_cuisines:
+        preferred_cuisines.extend(user_prefs.preferred_cuisines)
+
+    preferred_cuisines = list(set(preferred_cuisines))
+
+    if preferred_cuisines:
+        filters = Q()
+        for cuisine in preferred_cuisines:
+            filters |= Q(cuisine__iexact=cuisine)  # Case-insensitive match
+        queryset = queryset.filter(filters)
+
+    # Build final suggestions
+    suggestions = list(
+        queryset.exclude(ratings__user=user).order_by('-average_rating', '-rating_count')[:15]
+    )
+
+    # If no suggestions, try an even more relaxed query
+    if not suggestions:
+        suggestions = list(
+            queryset.filter(
+                Q(cuisine__in=preferred_cuisines) |
+                Q(average_rating__gte=3.0)
+            ).exclude(
+                ratings__user=user
+            ).order_by('-average_rating', '-rating_count')[:10]
+        )
+
+    logger.info("Computed suggestion feed for user %s: %d recipes", user.pk, len(suggestions))
+
+    return {
+        "results": RecipeSerializer(suggestions, many=True).data,
+        "preference_info": {
+            "preferred_cuisines": preferred_cuisines,
+            "dietary_preferences": {
+                "vegetarian": user_prefs.vegetarian,
+                "gluten_free": user_prefs.gluten_free,
+            } if user_prefs else None
+        }
+    }
+
+
+def get_suggestion_feed(user) -> dict:
+    """
+    Return the user's materialized feed, recomputing it only when it was
+    invalidated by their own ratings/preferences or by a catalog change.
+    """
+    catalog_version = get_version(CATALOG_VERSION_KEY)
+    cached = cache.get(_feed_key(user.pk))
+    if cached and cached["catalog_version"] == catalog_version:
+        return cached["feed"]
+    return store_suggestion_feed(user, catalog_version)
+
+
+def store_suggestion_feed(user, catalog_version: Optional[str] = None) -> dict:
+    if catalog_version is None:
+        catalog_version = get_version(CATALOG_VERSION_KEY)
+    feed = compute_suggestion_feed(user)
+    cache.set(
+        _feed_key(user.pk),
+        {"catalog_version": catalog_version, "feed": feed},
+        timeout=settings.SUGGESTION_FEED_TTL,
+    )
+    return feed
+
+
+def invalidate_suggestion_feed(user_id: int) -> None:
+    cache.delete(_feed_key(user_id))
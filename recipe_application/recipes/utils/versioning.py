@@ -0,0 +1,103 @@
+# versioning.py
+import os
+import threading
+import uuid
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from typing import Dict, Tuple
+
+# Bumped on writes that change what recipe reads return
+CATALOG_VERSION_KEY = "catalog_version"
+
+# Backends whose entries live in one process only
+PER_PROCESS_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def cache_is_shared() -> bool:
+    """Whether the default cache is seen by every worker process."""
+    return settings.CACHES["default"]["BACKEND"] not in PER_PROCESS_CACHE_BACKENDS
+
+
+def _new_version() -> str:
+    return uuid.uuid4().hex
+
+
+class FileVersionStore:
+    """
+    Version tokens kept as files under ``VERSION_DIR``.
+
+    Used when the cache is per-process, so a bump in one worker still
+    reaches every other worker on the host. Each read stats the token's
+    file and rereads it only when it was replaced, which costs far less
+    than the cache lookups the version guards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[Path, Tuple[Tuple[int, int], str]] = {}
+
+    def _write(self, path: Path, version: str, replace: bool) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        staging.write_text(version)
+        try:
+            if replace:
+                os.replace(staging, path)
+            else:
+                # Like cache.add: the first writer wins
+                os.link(staging, path)
+        except FileExistsError:
+            pass
+        finally:
+            staging.unlink(missing_ok=True)
+
+    def get(self, key: str) -> str:
+        path = Path(settings.VERSION_DIR) / key
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._write(path, _new_version(), replace=False)
+            stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_ino)
+        seen = self._tokens.get(path)
+        if seen is not None and seen[0] == signature:
+            return seen[1]
+        version = path.read_text()
+        with self._lock:
+            self._tokens[path] = (signature, version)
+        return version
+
+    def bump(self, key: str) -> None:
+        self._write(Path(settings.VERSION_DIR) / key, _new_version(), replace=True)
+
+
+file_versions = FileVersionStore()
+
+
+def get_version(key: str) -> str:
+    """
+    Current version token for ``key``.
+
+    Versions are random tokens rather than counters, so a version evicted
+    from the cache comes back as a value no stored entry was keyed on,
+    instead of restarting at a number old entries still carry.
+    """
+    if settings.VERSION_DIR:
+        return file_versions.get(key)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key: str) -> None:
+    """Mark everything derived from ``key`` as stale in every process sharing the cache."""
+    if settings.VERSION_DIR:
+        file_versions.bump(key)
+    else:
+        cache.set(key, _new_version(), timeout=None)
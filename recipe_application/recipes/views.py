@@ -1,6 +1,8 @@
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from django.http import HttpResponse
+from django.urls import reverse
 from django.db.models import Avg, Q, Count
 from django_filters.rest_framework import DjangoFilterBackend
 from recipes.models import *
@@ -9,11 +11,33 @@ from django.contrib.auth import authenticate
 from django.core.files.uploadedfile import InMemoryUploadedFile
 # ENABLE WHEN USING REDIS
 # from django_ratelimit.decorators import ratelimit
-from recipes.utils.image_processing import IngredientExtractor
+from recipes.utils.bulk_writes import (
+    bulk_response,
+    upsert_ingredients,
+    upsert_ratings,
+    validate_items,
+)
+from recipes.utils.scan_jobs import (
+    ScanQueueFull,
+    scan_ingredients,
+    scan_ingredients_batch,
+    scan_job_queue,
+)
+from recipes.utils.image_hashing import scan_cache
+from recipes.utils.ingredient_fuzzy import ingredient_fuzzy_index
+from recipes.utils.ingredient_index import ingredient_index
+from recipes.utils.metrics import has_metrics_token, metrics_response
+from recipes.utils.jwt_auth import CachedJWTAuthentication
+from recipes.utils.pagination import RecipeCursorPagination, encode_cursor
+from recipes.utils.profiling import ProfiledViewMixin, folded_stacks, profile_store
+from recipes.utils.recommendations import item_neighbors
+from recipes.utils.response_cache import CachedReadMixin
+from recipes.utils.search import RecipeSearchFilter
+from recipes.utils.suggestions import get_suggestion_feed
 from recipe_application import settings
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.utils.decorators import method_decorator
 import logging
 
@@ -62,12 +86,37 @@ class AuthViewSet(viewsets.GenericViewSet):
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ProfiledViewMixin, CachedReadMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    # API-only: bearer tokens, without the session and basic fallbacks
+    authentication_classes = [CachedJWTAuthentication]
     filter_backends = [filters.SearchFilter]
     search_fields = ["name"]
 
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
+        """Create ingredients in one request, updating those whose name already exists"""
+        if not isinstance(request.data, list) or not request.data:
+            return Response(
+                {"error": "Expected a non-empty list"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(request.data) > settings.BULK_WRITE_MAX_ITEMS:
+            return Response(
+                {"error": f"At most {settings.BULK_WRITE_MAX_ITEMS} items per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            valid, errors = validate_items(IngredientBulkSerializer(data=request.data, many=True))
+            results = upsert_ingredients(valid) if valid else {}
+            return bulk_response(results, errors)
+        except Exception as e:
+            logger.exception("Error in ingredient bulk write:")
+            return Response(
+                {"error": str(e) if settings.DEBUG else "An unexpected error occurred"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
     @action(detail=False, methods=["POST"])
     # ENABLE WHEN USING REDIS
     # @method_decorator(
@@ -83,51 +132,121 @@ class IngredientViewSet(viewsets.ModelViewSet):
             image_file = request.FILES["image"]
             image_data = image_file.read()
 
-            # Extract ingredients using the updated extractor
-            extractor = IngredientExtractor()
-            result = extractor.extract_ingredients(image_data)
+            # Job mode: hand the image to the scan pool and return immediately
+            if request.query_params.get("mode") == "job":
+                try:
+                    job_id = scan_job_queue.submit(image_data)
+                except ScanQueueFull as e:
+                    return Response(
+                        {"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+                    )
+                return Response(
+                    {
+                        "job_id": job_id,
+                        "status": "pending",
+                        "status_url": request.build_absolute_uri(
+                            reverse("ingredient-scan-job", kwargs={"job_id": job_id})
+                        ),
+                    },
+                    status=status.HTTP_202_ACCEPTED,
+                )
+
+            # Extract ingredients and match them with database
+            result = scan_ingredients(image_data)
 
-            if result["status"] == "error":
+            if result.pop("status") == "error":
                 return Response(
                     {"error": result["error"]},
                     status=status.HTTP_422_UNPROCESSABLE_ENTITY,
                 )
 
-            # Match ingredients with database
-            matched_ingredients = Ingredient.objects.filter(
-                name__in=result["ingredients"]
-            ).values("id", "name")
-
-            # Find unmatched ingredients
-            matched_names = {ing["name"] for ing in matched_ingredients}
-            unmatched_ingredients = [
-                ing for ing in result["ingredients"] if ing not in matched_names
-            ]
+            return Response(result)
 
+        except Exception as e:
+            logger.exception("Error in scan_image endpoint:")
             return Response(
-                {
-                    "matched_ingredients": list(matched_ingredients),
-                    "unmatched_ingredients": unmatched_ingredients,
-                    "total_detected": len(result["ingredients"]),
-                }
+                {"error": str(e) if settings.DEBUG else "An unexpected error occurred"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(detail=False, methods=["POST"])
+    def scan_images(self, request, *args, **kwargs):
+        """Scan several photos (fridge, pantry, counter) in one request"""
+        try:
+            image_files = request.FILES.getlist("images")
+            if not image_files:
+                return Response(
+                    {"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            if len(image_files) > settings.INGREDIENT_SCAN_BATCH_MAX_IMAGES:
+                return Response(
+                    {"error": f"At most {settings.INGREDIENT_SCAN_BATCH_MAX_IMAGES} images per request"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            result = scan_ingredients_batch([image_file.read() for image_file in image_files])
+            for image_file, image in zip(image_files, result["images"]):
+                image["name"] = image_file.name
+
+            if not any(image["status"] == "success" for image in result["images"]):
+                return Response(
+                    {"error": "No ingredients could be extracted", "images": result["images"]},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+
+            return Response(result)
+
         except Exception as e:
-            logger.exception("Error in scan_image endpoint:")
+            logger.exception("Error in scan_images endpoint:")
             return Response(
                 {"error": str(e) if settings.DEBUG else "An unexpected error occurred"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(detail=False, methods=["GET"])
+    def resolve(self, request):
+        """Best fuzzy ingredient matches for each ?name= term"""
+        names = request.query_params.getlist("name")
+        if not names:
+            return Response(
+                {"error": "No names provided"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 3)), 20))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {name: ingredient_fuzzy_index.lookup(name, limit=limit) for name in names}
+        )
+
+    @action(detail=False, methods=["GET"], permission_classes=[IsAdminUser])
+    def scan_cache_stats(self, request):
+        """Hit/miss counters of the perceptual scan cache, for tuning its distance"""
+        return Response(scan_cache.stats())
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.annotate(
-        average_rating=Avg("ratings__rating"), rating_count=Count("ratings")
+    @action(
+        detail=False,
+        methods=["GET"],
+        url_path=r"scan_jobs/(?P<job_id>[0-9a-f]{32})",
+        url_name="scan-job",
     )
+    def scan_job(self, request, job_id=None):
+        job = scan_job_queue.get(job_id)
+        if job is None:
+            return Response(
+                {"error": "Scan job not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(job)
+
+
+class RecipeViewSet(ProfiledViewMixin, CachedReadMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
+    authentication_classes = [CachedJWTAuthentication]
+    pagination_class = RecipeCursorPagination
     filter_backends = [
         DjangoFilterBackend,
-        filters.SearchFilter,
+        RecipeSearchFilter,
         filters.OrderingFilter,
     ]
     filterset_fields = {
@@ -139,106 +258,106 @@ class RecipeViewSet(viewsets.ModelViewSet):
         "total_time": ["lte", "gte"],
         "calories_per_serving": ["lte", "gte"],
     }
-    search_fields = ["title", "description", "ingredients__name"]
     ordering_fields = ["average_rating", "cooking_time", "calories_per_serving"]
+    # POST actions that only read, so they can be served from a replica
+    replica_read_actions = {"match_ingredients"}
+
+    # Fields match_ingredients can return; clients narrow them with "fields"
+    match_result_fields = [
+        "id", "title", "description", "instructions", "cooking_time",
+        "preparation_time", "total_time", "difficulty", "servings",
+        "serving_size", "calories_per_serving", "protein_per_serving",
+        "is_vegetarian", "is_gluten_free", "image_url", "cuisine",
+        "dietary_restrictions", "nutrients", "is_featured",
+        "match_percentage", "matching_ingredients", "missing_ingredients",
+        "total_ingredients", "matched_count",
+    ]
+    match_stat_fields = {
+        "match_percentage", "matching_ingredients", "missing_ingredients",
+        "total_ingredients", "matched_count",
+    }
 
-    def normalize_ingredient_name(self,name):
-        # Convert to lowercase
-        name = name.lower()
-        
-        # Remove plurals (basic handling)
-        if name.endswith('es'):
-            name = name[:-2]
-        elif name.endswith('s'):
-            name = name[:-1]
-            
-        # Remove common variations/suffixes
-        name = name.replace(' pieces', '')
-        name = name.replace(' piece', '')
-        
-        return name.strip()
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return self.get_serializer_class().setup_eager_loading(queryset)
 
     @action(detail=False, methods=["POST"])
     def match_ingredients(self, request):
-        ingredients = request.data.get("ingredients", [])
-        dietary_prefs = request.data.get("dietary_preferences", {})
-        filters = request.data.get("filters", {})
-
-        # Debug logging
-        logger.info(f"Received ingredients: {ingredients}")
-        logger.info(f"Received dietary preferences: {dietary_prefs}")
-        logger.info(f"Received filters: {filters}")
-
-        # Base queryset with dietary preferences if specified
-        queryset = self.get_queryset()
-        if dietary_prefs.get("vegetarian"):
-            queryset = queryset.filter(is_vegetarian=True)
-        if dietary_prefs.get("gluten_free"):
-            queryset = queryset.filter(is_gluten_free=True)
-
-        logger.info(f"Queryset: {queryset}")
-        # Apply difficulty filter if specified
-        if filters.get("difficulty"):
-            queryset = queryset.filter(difficulty__iexact=filters["difficulty"])
-
-        logger.info(f"Filtered Queryset: {queryset}")
-        # Apply cooking time filters if specified
-        if filters.get("cooking_time"):
-            if filters["cooking_time"].get("min") is not None:
-                queryset = queryset.filter(cooking_time__gte=filters["cooking_time"]["min"])
-            if filters["cooking_time"].get("max") is not None:
-                queryset = queryset.filter(cooking_time__lte=filters["cooking_time"]["max"])
-
-        # Match recipes based on ingredients
+        serializer = MatchIngredientsSerializer(
+            data=request.data, context={"result_fields": self.match_result_fields}
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        ingredients = data["ingredients"]
+        dietary_prefs = data["dietary_preferences"]
+        filters = data["filters"] or {}
+        fields = data.get("fields") or self.match_result_fields
+        limit = data.get("limit")
+        min_match = data.get("min_match_percentage", settings.RECIPE_MATCH_MIN_PERCENTAGE)
+        offset = data.get("cursor") or 0
+        cooking_time = filters.get("cooking_time") or {}
+        min_cooking_time = cooking_time.get("min")
+        max_cooking_time = cooking_time.get("max")
+
+        logger.debug(
+            "match_ingredients: %d ingredients, dietary preferences %s, filters %s",
+            len(ingredients), dietary_prefs, filters,
+        )
+
+        if limit is not None:
+            limit = min(limit, settings.RECIPE_MATCH_MAX_LIMIT)
+
+        # One snapshot for the whole request, so the mask and the scores
+        # cover the same recipes even if the index is rebuilt meanwhile
+        index = ingredient_index.snapshot()
+
+        # Dietary preferences and filters are applied to the index's columns
+        mask = index.filter_mask(
+            vegetarian=bool(dietary_prefs.get("vegetarian")),
+            gluten_free=bool(dietary_prefs.get("gluten_free")),
+            difficulty=filters.get("difficulty"),
+            min_cooking_time=min_cooking_time,
+            max_cooking_time=max_cooking_time,
+        )
+
+        # Score every indexed recipe and keep only the requested top-k window
+        total, matches = index.match(
+            ingredients,
+            threshold=min_match / 100,
+            mask=mask,
+            offset=offset,
+            limit=limit,
+        )
+
+        # Hydrate just the projected columns of this page in a single query
+        model_fields = [f for f in fields if f not in self.match_stat_fields]
+        recipes_by_id = Recipe.objects.only("id", *model_fields).in_bulk(
+            [recipe_id for recipe_id, *_ in matches]
+        )
+
         recipes = []
-        for recipe in queryset:
-            # Get ingredients through RecipeIngredient model
-            recipe_ingredients = RecipeIngredient.objects.filter(recipe=recipe).select_related('ingredient')
-            recipe_ingredient_names = {self.normalize_ingredient_name(ri.ingredient.name) for ri in recipe_ingredients}
-            available_ingredients = {self.normalize_ingredient_name(i) for i in ingredients}
-            
-            if not recipe_ingredient_names:
-                logger.warning(f"Recipe {recipe.id} has no ingredients")
+        for recipe_id, match_fraction, matching_ingredients, recipe_ingredient_names in matches:
+            recipe = recipes_by_id.get(recipe_id)
+            if recipe is None:
                 continue
 
-            # Calculate match percentage
-            matching_ingredients = recipe_ingredient_names.intersection(available_ingredients)
-            match_percentage = len(matching_ingredients) / len(recipe_ingredient_names)
-            
-            if match_percentage > 0.3:  # At least 30% ingredients match
-                recipe_dict = {
-                    "id": recipe.pk,
-                    "title": recipe.title,
-                    "description": recipe.description,
-                    "instructions": recipe.instructions,
-                    "cooking_time": recipe.cooking_time,
-                    "preparation_time": recipe.preparation_time,
-                    "total_time": recipe.total_time,
-                    "difficulty": recipe.difficulty,
-                    "servings": recipe.servings,
-                    "serving_size": recipe.serving_size,
-                    "calories_per_serving": recipe.calories_per_serving,
-                    "protein_per_serving": recipe.protein_per_serving,
-                    "is_vegetarian": recipe.is_vegetarian,
-                    "is_gluten_free": recipe.is_gluten_free,
-                    "image_url": recipe.image_url,
-                    "cuisine": recipe.cuisine,
-                    "dietary_restrictions": recipe.dietary_restrictions,
-                    "nutrients": recipe.nutrients,
-                    "is_featured": recipe.is_featured,
-                    "match_percentage": round(match_percentage * 100, 1),
-                    "matching_ingredients": list(matching_ingredients),
-                    "missing_ingredients": list(recipe_ingredient_names - available_ingredients),
-                    "total_ingredients": len(recipe_ingredient_names),
-                    "matched_count": len(matching_ingredients)
-                }
-                recipes.append(recipe_dict)
-
-        # Sort by match percentage
-        recipes.sort(key=lambda x: x["match_percentage"], reverse=True)
+            match_stats = {
+                "match_percentage": round(match_fraction * 100, 1),
+                "matching_ingredients": list(matching_ingredients),
+                "missing_ingredients": list(recipe_ingredient_names - matching_ingredients),
+                "total_ingredients": len(recipe_ingredient_names),
+                "matched_count": len(matching_ingredients)
+            }
+            recipes.append({
+                field: match_stats[field] if field in match_stats else getattr(recipe, field)
+                for field in fields
+            })
 
+        next_offset = total if limit is None else offset + limit
         return Response({
-            "count": len(recipes),
+            "count": total,
+            "next_cursor": encode_cursor({"o": next_offset}) if next_offset < total else None,
             "results": recipes,
             "request_info": {
                 "ingredients_provided": len(ingredients),
@@ -252,76 +371,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def suggestions(self, request):
         """Get personalized recipe suggestions based on user preferences and ratings"""
         try:
-            # Get user's dietary preferences
-            user_prefs = UserPreference.objects.filter(user=request.user).first()
-            
-            # Base queryset
-            queryset = self.get_queryset()
-            # Apply dietary preferences if they exist
-            if user_prefs:
-                if user_prefs.vegetarian:
-                    queryset = queryset.filter(is_vegetarian=True)
-                if user_prefs.gluten_free:
-                    queryset = queryset.filter(is_gluten_free=True)
-            # Get user's highly rated recipes (4+ stars)
-            liked_recipes = RecipeRating.objects.filter(
-                user=request.user,
-                rating__gte=3
-            ).values_list('recipe__cuisine', flat=True)
-            
-
-            # Get most common cuisines from liked recipes
-            preferred_cuisines = list(set(liked_recipes))
-
-            if user_prefs and user_prefs.preferred_cuisines:
-                logger.info(f"Preferred cuisines: {user_prefs.preferred_cuisines}")
-                preferred_cuisines.extend(user_prefs.preferred_cuisines)
-            
-            preferred_cuisines = list(set(preferred_cuisines))
-
-            if preferred_cuisines:
-                filters = Q()
-                for cuisine in preferred_cuisines:
-                    filters |= Q(cuisine__iexact=cuisine)  # Case-insensitive match
-                queryset = queryset.filter(filters)
-
-
-            # Build final suggestions
-            suggestions = queryset.exclude(
-                ratings__user=request.user
-            ).annotate(
-                rating_count_annotation=Count('ratings')
-            ).order_by(
-                '-average_rating',
-                '-rating_count_annotation'
-            )[:15]
-
-
-            logger.info(f"Final Preferred Cuisines: {preferred_cuisines}")
-            logger.info(f"Final suggestions count: {suggestions.count()}")
-
-            # If no suggestions, try an even more relaxed query
-            if suggestions.count() == 0:
-                suggestions = queryset.filter(
-                    Q(cuisine__in=preferred_cuisines) |
-                    Q(average_rating__gte=3.0)
-                ).exclude(
-                    ratings__user=request.user
-                ).order_by('?')[:10]
-            
-            logger.info(f"Final suggestions count updated: {suggestions.count()}")
-            serializer = self.get_serializer(suggestions, many=True)
-            
-            return Response({
-                "results": serializer.data,
-                "preference_info": {
-                    "preferred_cuisines": preferred_cuisines,
-                    "dietary_preferences": {
-                        "vegetarian": user_prefs.vegetarian if user_prefs else False,
-                        "gluten_free": user_prefs.gluten_free if user_prefs else False
-                    } if user_prefs else None
-                }
-            })
+            return Response(get_suggestion_feed(request.user))
         except Exception as e:
             logger.exception("Error in recipe suggestions:")
             return Response(
@@ -329,9 +379,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    @action(detail=False, methods=["GET"], permission_classes=[IsAuthenticated])
+    def recommendations(self, request):
+        """Recipes predicted from the user's ratings by the item-item neighbor model"""
+        try:
+            limit = int(request.query_params.get("limit", settings.RECOMMENDER_DEFAULT_LIMIT))
+        except (TypeError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(limit, settings.RECOMMENDER_MAX_LIMIT)
+
+        try:
+            user_ratings = dict(
+                RecipeRating.objects.filter(user=request.user).values_list("recipe_id", "rating")
+            )
+            scored = item_neighbors.recommend(user_ratings, limit)
+            if not scored:
+                # Cold start: no ratings yet, or none the model has seen
+                feed = get_suggestion_feed(request.user)
+                return Response({"results": feed["results"][:limit], "source": "suggestions"})
+
+            recipes = self.get_queryset().in_bulk([recipe_id for recipe_id, _ in scored])
+            results = []
+            for recipe_id, score in scored:
+                if recipe_id in recipes:
+                    data = self.get_serializer(recipes[recipe_id]).data
+                    data["predicted_rating"] = score
+                    results.append(data)
+            return Response({"results": results, "source": "item_neighbors"})
+        except Exception as e:
+            logger.exception("Error in recipe recommendations:")
+            return Response(
+                {"error": str(e) if settings.DEBUG else "An unexpected error occurred"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 
 class UserPreferenceViewSet(viewsets.ModelViewSet):
     serializer_class = UserPreferenceSerializer
+    authentication_classes = [CachedJWTAuthentication]
     
     def get_queryset(self):
         return UserPreference.objects.filter(user=self.request.user)
@@ -354,7 +441,7 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_200_OK)
             
         except Exception as e:
-            logger.error(f"Error updating preferences: {str(e)}")
+            logger.error("Error updating preferences: %s", e)
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
@@ -374,7 +461,7 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
                 'preferred_cuisines': []
             })
         except Exception as e:
-            logger.error(f"Error fetching user preferences: {str(e)}")
+            logger.error("Error fetching user preferences: %s", e)
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
@@ -384,6 +471,7 @@ class UserPreferenceViewSet(viewsets.ModelViewSet):
 class RecipeRatingViewSet(viewsets.ModelViewSet):
     queryset = RecipeRating.objects.all()
     serializer_class = RecipeRatingSerializer
+    authentication_classes = [CachedJWTAuthentication]
 
     def perform_create(self, serializer):
         # Automatically associate the current user with the rating
@@ -393,5 +481,69 @@ class RecipeRatingViewSet(viewsets.ModelViewSet):
         # Optionally, restrict to user's own ratings
         return RecipeRating.objects.filter(user=self.request.user)
 
+    @action(detail=False, methods=["POST"])
+    def bulk(self, request):
+        """Create or update several of the user's ratings in one request"""
+        if not isinstance(request.data, list) or not request.data:
+            return Response(
+                {"error": "Expected a non-empty list"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(request.data) > settings.BULK_WRITE_MAX_ITEMS:
+            return Response(
+                {"error": f"At most {settings.BULK_WRITE_MAX_ITEMS} items per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            valid, errors = validate_items(self.get_serializer(data=request.data, many=True))
+            results = upsert_ratings(request.user, valid) if valid else {}
+            return bulk_response(results, errors)
+        except Exception as e:
+            logger.exception("Error in rating bulk write:")
+            return Response(
+                {"error": str(e) if settings.DEBUG else "An unexpected error occurred"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
 
 
+class ProfileViewSet(viewsets.ViewSet):
+    """Request profiles recorded by ProfiledViewMixin, for staff"""
+    permission_classes = [IsAdminUser]
+    lookup_value_regex = r"[A-Za-z0-9_-]{8,64}"
+
+    def list(self, request):
+        return Response(profile_store.recent())
+
+    def retrieve(self, request, pk=None):
+        profile = profile_store.get(pk)
+        if profile is None:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        response = Response(profile)
+        response["Content-Disposition"] = f'attachment; filename="profile-{pk}.json"'
+        return response
+
+    @action(detail=True, methods=["GET"])
+    def folded(self, request, pk=None):
+        """Stacks in folded format, for flame graph tools"""
+        profile = profile_store.get(pk)
+        if profile is None:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        response = HttpResponse(folded_stacks(profile), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="profile-{pk}.folded"'
+        return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def staff_metrics_view(request):
+    return metrics_response()
+
+
+def metrics_view(request):
+    """
+    Request metrics for Prometheus: scrapers send the METRICS_TOKEN as a
+    Bearer token, anyone else must be staff
+    """
+    # Checked before DRF authentication, which would reject the token as a JWT
+    if has_metrics_token(request):
+        return metrics_response()
+    return staff_metrics_view(request)